@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apimovil.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# /progress/stream/ (SSE) se atiende fuera de Django: ver app/progress_stream.py
+from app.progress_stream import route  # noqa: E402
+
+application = route(django_application)
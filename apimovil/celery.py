@@ -3,7 +3,10 @@ Configuración de Celery para apimovil.
 
 SISTEMA DE COLAS POR USUARIO:
 - Cada usuario tiene su propia cola: user_queue_<user_id>
-- Los workers procesan todas las colas en round-robin
+- Las colas se crean bajo demanda (app/queue_registry.py): los workers empiezan
+  a consumirla con add_consumer cuando el usuario activa un archivo y la
+  cancelan (cancel_consumer) cuando ya no tiene archivos activos ni mensajes
+- Los workers procesan las colas registradas en round-robin
 - Esto garantiza que archivos de diferentes usuarios se procesen en paralelo
 
 COLA DE MANTENIMIENTO:
@@ -11,7 +14,10 @@ COLA DE MANTENIMIENTO:
 - Se procesa con alta prioridad para evitar que archivos queden sin procesar
 """
 import os
+import threading
+import time
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_ready
 from kombu import Queue
 
 # Establecer el módulo de settings de Django
@@ -27,15 +33,6 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
-def get_user_queue_name(user_id):
-    """Genera el nombre de cola para un usuario específico."""
-    return f'user_queue_{user_id}'
-
-
-# Lista de colas de usuario activas (se actualizan dinámicamente)
-# Incluimos colas para usuarios del 1 al 500 por defecto
-USER_QUEUES = [Queue(f'user_queue_{i}') for i in range(1, 501)]
-
 # Configuración básica
 app.conf.update(
     # Broker y backend
@@ -64,11 +61,12 @@ app.conf.update(
     # Conexiones DB
     worker_pool_restarts=True,
     
-    # COLAS: maintenance (alta prioridad) + celery + colas de usuario
+    # COLAS: maintenance (alta prioridad) + celery; las colas de usuario se
+    # agregan en caliente (app/queue_registry.py)
     task_queues=[
         Queue('maintenance'),  # Cola de alta prioridad para tareas de mantenimiento
         Queue('celery'),
-    ] + USER_QUEUES,
+    ],
     
     # Cola por defecto para tareas que no especifican cola
     task_default_queue='celery',
@@ -78,13 +76,22 @@ app.conf.update(
         # Tareas de mantenimiento van a cola dedicada
         'app.tasks.check_and_requeue_orphan_files': {'queue': 'maintenance'},
         'app.tasks.sync_progress_with_movil': {'queue': 'maintenance'},
+        'app.tasks.flush_progress': {'queue': 'maintenance'},
+        'app.tasks.warm_phone_cache_task': {'queue': 'maintenance'},
         # Tareas de scraping se sobreescriben dinámicamente
         'app.tasks.scrape_and_save_phone_task': {'queue': 'celery'},
+        'app.tasks.scrape_batch_task': {'queue': 'celery'},
+        'app.tasks.scrape_batch_async_task': {'queue': 'celery'},
         'app.tasks.process_file_in_batches': {'queue': 'celery'},
     },
     
     # Celery Beat - Tareas periódicas
     beat_schedule={
+        'flush-progress-every-2-seconds': {
+            'task': 'app.tasks.flush_progress',
+            'schedule': 2.0,
+            'options': {'queue': 'maintenance', 'expires': 10},
+        },
         'sync-progress-every-30-seconds': {
             'task': 'app.tasks.sync_progress_with_movil',
             'schedule': 30.0,
@@ -98,6 +105,61 @@ app.conf.update(
     },
 )
 
+@worker_ready.connect
+def warm_phone_cache_on_worker_ready(sender=None, **kwargs):
+    """Encola la carga del caché de números al arrancar el worker (una sola se ejecuta)."""
+    from app.tasks import warm_phone_cache_task
+    warm_phone_cache_task.apply_async(queue='maintenance')
+
+
+@worker_ready.connect
+def consume_registered_user_queues(sender=None, **kwargs):
+    """Un worker nuevo no recibió los add_consumer anteriores: consumir las colas registradas."""
+    from app import queue_registry
+
+    for user_id in sorted(queue_registry.registered()):
+        sender.add_task_queue(queue_registry.queue_name(user_id))
+
+
+# Última vez que cada hilo usó su conexión a la BD (DB_POOL_MODE persistent/pgbouncer)
+_db_last_used = {}
+
+
+@task_prerun.connect
+def check_db_connections(**kwargs):
+    """
+    Verifica las conexiones persistentes antes de la tarea (Django 3.2 no tiene
+    CONN_HEALTH_CHECKS): si estuvieron inactivas más de DB_HEALTH_CHECK_INTERVAL
+    se prueban con SELECT 1 y se descartan si el servidor las cerró.
+    La fixup de Django en Celery ya cierra las vencidas (CONN_MAX_AGE) o con errores.
+    """
+    from django.conf import settings
+    from django.db import connections
+
+    if getattr(settings, 'DB_POOL_MODE', 'direct') == 'direct':
+        return
+    interval = getattr(settings, 'DB_HEALTH_CHECK_INTERVAL', 30)
+    now = time.monotonic()
+    thread_id = threading.get_ident()
+    for conn in connections.all():
+        if conn.connection is None:
+            continue
+        last_used = _db_last_used.get((thread_id, conn.alias), 0)
+        if now - last_used >= interval and not conn.is_usable():
+            conn.close()
+
+
+@task_postrun.connect
+def mark_db_connections_used(**kwargs):
+    from django.db import connections
+
+    now = time.monotonic()
+    thread_id = threading.get_ident()
+    for conn in connections.all():
+        if conn.connection is not None:
+            _db_last_used[(thread_id, conn.alias)] = now
+
+
 @app.task(bind=True)
 def debug_task(self):
     """Tarea de prueba."""
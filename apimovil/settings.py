@@ -121,6 +121,46 @@ CELERY_TIMEZONE = 'America/Lima'  # Ajusta según tu zona horaria
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutos
 
+# Motor de scraping para los números que no están en caché/BD:
+# - 'sync':  una tarea scrape_and_save_phone_task por número (DigiPhone con requests)
+# - 'batch': un scrape_batch_task por cada SCRAPE_BATCH_SIZE números (DigiPhone del pool, en serie)
+# - 'async': un scrape_batch_async_task por cada SCRAPE_BATCH_SIZE números (AsyncDigiPhone, asyncio + SOCKS5)
+SCRAPE_ENGINE = os.environ.get('SCRAPE_ENGINE', 'sync')
+# Números por mensaje en los motores 'batch' y 'async' (50-500)
+SCRAPE_BATCH_SIZE = min(max(int(os.environ.get('SCRAPE_BATCH_SIZE', '100')), 50), 500)
+# Tiempo máximo de scrape_batch_task (por debajo de task_soft_time_limit=240); lo que
+# no alcanzó a consultar se re-encola en un nuevo mensaje
+SCRAPE_BATCH_BUDGET = int(os.environ.get('SCRAPE_BATCH_BUDGET', '180'))  # segundos
+ASYNC_SCRAPE_PER_PROXY_CONCURRENCY = int(os.environ.get('ASYNC_SCRAPE_PER_PROXY_CONCURRENCY', '4'))
+ASYNC_SCRAPE_MAX_CONCURRENCY = int(os.environ.get('ASYNC_SCRAPE_MAX_CONCURRENCY', '200'))
+
+# Caché L1 en memoria (por proceso) delante de las claves phone: de Redis (app/phone_cache.py)
+# PHONE_CACHE_L1_SIZE=0 lo deshabilita
+PHONE_CACHE_L1_SIZE = int(os.environ.get('PHONE_CACHE_L1_SIZE', '200000'))
+PHONE_CACHE_L1_TTL = int(os.environ.get('PHONE_CACHE_L1_TTL', '300'))  # segundos
+
+# Formato del caché de números en Redis:
+# - 'keys':    una clave phone:{numero} por número
+# - 'buckets': hashes compactos por prefijo con ids de operador (mucha menos memoria)
+# Al cambiar de formato recargar con: python manage.py warm_phone_cache --force
+PHONE_CACHE_LAYOUT = os.environ.get('PHONE_CACHE_LAYOUT', 'keys')
+PHONE_CACHE_BUCKET_SUFFIX_DIGITS = int(os.environ.get('PHONE_CACHE_BUCKET_SUFFIX_DIGITS', '2'))
+PHONE_CACHE_BUCKET_RETENTION_DAYS = int(os.environ.get('PHONE_CACHE_BUCKET_RETENTION_DAYS', '90'))
+
+# Caché negativo: números cuyo scraping falla se pausan NEGATIVE_CACHE_BASE_TTL * 2^(fallos-1)
+# segundos, hasta NEGATIVE_CACHE_MAX_TTL
+NEGATIVE_CACHE_BASE_TTL = int(os.environ.get('NEGATIVE_CACHE_BASE_TTL', '600'))  # 10 min
+NEGATIVE_CACHE_MAX_TTL = int(os.environ.get('NEGATIVE_CACHE_MAX_TTL', str(60 * 60 * 24)))  # 24 h
+
+# Consultas en curso compartidas (singleflight): lease de la marca y espera máxima de los seguidores.
+# La espera es corta (ocupa un slot del worker): lo que siga en curso se re-encola
+SINGLEFLIGHT_LEASE = int(os.environ.get('SINGLEFLIGHT_LEASE', '120'))  # segundos
+SINGLEFLIGHT_WAIT = int(os.environ.get('SINGLEFLIGHT_WAIT', '10'))  # segundos
+
+# Progreso en vivo por SSE (app/progress_stream.py, servido por ASGI en /progress/stream/)
+PROGRESS_PUSH_PER_SECOND = int(os.environ.get('PROGRESS_PUSH_PER_SECOND', '4'))  # mensajes por archivo
+PROGRESS_STREAM_KEEPALIVE = int(os.environ.get('PROGRESS_STREAM_KEEPALIVE', '15'))  # segundos
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
@@ -146,6 +186,18 @@ CACHE_MIDDLEWARE_KEY_PREFIX = 'apimovil'
 
 # PostgreSQL Configuration
 # Usa variables de entorno para mayor seguridad
+# Manejo de conexiones a Postgres (DB_POOL_MODE):
+# - 'direct':     una conexión nueva por request/tarea (CONN_MAX_AGE=0, comportamiento histórico)
+# - 'persistent': cada proceso/hilo reutiliza su conexión hasta DB_CONN_MAX_AGE segundos;
+#                 los workers Celery la verifican antes de cada tarea (apimovil/celery.py)
+# - 'pgbouncer':  conexiones persistentes contra PgBouncer en modo transaction
+#                 (DB_PORT por defecto 6432, sin cursores de servidor ni parámetros de sesión;
+#                 statement_timeout se fija con ALTER ROLE, ver configs/pgbouncer.ini)
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'direct')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '600'))  # segundos
+# Segundos sin usar tras los que un worker Celery hace SELECT 1 antes de la tarea
+DB_HEALTH_CHECK_INTERVAL = int(os.environ.get('DB_HEALTH_CHECK_INTERVAL', '30'))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -153,8 +205,8 @@ DATABASES = {
         'USER': os.environ.get('DB_USER', 'admin'),
         'PASSWORD': os.environ.get('DB_PASSWORD', 'p0lDhDVc5SKo'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
-        'PORT': os.environ.get('DB_PORT', '5432'),
-        'CONN_MAX_AGE': 0,
+        'PORT': os.environ.get('DB_PORT', '6432' if DB_POOL_MODE == 'pgbouncer' else '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL_MODE == 'direct' else DB_CONN_MAX_AGE,
         'OPTIONS': {
             'connect_timeout': 10,
             'options': '-c statement_timeout=30000'
@@ -162,6 +214,14 @@ DATABASES = {
     }
 }
 
+if DB_POOL_MODE == 'pgbouncer':
+    # En modo transaction la sesión no es nuestra: nada de cursores con nombre
+    # ni parámetros de arranque. Sin cursores del lado del servidor un
+    # .iterator() trae el resultado completo de una vez, por eso las lecturas
+    # grandes (warm_phone_cache, consult/stream) van por lotes con keyset
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    DATABASES['default']['OPTIONS'].pop('options')
+
 # Configuración SQLite para desarrollo local (comentado)
 # Descomenta esto si necesitas volver a SQLite temporalmente
 # DATABASES = {
@@ -5,13 +5,10 @@ class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
 
+    # La carga del caché de números NO se hace aquí (bloquearía el arranque de cada
+    # worker y de cada comando manage.py): ver app.tasks.warm_phone_cache_task y
+    # `python manage.py warm_phone_cache`.
+
     def ready(self):
-        """
-        Se ejecuta cuando Django carga la aplicación.
-        Importa las señales y carga el caché inicial.
-        """
-        # Importar la función de carga de caché
-        from app.signals import load_phone_cache_on_startup
-        
-        # Cargar el caché al iniciar (tanto Gunicorn como Daphne)
-        load_phone_cache_on_startup()
+        # Receptores de señales (invalidación del resumen de filter_data)
+        from . import signals  # noqa: F401
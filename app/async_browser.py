@@ -0,0 +1,387 @@
+"""
+Motor asíncrono de consultas DigiPhone (asyncio + aiohttp sobre SOCKS5).
+
+Mantiene la misma semántica que DigiPhone (app/browser.py):
+- login_with_cookies(): GET página principal + POST /v2/login/online → store_access_token
+- get_phone_number(): GET /v2/operators/by-line-code/<n> → (status, json | texto)
+
+pero permite cientos de consultas concurrentes desde un solo proceso, con un
+límite de concurrencia por proxy (semáforo por línea) y uno global.
+
+Uso:
+    engine = AsyncDigiPhone.from_user(user)          # consulta Proxy (síncrono)
+    results = asyncio.run(engine.run_lookups(numbers))
+    # {numero: operador | None}
+
+Archivo: app/async_browser.py
+"""
+import asyncio
+import logging
+import random
+from time import time
+
+import aiohttp
+from aiohttp_socks import ProxyConnector
+
+from .browser import DEFAULT_TOKEN_TTL, HOME_URL, STORE_BACKEND_URL, TOKEN_REFRESH_MARGIN
+from .proxy_rotation_system import get_proxy_health_registry, get_proxy_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36 Edg/142.0.0.0"
+
+HEADERS_HOME = {
+    "user-agent": USER_AGENT,
+    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+    "accept-language": "es-ES,es;q=0.9",
+    "accept-encoding": "gzip, deflate",
+    "upgrade-insecure-requests": "1",
+    "sec-fetch-dest": "document",
+    "sec-fetch-mode": "navigate",
+    "sec-fetch-site": "none",
+    "sec-fetch-user": "?1",
+}
+
+HEADERS_LOGIN = {
+    "user-agent": USER_AGENT,
+    "accept": "*/*",
+    "accept-language": "es-ES,es;q=0.9",
+    "accept-encoding": "gzip, deflate",
+    "content-type": "application/json",
+    "origin": "https://www.digimobil.es",
+    "referer": "https://www.digimobil.es/",
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-site",
+}
+
+HEADERS_API = {
+    "accept": "*/*",
+    "accept-language": "es-ES,es;q=0.9",
+    "accept-encoding": "gzip, deflate",
+    "origin": "https://www.digimobil.es",
+    "referer": "https://www.digimobil.es/",
+    "priority": "u=1, i",
+    "sec-ch-ua": "\"Chromium\";v=\"142\", \"Microsoft Edge\";v=\"142\", \"Not_A Brand\";v=\"99\"",
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": "\"Windows\"",
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-site",
+    "user-agent": USER_AGENT,
+}
+
+DIGI_OPERATOR = "DIGI SPAIN TELECOM, S.L."
+
+# Cada cuánto se sincroniza la salud compartida de los proxies (segundos): se
+# envían los éxitos/errores acumulados y se relee el cooldown, fuera del event loop
+HEALTH_REFRESH_INTERVAL = 5
+
+
+def load_proxy_lines(user):
+    """
+    Lista de proxies del usuario, una entrada por línea del campo username
+    (misma expansión que DigiPhone.__init__).
+
+    Returns:
+        list: [{"proxy_id": str, "url": "socks5://user:pass@ip:port"}, ...]
+    """
+    from .models import Proxy
+
+    lines = []
+    for p in Proxy.objects.filter(user=user):
+        usernames = [u.strip() for u in p.username.strip().splitlines() if u.strip()]
+        for uname in usernames:
+            lines.append({
+                "proxy_id": f"{p.ip}:{p.port_min}:{uname}",
+                "url": f"socks5://{uname}:{p.password}@{p.ip}:{p.port_min}",
+            })
+    return lines
+
+
+class _ProxySlot:
+    """Estado de una línea de proxy: sesión aiohttp, cookies y límite de concurrencia"""
+
+    def __init__(self, proxy_id, url, concurrency):
+        self.proxy_id = proxy_id
+        self.url = url
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.login_lock = asyncio.Lock()
+        self.session = None
+        self.token_expires = None
+        self.consecutive_errors = 0
+        self.disabled_until = 0
+        # Estado para el planificador (local al motor, sin round trips)
+        self.inflight = 0
+        self.ewma = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    def open(self, timeout):
+        # rdns=True equivale a socks5h:// (el proxy resuelve el DNS)
+        connector = ProxyConnector.from_url(self.url, rdns=True)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @property
+    def has_valid_access(self):
+        return self.token_expires is not None and time() < self.token_expires - TOKEN_REFRESH_MARGIN
+
+    @property
+    def available(self):
+        return time() >= self.disabled_until
+
+    @property
+    def state(self):
+        return {
+            "ewma": self.ewma,
+            "successes": self.successes,
+            "failures": self.failures,
+            "inflight": self.inflight,
+        }
+
+    def record_latency(self, latency, alpha):
+        self.ewma = latency if not self.ewma else alpha * latency + (1 - alpha) * self.ewma
+
+
+class AsyncDigiPhone:
+    """Cliente asíncrono de DIGI con concurrencia acotada por proxy"""
+
+    def __init__(self, proxy_lines, per_proxy_concurrency=4, max_concurrency=200,
+                 timeout=15, max_errors_per_proxy=5, proxy_cooldown=300):
+        """
+        Args:
+            proxy_lines: Resultado de load_proxy_lines()
+            per_proxy_concurrency: Consultas simultáneas por línea de proxy
+            max_concurrency: Consultas simultáneas totales del motor
+            timeout: Timeout total por petición HTTP (segundos)
+            max_errors_per_proxy: Errores seguidos antes de deshabilitar la línea
+            proxy_cooldown: Segundos que una línea queda deshabilitada
+        """
+        self.proxy_lines = proxy_lines
+        self.per_proxy_concurrency = per_proxy_concurrency
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_errors_per_proxy = max_errors_per_proxy
+        self.proxy_cooldown = proxy_cooldown
+        self.slots = []
+        self._global_semaphore = None
+        self._health = get_proxy_health_registry()
+        self._scheduler = get_proxy_scheduler()
+        # Salud acumulada en memoria hasta el siguiente _sync_health
+        self._latencies = {}
+        self._failures = {}
+        self._health_task = None
+
+    @classmethod
+    def from_user(cls, user, **kwargs):
+        """Construye el motor con los proxies del usuario (llamar fuera del event loop)"""
+        return cls(load_proxy_lines(user), **kwargs)
+
+    @property
+    def _len_proxy(self):
+        return len(self.proxy_lines)
+
+    async def __aenter__(self):
+        self.slots = [
+            _ProxySlot(line["proxy_id"], line["url"], self.per_proxy_concurrency)
+            for line in self.proxy_lines
+        ]
+        for slot in self.slots:
+            slot.open(self.timeout)
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self._sync_health()
+        self._health_task = asyncio.ensure_future(self._health_loop())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._health_task.cancel()
+        await self._sync_health()
+        await asyncio.gather(*(slot.close() for slot in self.slots), return_exceptions=True)
+        self.slots = []
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(HEALTH_REFRESH_INTERVAL)
+            await self._sync_health()
+
+    async def _sync_health(self):
+        """
+        Envía a Redis los éxitos/errores acumulados y relee el cooldown
+        compartido, en un hilo aparte: el event loop nunca espera a Redis.
+        """
+        latencies, self._latencies = self._latencies, {}
+        failures, self._failures = self._failures, {}
+        proxy_ids = [slot.proxy_id for slot in self.slots]
+
+        def sync():
+            return self._health.record_batch(latencies, failures), self._health.in_cooldown(proxy_ids)
+
+        try:
+            disabled, cooling = await asyncio.get_running_loop().run_in_executor(None, sync)
+        except Exception as e:
+            logger.debug(f"[AsyncDigiPhone] Error sincronizando salud de proxies: {e}")
+            return
+        for slot in self.slots:
+            if slot.proxy_id in disabled:
+                slot.disabled_until = max(slot.disabled_until, time() + self._health.cooldown)
+                slot.consecutive_errors = 0
+            elif slot.proxy_id in cooling:
+                slot.disabled_until = max(slot.disabled_until, time() + HEALTH_REFRESH_INTERVAL)
+
+    def _pick_slot(self, exclude=None):
+        """
+        Elige línea por "power of two choices": dos líneas disponibles al azar
+        y se queda con la de menor costo (latencia EWMA, tasa de éxito y
+        consultas en curso). Si todas están deshabilitadas se usa una al azar.
+        """
+        candidates = [slot for slot in self.slots if slot is not exclude and slot.available]
+        if not candidates:
+            candidates = [slot for slot in self.slots if slot is not exclude] or self.slots
+            return random.choice(candidates)
+        sampled = random.sample(candidates, min(self._scheduler.choices, len(candidates)))
+        return min(sampled, key=lambda slot: self._scheduler.score(slot.state))
+
+    def _record_error(self, slot, error):
+        slot.consecutive_errors += 1
+        slot.failures += 1
+        # El cooldown compartido se aplica en el siguiente _sync_health
+        self._failures.setdefault(slot.proxy_id, []).append(("connection", error))
+        if slot.consecutive_errors >= self.max_errors_per_proxy:
+            slot.disabled_until = time() + self.proxy_cooldown
+            slot.consecutive_errors = 0
+            logger.warning(f"[AsyncDigiPhone] ⚠ Proxy {slot.proxy_id} DESHABILITADO por {self.proxy_cooldown}s ({error})")
+
+    async def login_with_cookies(self, slot):
+        """
+        Obtiene la cookie store_access_token para la línea (mismo flujo que
+        DigiPhone.login_with_cookies). Un solo login concurrente por línea.
+        """
+        async with slot.login_lock:
+            if slot.has_valid_access:
+                return {"_info": {"status": 200}, "_result": {}}
+
+            try:
+                async with slot.session.get(HOME_URL, headers=HEADERS_HOME) as response:
+                    await response.read()
+            except Exception as e:
+                logger.warning(f"[AsyncDigiPhone.login_with_cookies] Error obteniendo cookies previas ({slot.proxy_id}): {e}")
+                return {"_info": {"status": 500}, "_error": f"Error obteniendo cookies previas: {str(e)}"}
+
+            try:
+                async with slot.session.post(f"{STORE_BACKEND_URL}/v2/login/online", headers=HEADERS_LOGIN) as response:
+                    await response.read()
+            except Exception as e:
+                logger.warning(f"[AsyncDigiPhone.login_with_cookies] Error en POST login ({slot.proxy_id}): {e}")
+                return {"_info": {"status": 500}, "_error": str(e)}
+
+            token = None
+            for cookie in slot.session.cookie_jar:
+                if cookie.key == 'store_access_token':
+                    token = cookie
+                    break
+
+            if token is None:
+                logger.warning(f"[AsyncDigiPhone.login_with_cookies] ⚠ No se obtuvo store_access_token ({slot.proxy_id})")
+                return {"_info": {"status": 401}, "_error": "No se obtuvo store_access_token"}
+
+            max_age = token.get("max-age")
+            slot.token_expires = time() + (int(max_age) if str(max_age).isdigit() else DEFAULT_TOKEN_TTL)
+            return {"_info": {"status": 200}, "_result": {"store_access_token": token.value}}
+
+    def invalidate_access(self, slot):
+        slot.token_expires = None
+        slot.session.cookie_jar.clear()
+
+    async def get_phone_number(self, phone, slot):
+        """
+        Consulta el operador de un número. Retorna (status, json) si 200,
+        (status, texto) en otro caso y (500, error) si falla la conexión.
+        """
+        url = f"{STORE_BACKEND_URL}/v2/operators/by-line-code/{phone}"
+        slot.inflight += 1
+        try:
+            async with slot.semaphore:
+                try:
+                    started = time()
+                    async with slot.session.get(url, headers=HEADERS_API) as response:
+                        if response.status == 200:
+                            data = await response.json(content_type=None)
+                        else:
+                            data = await response.text()
+                        if response.status in [200, 404]:
+                            latency = time() - started
+                            slot.consecutive_errors = 0
+                            slot.successes += 1
+                            slot.record_latency(latency, self._health.ewma_alpha)
+                            self._latencies.setdefault(slot.proxy_id, []).append(latency)
+                        return response.status, data
+                except Exception as e:
+                    self._record_error(slot, type(e).__name__)
+                    return 500, str(e)
+        finally:
+            slot.inflight -= 1
+
+    async def lookup(self, phone, max_attempts=3):
+        """
+        Resuelve un número con reintentos (renovando cookies o cambiando de
+        proxy), igual que scrape_and_save_phone_task.
+
+        Returns:
+            tuple: (operador | None, intentos realizados)
+        """
+        async with self._global_semaphore:
+            slot = self._pick_slot()
+            for attempt in range(1, max_attempts + 1):
+                if not slot.has_valid_access:
+                    login = await self.login_with_cookies(slot)
+                    if login.get("_info", {}).get("status") != 200:
+                        self._record_error(slot, "login")
+                        slot = self._pick_slot(exclude=slot)
+                        continue
+
+                status, data = await self.get_phone_number(phone, slot)
+                if status == 200:
+                    name = data.get("name", "Desconocido") if isinstance(data, dict) else "Desconocido"
+                    return name, attempt
+                if status == 404:
+                    return DIGI_OPERATOR, attempt
+                if status in [401, 498]:
+                    self.invalidate_access(slot)
+                else:
+                    slot = self._pick_slot(exclude=slot)
+            return None, max_attempts
+
+    async def run_lookups(self, phones, max_attempts=3):
+        """
+        Resuelve un lote de números de forma concurrente.
+
+        Returns:
+            dict: {numero: operador | None}
+        """
+        if not self.proxy_lines or not phones:
+            return {phone: None for phone in phones}
+
+        async with self:
+            results = await asyncio.gather(
+                *(self.lookup(phone, max_attempts) for phone in phones),
+                return_exceptions=True
+            )
+
+        resolved = {}
+        for phone, result in zip(phones, results):
+            if isinstance(result, Exception):
+                logger.warning(f"[AsyncDigiPhone] ✗ Error para {phone}: {result}")
+                resolved[phone] = None
+            else:
+                resolved[phone] = result[0]
+        return resolved
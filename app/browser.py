@@ -12,6 +12,7 @@ import os
 # ============================================================================
 # Para usar DJANGO (con base de datos):
 from .models import Proxy
+from .proxy_rotation_system import get_proxy_health_registry, get_proxy_scheduler
 
 # Para usar MOCK (local, sin Django) - comenta la línea de arriba y descomenta las siguientes:
 # from mock_proxy import MockProxyManager
@@ -19,6 +20,16 @@ from .models import Proxy
 #     objects = MockProxyManager()
 # ============================================================================
 
+# Vida asumida de store_access_token si la cookie no trae fecha de expiración
+DEFAULT_TOKEN_TTL = 15 * 60  # 15 minutos
+# Margen antes de la expiración para renovar el token
+TOKEN_REFRESH_MARGIN = 30
+
+# URLs de DIGI. Se pueden apuntar al servidor falso de loadtest/fake_digi.py
+# para pruebas de carga sin salir a internet.
+HOME_URL = os.environ.get("DIGI_HOME_URL", "https://www.digimobil.es/")
+STORE_BACKEND_URL = os.environ.get("DIGI_STORE_BACKEND_URL", "https://store-backend.digimobil.es").rstrip("/")
+
 # Configuración de logging más detallada para depuración
 _logging = logging.basicConfig(
     filename="logger.log",
@@ -38,12 +49,10 @@ class DigiPhone:
         #logging.info(f"proxys: {str(self.proxys)}")
         self.proxies = []
         
-        # Circuit breaker: tracking de errores SSL y conexión por proxy
-        # Formato: {proxy_id: {"ssl_errors": count, "connection_errors": count, "last_error_time": timestamp, "disabled_until": timestamp}}
-        self._proxy_health = {}
-        self._max_ssl_errors_per_proxy = 5  # Deshabilitar proxy después de 5 errores SSL
-        self._max_connection_errors_per_proxy = 5  # Deshabilitar proxy después de 5 errores de conexión
-        self._proxy_cooldown = 300  # 5 minutos de cooldown para proxies deshabilitados
+        # Circuit breaker: salud de proxies compartida por todos los procesos (Redis)
+        # Un proxy con 5 errores SSL/conexión en 60s queda deshabilitado 5 minutos en toda la flota
+        self._health = get_proxy_health_registry()
+        self._scheduler = get_proxy_scheduler()
 
         if self.proxys.count() == 1:
             p = self.proxys.first()
@@ -68,15 +77,9 @@ class DigiPhone:
                     "product": None,
                     "item": p,
                     "cart": None,
-                    "proxy_id": proxy_id  # ID único para tracking
+                    "proxy_id": proxy_id,  # ID único para tracking
+                    "token_expires": None  # Expiración de store_access_token (epoch)
                 })
-                # Inicializar health tracking
-                self._proxy_health[proxy_id] = {
-                    "ssl_errors": 0,
-                    "connection_errors": 0,
-                    "last_error_time": None,
-                    "disabled_until": None
-                }
         else:
             # Múltiples registros de proxy - aplicar la misma lógica que arriba
             for p in self.proxys:
@@ -102,15 +105,9 @@ class DigiPhone:
                         "product": None,
                         "item": p,
                         "cart": None,
-                        "proxy_id": proxy_id
+                        "proxy_id": proxy_id,
+                        "token_expires": None
                     })
-                    # Inicializar health tracking
-                    self._proxy_health[proxy_id] = {
-                        "ssl_errors": 0,
-                        "connection_errors": 0,
-                        "last_error_time": None,
-                        "disabled_until": None
-                    }
 
         self.position = 0
 
@@ -129,49 +126,18 @@ class DigiPhone:
 
     def change_position(self):
         """
-        Cambia a la siguiente posición de proxy, saltando proxies deshabilitados por circuit breaker.
+        Cambia de proxy usando el planificador compartido (power of two choices sobre
+        latencia EWMA, tasa de éxito y peticiones en curso), saltando proxies
+        deshabilitados por circuit breaker.
         """
+        if len(self.proxies) < 2:
+            return
         original_position = self.position
-        attempts = 0
-        max_attempts = len(self.proxies) * 2  # Evitar bucle infinito
-        
-        while attempts < max_attempts:
-            if self.position < len(self.proxies) - 1:
-                self.position += 1
-            else:
-                self.position = 0
-            
-            # Verificar si el proxy actual está disponible (no deshabilitado)
-            current_proxy_id = self.proxies[self.position].get("proxy_id")
-            if current_proxy_id:
-                health = self._proxy_health.get(current_proxy_id, {})
-                disabled_until = health.get("disabled_until")
-                
-                if disabled_until is None:
-                    # Proxy disponible
-                    if original_position != self.position:
-                        logging.info(f"[change_position] Cambiado de proxy {original_position} a {self.position} (proxy_id: {current_proxy_id})")
-                    return
-                else:
-                    # Verificar si el cooldown ya expiró
-                    from time import time
-                    if time() < disabled_until:
-                        # Proxy aún en cooldown, continuar al siguiente
-                        logging.debug(f"[change_position] Proxy {current_proxy_id} aún en cooldown, saltando...")
-                        attempts += 1
-                        continue
-                    else:
-                        # Cooldown expirado, reactivar proxy
-                        logging.info(f"[change_position] Reactivando proxy {current_proxy_id} (cooldown expirado)")
-                        health["ssl_errors"] = 0
-                        health["disabled_until"] = None
-                        return
-            
-            attempts += 1
-        
-        # Si todos los proxies están deshabilitados, usar el primero de todos modos
-        if original_position != self.position:
-            logging.warning(f"[change_position] Todos los proxies en cooldown, usando posición {self.position} de todos modos")
+        self.position = self._scheduler.pick(
+            [p["proxy_id"] for p in self.proxies],
+            exclude=original_position
+        )
+        logging.info(f"[change_position] Cambiado de proxy {original_position} a {self.position} (proxy_id: {self.proxies[self.position]['proxy_id']})")
     
     def _record_ssl_error(self, error_message):
         """
@@ -181,22 +147,8 @@ class DigiPhone:
         if not current_proxy_id:
             return
         
-        from time import time
-        health = self._proxy_health.get(current_proxy_id, {
-            "ssl_errors": 0,
-            "connection_errors": 0,
-            "last_error_time": None,
-            "disabled_until": None
-        })
-        health["ssl_errors"] = health.get("ssl_errors", 0) + 1
-        health["last_error_time"] = time()
-        
-        total_errors = health["ssl_errors"] + health.get("connection_errors", 0)
-        if health["ssl_errors"] >= self._max_ssl_errors_per_proxy or total_errors >= (self._max_ssl_errors_per_proxy + self._max_connection_errors_per_proxy) // 2:
-            health["disabled_until"] = time() + self._proxy_cooldown
-            logging.warning(f"[_record_ssl_error] ⚠ Proxy {current_proxy_id} DESHABILITADO por {self._proxy_cooldown}s (errores SSL: {health['ssl_errors']}, total: {total_errors})")
-        
-        self._proxy_health[current_proxy_id] = health
+        if self._health.record_failure(current_proxy_id, kind="ssl", reason=error_message):
+            logging.warning(f"[_record_ssl_error] ⚠ Proxy {current_proxy_id} DESHABILITADO por {self._health.cooldown}s")
     
     def _record_connection_error(self, error_message):
         """
@@ -206,43 +158,76 @@ class DigiPhone:
         if not current_proxy_id:
             return
         
-        from time import time
-        health = self._proxy_health.get(current_proxy_id, {
-            "ssl_errors": 0,
-            "connection_errors": 0,
-            "last_error_time": None,
-            "disabled_until": None
-        })
-        health["connection_errors"] = health.get("connection_errors", 0) + 1
-        health["last_error_time"] = time()
-        
-        total_errors = health["ssl_errors"] + health["connection_errors"]
-        if health["connection_errors"] >= self._max_connection_errors_per_proxy or total_errors >= (self._max_ssl_errors_per_proxy + self._max_connection_errors_per_proxy) // 2:
-            health["disabled_until"] = time() + self._proxy_cooldown
-            logging.warning(f"[_record_connection_error] ⚠ Proxy {current_proxy_id} DESHABILITADO por {self._proxy_cooldown}s (errores conexión: {health['connection_errors']}, total: {total_errors})")
-        
-        self._proxy_health[current_proxy_id] = health
+        if self._health.record_failure(current_proxy_id, kind="connection", reason=error_message):
+            logging.warning(f"[_record_connection_error] ⚠ Proxy {current_proxy_id} DESHABILITADO por {self._health.cooldown}s")
     
-    def _reset_proxy_errors(self):
+    def _reset_proxy_errors(self, latency=None):
         """
-        Resetea los contadores de errores SSL y conexión para el proxy actual (cuando hay éxito).
+        Resetea los contadores de errores SSL y conexión para el proxy actual (cuando hay éxito)
+        y registra la latencia de la respuesta.
         """
         current_proxy_id = self.proxies[self.position].get("proxy_id")
-        if current_proxy_id and current_proxy_id in self._proxy_health:
-            health = self._proxy_health[current_proxy_id]
-            ssl_errors = health.get("ssl_errors", 0)
-            conn_errors = health.get("connection_errors", 0)
-            if ssl_errors > 0 or conn_errors > 0:
-                logging.debug(f"[_reset_proxy_errors] Reseteando errores para proxy {current_proxy_id} (SSL: {ssl_errors}, Conexión: {conn_errors})")
-                health["ssl_errors"] = 0
-                health["connection_errors"] = 0
-                health["last_error_time"] = None
+        if current_proxy_id:
+            self._health.record_success(current_proxy_id, latency=latency)
+
+    def reset_proxy_health(self):
+        """Rehabilita todos los proxies de esta instancia en el registro compartido."""
+        return self._health.reset([p["proxy_id"] for p in self.proxies])
+
+    def _track_token_expiry(self, session):
+        """
+        Guarda la expiración de store_access_token para el proxy actual.
+        Usa la fecha de la cookie si existe; si no, DEFAULT_TOKEN_TTL.
+        """
+        from time import time
+        expires = None
+        for cookie in session.cookies:
+            if cookie.name == 'store_access_token' and cookie.expires:
+                expires = cookie.expires
+                break
+        self.proxies[self.position]["token_expires"] = expires or (time() + DEFAULT_TOKEN_TTL)
+
+    def has_valid_access(self):
+        """
+        True si el proxy actual tiene store_access_token vigente
+        (sin necesidad de volver a hacer login).
+        """
+        if not self.proxies:
+            return False
+        from time import time
+        current = self.proxies[self.position]
+        expires = current.get("token_expires")
+        if 'store_access_token' not in current["session"].cookies or expires is None:
+            return False
+        return time() < expires - TOKEN_REFRESH_MARGIN
+
+    def ensure_access(self, get_cart=False):
+        """
+        Obtiene acceso solo si el proxy actual no tiene un token vigente.
+        Evita el GET a la página principal + POST /v2/login/online por consulta.
+        """
+        if self.has_valid_access():
+            return True
+        if not self.proxies:
+            return False
+        return self.get_access("", get_cart=get_cart)
+
+    def invalidate_access(self):
+        """
+        Descarta el token del proxy actual (p. ej. tras un 401/498) para que
+        la próxima llamada a ensure_access() vuelva a hacer login.
+        """
+        if not self.proxies:
+            return
+        current = self.proxies[self.position]
+        current["token_expires"] = None
+        current["session"].cookies.clear()
 
     def update_cart(self):
         """
         Actualiza el carrito usando cookies (store_access_token) en lugar de Bearer token.
         """
-        url = f"https://store-backend.digimobil.es/v2/preorders/{self.proxies[self.position]['preorder']}/shopping-carts"
+        url = f"{STORE_BACKEND_URL}/v2/preorders/{self.proxies[self.position]['preorder']}/shopping-carts"
 
         headers = {
             "accept": "*/*",
@@ -286,7 +271,7 @@ class DigiPhone:
         """
         Valida un número de teléfono usando cookies (store_access_token).
         """
-        url = f"https://store-backend.digimobil.es/v2/preorders/{self.proxies[self.position]['preorder']}/shopping-cart-lines/{self.proxies[self.position]['cart']}/validate-phonenumber/{phone}"
+        url = f"{STORE_BACKEND_URL}/v2/preorders/{self.proxies[self.position]['preorder']}/shopping-cart-lines/{self.proxies[self.position]['cart']}/validate-phonenumber/{phone}"
 
         headers = {
             "accept": "*/*",
@@ -324,7 +309,7 @@ class DigiPhone:
         Obtiene información del operador de un número usando cookies (store_access_token).
         Incluye detección de errores SSL y registro en circuit breaker.
         """
-        url = f"https://store-backend.digimobil.es/v2/operators/by-line-code/{phone}"
+        url = f"{STORE_BACKEND_URL}/v2/operators/by-line-code/{phone}"
 
         headers = {
             "accept": "*/*",
@@ -348,12 +333,18 @@ class DigiPhone:
         logging.info(f"[get_phone_number] Cookies disponibles: {list(session.cookies.keys())}")
         
         try:
-            response = session.get(url, headers=headers, timeout=15)
+            from time import time
+            started = time()
+            self._health.acquire(current_proxy_id)
+            try:
+                response = session.get(url, headers=headers, timeout=15)
+            finally:
+                self._health.release(current_proxy_id)
             logging.info(f"[get_phone_number] Status: {response.status_code} | Body: {response.text[:200]}...")
             
             # Si la respuesta es exitosa, resetear errores SSL del proxy
             if response.status_code in [200, 404]:
-                self._reset_proxy_errors()
+                self._reset_proxy_errors(latency=time() - started)
             
             if response.status_code == 200:
                 return response.status_code, response.json()
@@ -394,7 +385,7 @@ class DigiPhone:
         """
         Obtiene información de portabilidad usando cookies (store_access_token).
         """
-        url = f"https://store-backend.digimobil.es/v1/preorders/{self.proxies[self.position]['preorder']}/products/{self.proxies[self.position]['product']}"
+        url = f"{STORE_BACKEND_URL}/v1/preorders/{self.proxies[self.position]['preorder']}/products/{self.proxies[self.position]['product']}"
 
         payload = {
             "actionType": "portability",
@@ -462,7 +453,7 @@ class DigiPhone:
         session = self.proxies[self.position]["session"]
         
         # Paso 1: Obtener cookies de la página principal
-        main_url = "https://www.digimobil.es/"
+        main_url = HOME_URL
         headers_get = {
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36 Edg/142.0.0.0",
             "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
@@ -487,7 +478,7 @@ class DigiPhone:
             return {"_info": {"status": 500}, "_error": f"Error obteniendo cookies previas: {str(e)}"}
         
         # Paso 2: POST a /v2/login/online para obtener store_access_token
-        login_url = "https://store-backend.digimobil.es/v2/login/online"
+        login_url = f"{STORE_BACKEND_URL}/v2/login/online"
         headers_post = {
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36 Edg/142.0.0.0",
             "accept": "*/*",
@@ -512,6 +503,7 @@ class DigiPhone:
             # Verificar si se obtuvo la cookie store_access_token
             if 'store_access_token' in session.cookies:
                 store_token = session.cookies.get('store_access_token')
+                self._track_token_expiry(session)
                 logging.info(f"[login_with_cookies] ✓ Cookie store_access_token obtenida: {store_token[:50]}...")
                 return {"_info": {"status": 200}, "_result": {"store_access_token": store_token}}
             else:
@@ -526,7 +518,7 @@ class DigiPhone:
     
     # Get token (método antiguo, mantener por compatibilidad pero ya no se usa)
     def login(self):
-        url = "https://store-backend.digimobil.es/v1/users/login"
+        url = f"{STORE_BACKEND_URL}/v1/users/login"
         payload = {}
         headers = {}
         proxy = self.proxies[self.position]["proxy"]
@@ -544,7 +536,7 @@ class DigiPhone:
         Crea un preorder usando cookies (store_access_token) en lugar de Bearer token.
         Estructura exacta como en el navegador.
         """
-        url = "https://store-backend.digimobil.es/v1/preorders"
+        url = f"{STORE_BACKEND_URL}/v1/preorders"
         headers = {
             'accept': '*/*',
             'accept-language': 'es-ES,es;q=0.9',
@@ -615,7 +607,7 @@ class DigiPhone:
         """
         Obtiene configuración usando cookies (store_access_token).
         """
-        url = f"https://store-backend.digimobil.es/v1/preorders/{self.proxies[self.position]['preorder']}/config"
+        url = f"{STORE_BACKEND_URL}/v1/preorders/{self.proxies[self.position]['preorder']}/config"
         payload = {
             "products": [
                 {
@@ -37,6 +37,10 @@ class DigiPhoneWithRotation(DigiPhone):
     def _set_proxy_index(self, index):
         """Establece el índice del proxy de forma segura"""
         self.index_proxy = index
+
+    def _proxy_id(self, index):
+        """proxy_id estable (ip:puerto:usuario) del proxy, el mismo que usan DigiPhone y AsyncDigiPhone"""
+        return self.proxies[index]["proxy_id"]
     
     def _rotate_to_best_proxy(self):
         """Rota al mejor proxy disponible según métricas"""
@@ -48,7 +52,7 @@ class DigiPhoneWithRotation(DigiPhone):
         current_index = self._get_current_proxy_index()
         
         # Obtener mejor proxy
-        best_index = self.rotator.get_best_proxy_index(self._len_proxy)
+        best_index = self.rotator.get_best_proxy_index([p["proxy_id"] for p in self.proxies])
         
         if best_index != current_index:
             logger.info(f"🔄 Proxy rotado: {current_index} → {best_index}")
@@ -116,7 +120,7 @@ class DigiPhoneWithRotation(DigiPhone):
                     
                     # Blacklist del proxy actual
                     current_index = self._get_current_proxy_index()
-                    proxy_id = f"proxy_{current_index}"
+                    proxy_id = self._proxy_id(current_index)
                     self.rotator.add_to_blacklist(proxy_id, reason="access_failed")
                     
                     if attempt < max_attempts - 1:
@@ -129,7 +133,7 @@ class DigiPhoneWithRotation(DigiPhone):
                 
                 # Blacklist del proxy actual
                 current_index = self._get_current_proxy_index()
-                proxy_id = f"proxy_{current_index}"
+                proxy_id = self._proxy_id(current_index)
                 self.rotator.add_to_blacklist(proxy_id, reason=f"error: {type(e).__name__}")
                 
                 if attempt < max_attempts - 1:
@@ -170,7 +174,7 @@ class DigiPhoneWithRotation(DigiPhone):
                         logger.warning(f"⚠️ Status inesperado: {status_code}")
                         
                         # Blacklist del proxy
-                        proxy_id = f"proxy_{current_index}"
+                        proxy_id = self._proxy_id(current_index)
                         self.rotator.add_to_blacklist(proxy_id, reason=f"status_{status_code}")
                 else:
                     last_error = "Formato de respuesta inválido"
@@ -193,7 +197,7 @@ class DigiPhoneWithRotation(DigiPhone):
                 
                 # Blacklist del proxy
                 current_index = self._get_current_proxy_index()
-                proxy_id = f"proxy_{current_index}"
+                proxy_id = self._proxy_id(current_index)
                 self.rotator.add_to_blacklist(proxy_id, reason=f"exception: {type(e).__name__}")
                 
                 if attempt < max_attempts - 1:
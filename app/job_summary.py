@@ -0,0 +1,210 @@
+"""
+Resumen de archivos por usuario (filter_data) precalculado en Redis.
+
+El resumen (estado, porcentaje, etc. de cada Consecutive del usuario) se
+calcula una vez y queda en Redis junto con una versión. Los cambios de un
+archivo existente (flush de progreso, sincronización, save) se aplican sobre
+el resumen cacheado con update() y suben la versión: los polls durante el
+procesamiento siguen saliendo de Redis. Solo el alta o el borrado de un
+archivo invalidan el resumen, que el siguiente poll reconstruye con una
+sola consulta. Un poll con If-None-Match igual a la versión actual se
+responde con 304 usando solo Redis.
+
+Claves (base de datos del caché, ver settings.CACHES):
+- summary:version:<user_id> → versión actual del resumen
+- summary:data:<user_id>    → JSON {"version": n, "rows": [...]}
+- summary:users             → hash username → user_id
+
+Archivo: app/job_summary.py
+"""
+import hashlib
+import json
+import logging
+import time
+
+from django_redis import get_redis_connection
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+VERSION_PREFIX = "summary:version:"
+DATA_PREFIX = "summary:data:"
+USERS_KEY = "summary:users"
+
+# Un resumen sin polls se libera solo
+SUMMARY_TTL = 60 * 60
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def status_of(progres, total, active):
+    """(status, status_display) de un archivo."""
+    if progres >= total:
+        return 'completed', 'Completado'
+    if active:
+        return 'processing', 'Procesando'
+    if progres > 0:
+        return 'paused', 'Pausado'
+    return 'pending', 'Pendiente'
+
+
+def _set_progress_fields(row):
+    """Recalcula status, status_display y progress_percentage de una fila."""
+    row["status"], row["status_display"] = status_of(row["progres"], row["total"], row["active"])
+    row["progress_percentage"] = round((row["progres"] / row["total"] * 100), 2) if row["total"] > 0 else 0
+
+
+def etag(username, version):
+    digest = hashlib.md5(str(username).encode()).hexdigest()[:8]
+    return f'"{digest}-{version}"'
+
+
+def _current_version(r, user_id):
+    key = f"{VERSION_PREFIX}{user_id}"
+    version = r.get(key)
+    if version is None:
+        # Arranca en un valor nuevo si la clave se perdió (nunca repite un ETag viejo)
+        r.set(key, int(time.time() * 1000), nx=True)
+        version = r.get(key)
+    return int(version)
+
+
+def invalidate(*user_ids):
+    """Marca como obsoleto el resumen de estos usuarios."""
+    user_ids = {u for u in user_ids if u}
+    if not user_ids:
+        return
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(f"{VERSION_PREFIX}{user_id}")
+            pipe.delete(f"{DATA_PREFIX}{user_id}")
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[job_summary] No se pudo invalidar el resumen de {user_ids}: {e}")
+
+
+# Campos de un archivo que update() puede cambiar en el resumen
+UPDATABLE_FIELDS = ("file", "total", "progres", "finish", "active")
+
+
+def update(user_id, files):
+    """
+    Aplica en el resumen cacheado los cambios de archivos ya existentes y sube
+    la versión, sin tirar el resumen (WATCH/MULTI sobre la versión y los datos).
+    Si el resumen no está en caché o no tiene alguno de los archivos, se
+    invalida como antes.
+
+    Args:
+        user_id: dueño de los archivos
+        files: lista de dicts con "id" y los campos que cambiaron
+               (file, total, progres, finish, active)
+    """
+    if not user_id or not files:
+        return
+    from redis.exceptions import WatchError
+
+    version_key = f"{VERSION_PREFIX}{user_id}"
+    data_key = f"{DATA_PREFIX}{user_id}"
+    try:
+        with _redis().pipeline() as pipe:
+            for _ in range(3):
+                try:
+                    pipe.watch(version_key, data_key)
+                    cached, version = pipe.get(data_key), pipe.get(version_key)
+                    if cached is None or version is None:
+                        break
+                    data = json.loads(cached)
+                    if data["version"] != int(version):
+                        break
+                    rows = {row["id"]: row for row in data["rows"]}
+                    if any(f["id"] not in rows for f in files):
+                        break
+                    for f in json.loads(json.dumps(files, cls=JSONEncoder)):
+                        row = rows[f["id"]]
+                        row.update({k: f[k] for k in UPDATABLE_FIELDS if k in f})
+                        _set_progress_fields(row)
+                    data["version"] = int(version) + 1
+                    pipe.multi()
+                    pipe.incr(version_key)
+                    pipe.set(data_key, json.dumps(data), ex=SUMMARY_TTL)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+    except Exception as e:
+        logger.warning(f"[job_summary] No se pudo actualizar el resumen de {user_id}: {e}")
+    invalidate(user_id)
+
+
+def cached_version(username):
+    """
+    Versión actual del resumen de username solo con Redis.
+
+    Returns:
+        int | None: None si el usuario todavía no tiene resumen
+    """
+    try:
+        r = _redis()
+        user_id = r.hget(USERS_KEY, username)
+        if user_id is None:
+            return None
+        version = r.get(f"{VERSION_PREFIX}{int(user_id)}")
+        return int(version) if version is not None else None
+    except Exception:
+        return None
+
+
+def _build_rows(user):
+    from .models import Consecutive
+
+    rows = []
+    for c in Consecutive.objects.filter(user=user).order_by("-id").values(
+        "id", "file", "total", "progres", "num", "created", "finish", "active"
+    ):
+        row = {
+            "id": c["id"],
+            "file": c["file"],
+            "total": c["total"],
+            "progres": c["progres"],
+            "conse": c["num"],
+            "created": c["created"],
+            "finish": c["finish"],
+            "active": c["active"],
+        }
+        _set_progress_fields(row)
+        rows.append(row)
+    return rows
+
+
+def get(user):
+    """
+    Resumen del usuario: el de Redis si está al día, si no se reconstruye.
+
+    Returns:
+        tuple: (version, rows)
+    """
+    try:
+        r = _redis()
+        version = _current_version(r, user.id)
+        cached = r.get(f"{DATA_PREFIX}{user.id}")
+        if cached is not None:
+            data = json.loads(cached)
+            if data["version"] == version:
+                return version, data["rows"]
+    except Exception as e:
+        logger.warning(f"[job_summary] Redis no disponible, resumen desde la BD ({user.username}): {e}")
+        return None, _build_rows(user)
+
+    # Leer la versión ANTES de la BD: un cambio durante la consulta deja el resumen obsoleto
+    rows = json.loads(json.dumps(_build_rows(user), cls=JSONEncoder))
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.set(f"{DATA_PREFIX}{user.id}", json.dumps({"version": version, "rows": rows}), ex=SUMMARY_TTL)
+        pipe.hset(USERS_KEY, user.username, user.id)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[job_summary] No se pudo guardar el resumen de {user.username}: {e}")
+    return version, rows
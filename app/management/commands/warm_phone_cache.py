@@ -0,0 +1,41 @@
+"""
+Carga el caché de números (phone:{numero}) desde la BD.
+
+Uso:
+    python manage.py warm_phone_cache            # solo si no está cargado
+    python manage.py warm_phone_cache --force    # recargar
+    python manage.py warm_phone_cache --async    # encolar en Celery (cola maintenance)
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Carga el caché Redis de números de los últimos 30 días"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Recargar aunque el caché ya esté marcado como cargado")
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help="Filas por lote al leer la BD y escribir en Redis")
+        parser.add_argument('--async', action='store_true', dest='run_async',
+                            help="Encolar la carga en Celery en lugar de ejecutarla aquí")
+
+    def handle(self, *args, **options):
+        if options['run_async']:
+            from app.tasks import warm_phone_cache_task
+            result = warm_phone_cache_task.apply_async(kwargs={'force': options['force']}, queue='maintenance')
+            self.stdout.write(f"Carga encolada (task_id: {result.id})")
+            return
+
+        from app.signals import WARM_CHUNK_SIZE, load_phone_cache
+
+        total = load_phone_cache(
+            force=options['force'],
+            chunk_size=options['chunk_size'] or WARM_CHUNK_SIZE
+        )
+        if total is None:
+            if options['force']:
+                raise CommandError("No se cargó el caché (otro proceso lo está cargando o hubo un error, ver logs)")
+            self.stdout.write("Caché ya cargado o en carga por otro proceso (use --force para recargar)")
+            return
+        self.stdout.write(self.style.SUCCESS(f"✅ Caché cargado: {total:,} números"))
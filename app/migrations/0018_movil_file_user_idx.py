@@ -0,0 +1,14 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Antes creaba movil_file_user_idx (file, user). 0019 agrega el índice único
+    # (user, file, number), que ya cubre los filtros por user+file, así que el
+    # índice no se construye; 0019 lo elimina donde esta migración ya se aplicó.
+
+    dependencies = [
+        ('app', '0017_alter_consecutive_finish_alter_consecutive_table'),
+    ]
+
+    operations = []
@@ -0,0 +1,86 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import IntegrityError, migrations, models
+
+
+UNIQUE_NAME = 'movil_user_file_number_uniq'
+
+# Duplicados (user, file, number): se conserva el registro más antiguo. Una sola
+# pasada ordenada por (user_id, file, number), sin auto-join sobre app_movil
+DELETE_DUPLICATES = """
+    DELETE FROM app_movil
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, file, number ORDER BY id) AS rn
+            FROM app_movil
+        ) ranked
+        WHERE rn > 1
+    );
+"""
+
+
+def add_unique_constraint(apps, schema_editor):
+    """
+    Índice único concurrente promovido a constraint (sin bloqueo largo de la tabla).
+
+    Los workers pueden seguir insertando duplicados entre el DELETE y el
+    CREATE INDEX; si el índice falla por eso queda INVALID, se borra y se
+    vuelve a intentar. Se puede re-ejecutar tras una falla a medias.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", [UNIQUE_NAME])
+        if cursor.fetchone():
+            return
+
+    for attempt in range(1, 4):
+        schema_editor.execute(DELETE_DUPLICATES)
+        # Restos INVALID de un intento anterior (IF NOT EXISTS los daría por buenos)
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {UNIQUE_NAME};")
+        try:
+            schema_editor.execute(
+                f"CREATE UNIQUE INDEX CONCURRENTLY {UNIQUE_NAME} ON app_movil (user_id, file, number);"
+            )
+            break
+        except IntegrityError:
+            if attempt == 3:
+                raise
+    schema_editor.execute(
+        f"ALTER TABLE app_movil ADD CONSTRAINT {UNIQUE_NAME} UNIQUE USING INDEX {UNIQUE_NAME};"
+    )
+
+
+def remove_unique_constraint(apps, schema_editor):
+    schema_editor.execute(f"ALTER TABLE app_movil DROP CONSTRAINT IF EXISTS {UNIQUE_NAME};")
+
+
+class Migration(migrations.Migration):
+
+    # Los índices se crean con CONCURRENTLY para no bloquear escrituras en app_movil
+    atomic = False
+
+    dependencies = [
+        ('app', '0018_movil_file_user_idx'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_unique_constraint, remove_unique_constraint),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='movil',
+                    constraint=models.UniqueConstraint(fields=('user', 'file', 'number'), name=UNIQUE_NAME),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name='movil',
+            index=models.Index(fields=['number', '-fecha_hora'], include=['operator'], name='movil_number_fecha_op_idx'),
+        ),
+        # El índice único (user, file, number) ya cubre los filtros por user+file:
+        # borrar movil_file_user_idx donde la versión anterior de 0018 lo creó
+        migrations.RunSQL(
+            sql="DROP INDEX CONCURRENTLY IF EXISTS movil_file_user_idx;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('app', '0019_movil_unique_and_covering_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='movil',
+            index=models.Index(fields=['user', 'file', 'id'], include=['number', 'operator'], name='movil_user_file_id_idx'),
+        ),
+    ]
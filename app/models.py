@@ -60,7 +60,15 @@ class Movil(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=['number']),  # Solo índice en 'number'
+            models.Index(fields=['number']),
+            # Búsqueda del último operador por número (check_scraping_in_cache_and_db), solo índice
+            models.Index(fields=['number', '-fecha_hora'], include=['operator'], name='movil_number_fecha_op_idx'),
+            # Paginación por cursor de consult (user+file, orden por id)
+            models.Index(fields=['user', 'file', 'id'], include=['number', 'operator'], name='movil_user_file_id_idx'),
+        ]
+        constraints = [
+            # Un número por archivo y usuario; también sirve los filtros por user+file
+            models.UniqueConstraint(fields=['user', 'file', 'number'], name='movil_user_file_number_uniq'),
         ]
 
     def __str__(self) -> str:
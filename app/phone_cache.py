@@ -0,0 +1,612 @@
+"""
+Caché de números → operador en dos niveles.
+
+- L1: en memoria del proceso, acotado (LRU + TTL) y compacto: los números se
+  guardan como int y los operadores como id de una tabla interna, así que un
+  número repetido se resuelve en microsegundos sin ir a la red.
+- L2: Redis, con uno de dos formatos (settings.PHONE_CACHE_LAYOUT):
+    * 'keys':    una clave phone:{numero} por número (valor pickle del operador)
+    * 'buckets': hashes pc:b:{prefijo} con campo = últimos dígitos y valor =
+                 id de operador + día de la consulta; hashes pequeños que
+                 Redis guarda como listpack (varias veces menos memoria)
+
+Caché negativo: los números que fallan al consultar a DIGI se marcan con un
+contador de fallos (phone_fail:{numero}) y una pausa (phone_skip:{numero})
+que crece exponencialmente con cada fallo. Mientras la pausa existe
+process_file_in_batches no vuelve a encolar el número.
+
+Consultas en curso (singleflight): antes de consultar a DIGI una tarea toma
+la marca phone_pending:{numero} (SET NX con lease). Otra tarea que necesite
+el mismo número (otro archivo u otro usuario) espera el resultado en el
+caché en lugar de repetir la consulta; si la marca desaparece sin resultado
+(la tarea líder murió o falló) toma el relevo.
+
+Cuando un proceso escribe un número publica su invalidación en el canal
+phone_cache:invalidate; los demás procesos la reciben (hilo suscriptor) y
+descartan esa entrada de su L1. El TTL del L1 acota la desactualización si
+se pierde algún mensaje.
+
+Uso:
+    from app import phone_cache
+    operator = phone_cache.lookup("612345678")        # None si no está
+    found = phone_cache.lookup_many(numbers)          # {numero: operador}
+    phone_cache.store_many({"612345678": "Movistar"})
+
+Archivo: app/phone_cache.py
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from time import monotonic, sleep, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "phone:"
+INVALIDATION_CHANNEL = "phone_cache:invalidate"
+DEFAULT_TIMEOUT = 60 * 60 * 24 * 30  # 30 días
+
+PENDING_PREFIX = "phone_pending:"
+FAIL_PREFIX = "phone_fail:"
+SKIP_PREFIX = "phone_skip:"
+
+BUCKET_PREFIX = "pc:b:"
+OPERATORS_KEY = "pc:operators"            # hash nombre → id
+OPERATOR_NAMES_KEY = "pc:operator_names"  # hash id → nombre
+OPERATOR_SEQ_KEY = "pc:operators:seq"
+
+
+def _compact(number):
+    """Número como int cuando es seguro (sin ceros a la izquierda), si no como str."""
+    if number.isdigit() and number[0] != "0":
+        return int(number)
+    return number
+
+
+class LocalPhoneCache:
+    """L1 en memoria: LRU acotado con TTL y operadores internados"""
+
+    def __init__(self, max_entries=200000, ttl=300):
+        """
+        Args:
+            max_entries: Números que se conservan como máximo (LRU)
+            ttl: Segundos que una entrada es válida sin revalidar en Redis
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # {numero_compacto: (operator_id, expira_en)}
+        self._entries = OrderedDict()
+        self._operators = []
+        self._operator_ids = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _operator_id(self, operator):
+        operator_id = self._operator_ids.get(operator)
+        if operator_id is None:
+            operator_id = len(self._operators)
+            self._operators.append(operator)
+            self._operator_ids[operator] = operator_id
+        return operator_id
+
+    def get(self, number):
+        key = _compact(number)
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._operators[entry[0]]
+
+    def set_many(self, numbers_operators):
+        expires = monotonic() + self.ttl
+        with self._lock:
+            for number, operator in numbers_operators.items():
+                key = _compact(number)
+                self._entries[key] = (self._operator_id(operator), expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, numbers):
+        with self._lock:
+            for number in numbers:
+                self._entries.pop(_compact(number), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "operators": len(self._operators),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total * 100, 2) if total else 0,
+            }
+
+
+class _InvalidationListener:
+    """Hilo que aplica al L1 las invalidaciones publicadas por otros procesos"""
+
+    def __init__(self, local):
+        self.local = local
+        self.token = uuid.uuid4().hex
+        self.pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="phone-cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = get_redis_connection("default").pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Mensajes perdidos mientras no estábamos suscritos: empezar de cero
+                self.local.clear()
+                for message in pubsub.listen():
+                    data = message.get("data")
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    if not isinstance(data, str):
+                        continue
+                    sender, _, numbers = data.partition("|")
+                    if sender != self.token and numbers:
+                        self.local.invalidate(numbers.split(","))
+            except Exception as e:
+                logger.warning(f"[phone_cache] Suscripción de invalidación caída, reintentando: {e}")
+                sleep(5)
+
+
+class KeysLayout:
+    """Formato clásico: una clave phone:{numero} por número (via django cache)"""
+
+    def get_many(self, numbers):
+        cached = cache.get_many([f"{KEY_PREFIX}{n}" for n in numbers])
+        return {
+            key[len(KEY_PREFIX):]: operator
+            for key, operator in cached.items() if operator is not None
+        }
+
+    def set_many(self, numbers_operators, timeout):
+        cache.set_many(
+            {f"{KEY_PREFIX}{number}": operator for number, operator in numbers_operators.items()},
+            timeout=timeout
+        )
+
+    def set_rows(self, rows, now, window):
+        """
+        Carga masiva de (numero, operador, fecha_hora): el TTL de cada clave es
+        lo que le queda al registro dentro de la ventana.
+        """
+        client = cache.client
+        pipe = client.get_client(write=True).pipeline(transaction=False)
+        for number, operator, fecha_hora in rows:
+            ttl = int(window - (now - fecha_hora).total_seconds())
+            if ttl > 0:
+                client.set(f"{KEY_PREFIX}{number}", operator, timeout=ttl, client=pipe)
+        pipe.execute()
+
+
+# Asigna el id de un operador y escribe ambos sentidos del mapeo de una vez:
+# un lector nunca ve un id sin su nombre.
+_OPERATOR_ID_SCRIPT = """
+local existing = redis.call('hget', KEYS[1], ARGV[1])
+if existing then
+    return tonumber(existing)
+end
+local new_id = redis.call('incr', KEYS[3])
+redis.call('hset', KEYS[1], ARGV[1], new_id)
+redis.call('hset', KEYS[2], new_id, ARGV[1])
+return new_id
+"""
+
+
+class BucketLayout:
+    """
+    Formato compacto: números agrupados en hashes por prefijo.
+
+    pc:b:6123456 → {"78": "3:20380", ...}
+      campo = últimos suffix_digits dígitos, valor = id_operador:día (días desde 1970)
+
+    Con suffix_digits=2 cada hash tiene como máximo 100 campos, por debajo de
+    hash-max-listpack-entries (128 por defecto). Las entradas más antiguas que
+    retention_days se ignoran al leer; el hash completo caduca si no recibe
+    escrituras durante ese tiempo.
+    """
+
+    def __init__(self, suffix_digits=2, retention_days=90):
+        self.suffix_digits = suffix_digits
+        self.retention_days = retention_days
+        self._ids = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _redis():
+        return get_redis_connection("default")
+
+    def _split(self, number):
+        return f"{BUCKET_PREFIX}{number[:-self.suffix_digits]}", number[-self.suffix_digits:]
+
+    @staticmethod
+    def _today():
+        return int(time() // 86400)
+
+    def _operator_id(self, r, operator):
+        operator_id = self._ids.get(operator)
+        if operator_id is not None:
+            return operator_id
+        operator_id = int(r.eval(
+            _OPERATOR_ID_SCRIPT, 3, OPERATORS_KEY, OPERATOR_NAMES_KEY, OPERATOR_SEQ_KEY, operator
+        ))
+        with self._lock:
+            self._ids[operator] = operator_id
+            self._names[operator_id] = operator
+        return operator_id
+
+    def _operator_name(self, r, operator_id):
+        """Nombre del operador, o None si el id no tiene nombre (se trata como fallo de caché)."""
+        name = self._names.get(operator_id)
+        if name is None:
+            names = {int(k): v.decode() for k, v in r.hgetall(OPERATOR_NAMES_KEY).items() if v}
+            with self._lock:
+                self._names.update(names)
+                self._ids.update({v: k for k, v in names.items()})
+            name = self._names.get(operator_id)
+        return name
+
+    def get_many(self, numbers):
+        candidates = [n for n in numbers if len(n) > self.suffix_digits]
+        if not candidates:
+            return {}
+        r = self._redis()
+        pipe = r.pipeline(transaction=False)
+        for number in candidates:
+            pipe.hget(*self._split(number))
+        values = pipe.execute()
+
+        oldest = self._today() - self.retention_days
+        found = {}
+        for number, value in zip(candidates, values):
+            if value is None:
+                continue
+            operator_id, _, day = value.decode().partition(":")
+            if not operator_id.isdigit() or (day and int(day) < oldest):
+                continue
+            operator = self._operator_name(r, int(operator_id))
+            if operator is not None:
+                found[number] = operator
+        return found
+
+    def _write(self, entries):
+        # entries: [(numero, operador, día)]
+        r = self._redis()
+        pipe = r.pipeline(transaction=False)
+        buckets = set()
+        for number, operator, day in entries:
+            if len(number) <= self.suffix_digits:
+                continue
+            bucket, field = self._split(number)
+            pipe.hset(bucket, field, f"{self._operator_id(r, operator)}:{day}")
+            buckets.add(bucket)
+        for bucket in buckets:
+            pipe.expire(bucket, self.retention_days * 86400)
+        pipe.execute()
+
+    def set_many(self, numbers_operators, timeout):
+        today = self._today()
+        self._write([(number, operator, today) for number, operator in numbers_operators.items()])
+
+    def set_rows(self, rows, now, window):
+        self._write([
+            (number, operator, int(fecha_hora.timestamp() // 86400))
+            for number, operator, fecha_hora in rows
+        ])
+
+
+_layout = None
+
+
+def get_layout():
+    """Formato de almacenamiento en Redis según settings.PHONE_CACHE_LAYOUT"""
+    global _layout
+    if _layout is None:
+        if getattr(settings, "PHONE_CACHE_LAYOUT", "keys") == "buckets":
+            _layout = BucketLayout(
+                suffix_digits=getattr(settings, "PHONE_CACHE_BUCKET_SUFFIX_DIGITS", 2),
+                retention_days=getattr(settings, "PHONE_CACHE_BUCKET_RETENTION_DAYS", 90),
+            )
+        else:
+            _layout = KeysLayout()
+    return _layout
+
+
+_local = None
+_listener = None
+_init_lock = threading.Lock()
+
+
+def get_local_cache():
+    """
+    Obtiene el L1 del proceso (None si está deshabilitado con PHONE_CACHE_L1_SIZE=0).
+    Tras un fork (workers prefork) se crea un L1 y un suscriptor nuevos.
+    """
+    global _local, _listener
+    if _listener is not None and _listener.pid == os.getpid():
+        return _local
+    max_entries = getattr(settings, "PHONE_CACHE_L1_SIZE", 200000)
+    if not max_entries:
+        return None
+    with _init_lock:
+        if _listener is None or _listener.pid != os.getpid():
+            _local = LocalPhoneCache(
+                max_entries=max_entries,
+                ttl=getattr(settings, "PHONE_CACHE_L1_TTL", 300),
+            )
+            _listener = _InvalidationListener(_local)
+    return _local
+
+
+def _publish_invalidation(numbers):
+    try:
+        token = _listener.token if _listener is not None else ""
+        get_redis_connection("default").publish(INVALIDATION_CHANNEL, f"{token}|{','.join(numbers)}")
+    except Exception as e:
+        logger.debug(f"[phone_cache] No se pudo publicar invalidación: {e}")
+
+
+def lookup_many(numbers):
+    """
+    Resuelve varios números: primero L1, los faltantes con un solo round trip a Redis.
+
+    Returns:
+        dict: {numero: operador} solo con los encontrados
+    """
+    local = get_local_cache()
+    found = {}
+    missing = []
+    for number in numbers:
+        operator = local.get(number) if local is not None else None
+        if operator is not None:
+            found[number] = operator
+        else:
+            missing.append(number)
+
+    if missing:
+        from_redis = get_layout().get_many(missing)
+        if local is not None and from_redis:
+            local.set_many(from_redis)
+        found.update(from_redis)
+    return found
+
+
+def lookup(number):
+    """Operador de un número (L1 → Redis), o None si no está en caché."""
+    return lookup_many([number]).get(number)
+
+
+def store_many(numbers_operators, timeout=DEFAULT_TIMEOUT):
+    """Guarda varios números en Redis (un pipeline), en el L1 e invalida el resto de procesos."""
+    if not numbers_operators:
+        return
+    get_layout().set_many(numbers_operators, timeout)
+    clear_failures(list(numbers_operators))
+    local = get_local_cache()
+    if local is not None:
+        local.set_many(numbers_operators)
+    _publish_invalidation(list(numbers_operators))
+
+
+def store(number, operator, timeout=DEFAULT_TIMEOUT):
+    """Guarda un número (ver store_many)."""
+    store_many({number: operator}, timeout=timeout)
+
+
+def store_rows(rows, now, window=DEFAULT_TIMEOUT):
+    """
+    Carga masiva desde la BD (carga inicial): rows = [(numero, operador, fecha_hora)].
+    No publica invalidaciones; el TTL del L1 absorbe la diferencia.
+    """
+    if rows:
+        get_layout().set_rows(rows, now, window)
+
+
+def _backoff_seconds(failures):
+    base = getattr(settings, "NEGATIVE_CACHE_BASE_TTL", 600)
+    maximum = getattr(settings, "NEGATIVE_CACHE_MAX_TTL", 60 * 60 * 24)
+    return min(base * 2 ** (failures - 1), maximum)
+
+
+def record_failures(numbers):
+    """
+    Registra que estos números no se pudieron consultar: incrementa su contador
+    de fallos y los pausa base * 2^(fallos-1) segundos (hasta el máximo).
+    """
+    if not numbers:
+        return
+    try:
+        r = get_redis_connection("default")
+        # El contador vive más que la pausa más larga para que el backoff siga creciendo
+        counter_ttl = getattr(settings, "NEGATIVE_CACHE_MAX_TTL", 60 * 60 * 24) * 4
+        pipe = r.pipeline(transaction=False)
+        for number in numbers:
+            pipe.incr(f"{FAIL_PREFIX}{number}")
+            pipe.expire(f"{FAIL_PREFIX}{number}", counter_ttl)
+        failures = pipe.execute()[::2]
+
+        pipe = r.pipeline(transaction=False)
+        for number, count in zip(numbers, failures):
+            pipe.set(f"{SKIP_PREFIX}{number}", count, ex=_backoff_seconds(count))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[phone_cache] No se pudieron registrar {len(numbers)} fallos: {e}")
+
+
+def clear_failures(numbers):
+    """Olvida los fallos de estos números (se resolvieron correctamente)."""
+    if not numbers:
+        return
+    try:
+        get_redis_connection("default").delete(
+            *[f"{FAIL_PREFIX}{n}" for n in numbers],
+            *[f"{SKIP_PREFIX}{n}" for n in numbers]
+        )
+    except Exception as e:
+        logger.debug(f"[phone_cache] No se pudieron limpiar fallos: {e}")
+
+
+def backed_off(numbers):
+    """
+    Números que están en pausa por fallos recientes (un solo round trip).
+
+    Returns:
+        set: números que no deben consultarse todavía
+    """
+    if not numbers:
+        return set()
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        for number in numbers:
+            pipe.exists(f"{SKIP_PREFIX}{number}")
+        return {number for number, paused in zip(numbers, pipe.execute()) if paused}
+    except Exception as e:
+        logger.warning(f"[phone_cache] No se pudo consultar el caché negativo: {e}")
+        return set()
+
+
+# Libera solo las marcas que siguen siendo nuestras (el lease pudo caducar y otro tomarla)
+_RELEASE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('get', key) == ARGV[1] then
+        redis.call('del', key)
+    end
+end
+return 1
+"""
+
+
+def claim(numbers, lease=None):
+    """
+    Intenta tomar la consulta en curso de cada número (SET NX EX).
+
+    Returns:
+        tuple: (token para release(), set de números tomados por esta tarea)
+    """
+    token = uuid.uuid4().hex
+    if not numbers:
+        return token, set()
+    lease = lease or getattr(settings, "SINGLEFLIGHT_LEASE", 120)
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        for number in numbers:
+            pipe.set(f"{PENDING_PREFIX}{number}", token, nx=True, ex=lease)
+        return token, {number for number, ok in zip(numbers, pipe.execute()) if ok}
+    except Exception as e:
+        # Sin Redis no hay coordinación: cada tarea consulta lo suyo
+        logger.warning(f"[phone_cache] No se pudo marcar consultas en curso: {e}")
+        return token, set(numbers)
+
+
+def release(token, numbers):
+    """Libera las marcas de consulta en curso tomadas con claim()."""
+    if not numbers:
+        return
+    try:
+        r = get_redis_connection("default")
+        r.eval(_RELEASE_SCRIPT, len(numbers), *[f"{PENDING_PREFIX}{n}" for n in numbers], token)
+    except Exception as e:
+        logger.debug(f"[phone_cache] No se pudieron liberar marcas en curso: {e}")
+
+
+# Renueva solo las marcas que siguen siendo nuestras
+_EXTEND_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('get', key) == ARGV[1] then
+        redis.call('expire', key, ARGV[2])
+    end
+end
+return 1
+"""
+
+
+def extend(token, numbers, lease=None):
+    """Renueva el lease de las marcas tomadas con claim() (consultas largas)."""
+    if not numbers:
+        return
+    lease = lease or getattr(settings, "SINGLEFLIGHT_LEASE", 120)
+    try:
+        r = get_redis_connection("default")
+        r.eval(_EXTEND_SCRIPT, len(numbers), *[f"{PENDING_PREFIX}{n}" for n in numbers], token, lease)
+    except Exception as e:
+        logger.debug(f"[phone_cache] No se pudieron renovar marcas en curso: {e}")
+
+
+def wait_for_results(numbers, timeout=None):
+    """
+    Espera el resultado de números que otra tarea está consultando.
+
+    En lugar de sondear, escucha el canal de invalidación (store_many publica
+    ahí cada resultado) y una vez por segundo comprueba si a los restantes les
+    queda marca en curso (el líder terminó sin resultado o murió). La espera
+    máxima (SINGLEFLIGHT_WAIT) es corta a propósito, muy por debajo del lease:
+    un seguidor ocupa un slot del worker, así que lo que siga en curso al
+    vencer se devuelve para re-encolarlo en lugar de bloquear.
+
+    Returns:
+        tuple: (dict {numero: operador} resueltos, lista de números sin resultado)
+    """
+    timeout = timeout if timeout is not None else getattr(settings, "SINGLEFLIGHT_WAIT", 10)
+    deadline = monotonic() + timeout
+    found = {}
+    waiting = list(numbers)
+    r = get_redis_connection("default")
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Suscrito antes de la primera lectura: no se pierde un resultado entre ambas
+        pubsub.subscribe(INVALIDATION_CHANNEL)
+        while waiting:
+            found.update(lookup_many(waiting))
+            waiting = [n for n in waiting if n not in found]
+            if not waiting or monotonic() >= deadline:
+                break
+            pipe = r.pipeline(transaction=False)
+            for number in waiting:
+                pipe.exists(f"{PENDING_PREFIX}{number}")
+            if not any(pipe.execute()):
+                # Nadie los está consultando ya: última lectura por si el resultado llegó justo
+                found.update(lookup_many(waiting))
+                waiting = [n for n in waiting if n not in found]
+                break
+            _wait_for_publication(pubsub, set(waiting), min(1.0, deadline - monotonic()))
+    finally:
+        pubsub.close()
+    return found, waiting
+
+
+def _wait_for_publication(pubsub, numbers, timeout):
+    """Bloquea hasta que se publique alguno de los números o pase timeout."""
+    deadline = monotonic() + timeout
+    while True:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return
+        message = pubsub.get_message(timeout=remaining)
+        data = message.get("data") if message else None
+        if isinstance(data, bytes):
+            data = data.decode()
+        if isinstance(data, str) and numbers.intersection(data.partition("|")[2].split(",")):
+            return
@@ -0,0 +1,221 @@
+"""
+Contador de progreso de Consecutive agrupado en Redis.
+
+Cada número resuelto hace un INCRBY sobre un contador Redis del archivo en
+lugar de escribir en Postgres. Un flusher periódico (tarea flush_progress)
+vacía los contadores y los aplica con un único UPDATE progres = progres + n
+por archivo; el auto-completado es un UPDATE condicional, por lo que se
+dispara una sola vez aunque haya varios flushers.
+
+Además publica el progreso en el canal progress:updates (Redis pub/sub) para
+app/progress_stream.py: cada flush publica el estado leído de la BD y cada
+incremento publica base + pendiente, limitado a PROGRESS_PUSH_PER_SECOND
+mensajes por segundo y archivo.
+
+Claves (base de datos del caché, ver settings.CACHES):
+- progress:pending:<consecutive_id>  → incremento aún no aplicado en la BD
+- progress:dirty                     → set de consecutive_id con pendientes
+- progress:base:<consecutive_id>     → progres en la BD (espejo, TTL corto)
+- progress:throttle:<consecutive_id> → marca del último mensaje publicado
+
+Archivo: app/progress.py
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "progress:dirty"
+CHANNEL = "progress:updates"
+
+# El espejo de progres se vuelve a leer de la BD al vencer (corrige desvíos)
+BASE_TTL = 60
+
+
+def _key(consecutive_id):
+    return f"progress:pending:{consecutive_id}"
+
+
+def _base_key(consecutive_id):
+    return f"progress:base:{consecutive_id}"
+
+
+def _throttle_key(consecutive_id):
+    return f"progress:throttle:{consecutive_id}"
+
+
+def _throttle_ms():
+    return int(1000 / max(getattr(settings, "PROGRESS_PUSH_PER_SECOND", 4), 1))
+
+
+# INCRBY + marca de sucio y, si hay espejo de la BD y pasó el intervalo, publica base + pendiente
+_INCREMENT_SCRIPT = """
+local pending = redis.call('incrby', KEYS[1], ARGV[2])
+redis.call('sadd', KEYS[2], ARGV[1])
+local base = redis.call('get', KEYS[3])
+if base and redis.call('set', KEYS[4], 1, 'nx', 'px', ARGV[3]) then
+    redis.call('publish', ARGV[4], '{"id":' .. ARGV[1] .. ',"progres":' .. (tonumber(base) + pending) .. '}')
+end
+return pending
+"""
+
+# Mueve el pendiente al espejo de la BD en un solo paso (base + pendiente no cambia)
+_DRAIN_SCRIPT = """
+redis.call('srem', KEYS[2], ARGV[1])
+local pending = redis.call('get', KEYS[1])
+if pending then
+    redis.call('del', KEYS[1])
+    if redis.call('exists', KEYS[3]) == 1 then
+        redis.call('incrby', KEYS[3], pending)
+    end
+end
+return pending
+"""
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def apply(consecutive_id, increment):
+    """
+    Aplica un incremento directamente en la BD y auto-completa el archivo
+    si llegó al total.
+
+    Returns:
+        dict | None: estado del Consecutive tras el incremento
+                     (progres, total, active, user_id) o None si no existe
+    """
+    from . import job_summary
+    from .models import Consecutive
+
+    updated = Consecutive.objects.filter(id=consecutive_id).update(
+        progres=F('progres') + increment
+    )
+    if not updated:
+        return None
+
+    state = Consecutive.objects.filter(id=consecutive_id).values(
+        'progres', 'total', 'active', 'finish', 'user_id'
+    ).first()
+    if state is None:
+        return None
+
+    # UPDATE condicional: se completa una sola vez aunque haya varios flushers
+    finish = timezone.now()
+    if state['active'] and state['progres'] >= state['total'] and Consecutive.objects.filter(
+        id=consecutive_id,
+        active=True,
+        progres__gte=F('total')
+    ).update(active=False, finish=finish):
+        state['active'] = False
+        state['finish'] = finish
+        logger.info(f"✅ ARCHIVO COMPLETADO: consecutive_id={consecutive_id}")
+
+    # Solo cambia la fila de este archivo: el resumen sigue en Redis
+    job_summary.update(state['user_id'], [{'id': consecutive_id, **state}])
+    _publish(consecutive_id, state)
+    return state
+
+
+def _publish(consecutive_id, state):
+    """Publica el estado leído de la BD y siembra el espejo de progres si falta."""
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.set(_base_key(consecutive_id), state['progres'], nx=True, ex=BASE_TTL)
+        pipe.publish(CHANNEL, json.dumps({
+            "id": consecutive_id,
+            "progres": state['progres'] + pending(consecutive_id),
+            "total": state['total'],
+            "active": state['active'],
+        }))
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"[progress] No se pudo publicar progreso de {consecutive_id}: {e}")
+
+
+def increment(consecutive_id, amount=1):
+    """
+    Suma amount al progreso del archivo (INCRBY en Redis, O(1), sin tocar la BD).
+    Si Redis no está disponible se aplica directamente en la BD.
+    """
+    if amount <= 0:
+        return
+    try:
+        _redis().eval(
+            _INCREMENT_SCRIPT, 4,
+            _key(consecutive_id), DIRTY_KEY, _base_key(consecutive_id), _throttle_key(consecutive_id),
+            consecutive_id, amount, _throttle_ms(), CHANNEL
+        )
+    except Exception as e:
+        logger.warning(f"[progress] Redis no disponible, aplicando progreso en BD ({consecutive_id}): {e}")
+        apply(consecutive_id, amount)
+
+
+def pending(consecutive_id):
+    """Incremento acumulado que aún no llegó a la BD."""
+    try:
+        return int(_redis().get(_key(consecutive_id)) or 0)
+    except Exception:
+        return 0
+
+
+def _drain(r, consecutive_id):
+    # Atómico: un INCRBY concurrente queda en un pendiente nuevo y vuelve a marcar el archivo
+    value = r.eval(_DRAIN_SCRIPT, 3, _key(consecutive_id), DIRTY_KEY, _base_key(consecutive_id), consecutive_id)
+    return int(value or 0)
+
+
+def flush(consecutive_ids=None):
+    """
+    Aplica en la BD los incrementos pendientes (todos los archivos marcados,
+    o solo los indicados).
+
+    Returns:
+        dict: {consecutive_id: incremento aplicado}
+    """
+    r = _redis()
+    if consecutive_ids is None:
+        consecutive_ids = [int(i) for i in r.smembers(DIRTY_KEY)]
+
+    flushed = {}
+    for consecutive_id in consecutive_ids:
+        amount = _drain(r, consecutive_id)
+        if not amount:
+            continue
+        try:
+            if apply(consecutive_id, amount):
+                flushed[consecutive_id] = amount
+            else:
+                logger.warning(f"[progress] Consecutive {consecutive_id} no existe, descartando +{amount}")
+        except Exception as e:
+            # Devolver el incremento para el próximo flush (el espejo ya lo había sumado)
+            resync(consecutive_id)
+            increment(consecutive_id, amount)
+            logger.error(f"[progress] Error aplicando +{amount} a {consecutive_id}: {e}")
+    return flushed
+
+
+def resync(*consecutive_ids):
+    """
+    Olvida el espejo de progres (la BD se modificó fuera de apply()); el
+    próximo flush lo vuelve a leer.
+    """
+    if consecutive_ids:
+        try:
+            _redis().delete(*[_base_key(i) for i in consecutive_ids])
+        except Exception as e:
+            logger.debug(f"[progress] No se pudo resincronizar {consecutive_ids}: {e}")
+
+
+def discard(consecutive_id):
+    """Descarta el progreso pendiente (archivo eliminado o progreso reiniciado)."""
+    pipe = _redis().pipeline(transaction=True)
+    pipe.srem(DIRTY_KEY, consecutive_id)
+    pipe.delete(_key(consecutive_id), _base_key(consecutive_id), _throttle_key(consecutive_id))
+    pipe.execute()
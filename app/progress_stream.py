@@ -0,0 +1,302 @@
+"""
+Progreso en vivo de los archivos por Server-Sent Events (ASGI).
+
+Reemplaza el polling de filter_data/consult mientras un archivo se procesa:
+una conexión larga por pantalla recibe el progreso que app/progress.py
+publica en Redis (canal progress:updates).
+
+    GET /progress/stream/?user=<username>&id=12&id=13
+    GET /progress/stream/?user=<username>&ids=12,13
+    GET /progress/stream/?user=<username>      (archivos activos del usuario)
+
+El llamante se identifica igual que en la API HTTP: con los autenticadores
+de DRF (sesión o Basic) si vienen en la petición y, si no, con el parámetro
+user. Sin identidad se responde 401; con user distinto del autenticado, 403.
+Solo se transmiten archivos del llamante: los id ajenos se ignoran.
+
+Eventos:
+    event: progress
+    data: {"id": 12, "progres": 5400, "total": 10000, "active": true}
+
+Al conectar se envía el estado actual de cada archivo; después solo los
+cambios, agrupados y limitados a PROGRESS_PUSH_PER_SECOND envíos por segundo.
+Cuando todos los archivos terminaron se envía "event: end" y se cierra; si el
+navegador reconecta y ya no queda nada en curso recibe 204 (EventSource deja
+de reintentar).
+
+Cada proceso ASGI mantiene UNA suscripción a Redis y la reparte entre sus
+clientes. Solo funciona bajo un servidor ASGI (hypercorn asgi:application);
+con gunicorn sync (WSGI) la ruta no existe.
+
+Archivo: app/progress_stream.py
+"""
+import asyncio
+import io
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import progress
+
+logger = logging.getLogger(__name__)
+
+PATH = "/progress/stream/"
+
+
+class _Subscriber:
+    """Cliente SSE: últimos cambios pendientes de enviar por archivo"""
+
+    def __init__(self, ids):
+        self.ids = set(ids)
+        self.latest = {}
+        self.event = asyncio.Event()
+
+    def push(self, message):
+        self.latest.setdefault(message["id"], {}).update(message)
+        self.event.set()
+
+    def take(self):
+        latest, self.latest = self.latest, {}
+        self.event.clear()
+        return list(latest.values())
+
+
+class _Hub:
+    """Una suscripción a progress:updates por proceso, repartida a los clientes"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self._task = None
+
+    def subscribe(self, ids):
+        subscriber = _Subscriber(ids)
+        self.subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._listen())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _dispatch(self, data):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        for subscriber in self.subscribers:
+            if message.get("id") in subscriber.ids:
+                subscriber.push(message)
+
+    async def _listen(self):
+        import redis.asyncio as aioredis
+
+        delay = 1
+        while self.subscribers:
+            client = aioredis.from_url(settings.CACHES["default"]["LOCATION"])
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(progress.CHANNEL)
+                delay = 1
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[progress_stream] Suscripción a Redis caída, reintentando en {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                await pubsub.close()
+                await client.close()
+
+
+_hub = None
+
+
+def _get_hub():
+    global _hub
+    if _hub is None:
+        _hub = _Hub()
+    return _hub
+
+
+def _caller(scope, params):
+    """
+    Usuario que abre la conexión, identificado como en la API HTTP.
+
+    Returns:
+        tuple: (User | None, status HTTP si se rechaza o None)
+    """
+    from importlib import import_module
+
+    from django.contrib.auth import get_user
+    from django.contrib.auth.models import User
+    from django.core.handlers.asgi import ASGIRequest
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework.request import Request
+    from rest_framework.settings import api_settings
+
+    close_old_connections()
+    try:
+        django_request = ASGIRequest(scope, io.BytesIO())
+        engine = import_module(settings.SESSION_ENGINE)
+        django_request.session = engine.SessionStore(django_request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        django_request.user = get_user(django_request)
+        request = Request(django_request, authenticators=[
+            auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ])
+        try:
+            authenticated = request.user if request.user.is_authenticated else None
+        except AuthenticationFailed:
+            return None, 401
+
+        username = params.get("user", [None])[0]
+        if authenticated is not None:
+            if username and username != authenticated.username:
+                return None, 403
+            return authenticated, None
+        if not username:
+            return None, 401
+        return User.objects.filter(username=username).first(), None
+    finally:
+        close_old_connections()
+
+
+def _resolve_ids(params, user):
+    """id de archivos del usuario pedidos (id/ids) o, sin ellos, sus archivos activos."""
+    from .models import Consecutive
+
+    if user is None:
+        return []
+    ids = [int(i) for value in params.get("id", []) + params.get("ids", [])
+           for i in value.split(",") if i.strip().isdigit()]
+    files = Consecutive.objects.filter(user=user)
+    files = files.filter(id__in=ids) if ids else files.filter(active=True)
+    close_old_connections()
+    ids = list(files.values_list("id", flat=True))
+    close_old_connections()
+    return ids
+
+
+def _snapshot(ids):
+    from .models import Consecutive
+
+    close_old_connections()
+    rows = [
+        {**row, "progres": row["progres"] + progress.pending(row["id"])}
+        for row in Consecutive.objects.filter(id__in=ids).values("id", "progres", "total", "active")
+    ]
+    close_old_connections()
+    return rows
+
+
+def _finished(state):
+    return bool(state) and all(
+        not s.get("active", True) or s.get("progres", 0) >= s.get("total", float("inf"))
+        for s in state.values()
+    )
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_events(send, messages, event="progress"):
+    body = "".join(f"event: {event}\ndata: {json.dumps(m)}\n\n" for m in messages)
+    await send({"type": "http.response.body", "body": body.encode(), "more_body": True})
+
+
+async def stream(scope, receive, send):
+    """Aplicación ASGI de /progress/stream/."""
+    params = parse_qs(scope.get("query_string", b"").decode())
+    headers = [
+        (b"cache-control", b"no-cache"),
+        (b"access-control-allow-origin", b"*"),
+    ]
+    user, rejected = await sync_to_async(_caller)(scope, params)
+    if rejected:
+        await send({"type": "http.response.start", "status": rejected, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    ids = await sync_to_async(_resolve_ids)(params, user)
+    if not ids:
+        await send({"type": "http.response.start", "status": 204, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    hub = _get_hub()
+    # Suscribir antes de leer el estado: ningún cambio queda entre medio
+    subscriber = hub.subscribe(ids)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        snapshot = await sync_to_async(_snapshot)(ids)
+        state = {row["id"]: row for row in snapshot}
+        if _finished(state):
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": headers + [
+                (b"content-type", b"text/event-stream"),
+                # nginx: no acumular la respuesta
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+        await _send_events(send, snapshot)
+
+        interval = 1 / max(getattr(settings, "PROGRESS_PUSH_PER_SECOND", 4), 1)
+        keepalive = getattr(settings, "PROGRESS_STREAM_KEEPALIVE", 15)
+        while True:
+            changed = asyncio.ensure_future(subscriber.event.wait())
+            done, _ = await asyncio.wait({changed, disconnected}, timeout=keepalive,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                changed.cancel()
+                return
+            if changed not in done:
+                changed.cancel()
+                await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                continue
+
+            messages = subscriber.take()
+            for message in messages:
+                state.setdefault(message["id"], {}).update(message)
+            await _send_events(send, messages)
+            if _finished(state):
+                await _send_events(send, [{"ids": sorted(state)}], event="end")
+                break
+            await asyncio.sleep(interval)
+
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        # Cliente desconectado a mitad de un envío
+        pass
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(subscriber)
+
+
+def route(django_application):
+    """Envuelve la aplicación ASGI de Django y atiende PATH con stream()."""
+
+    async def application(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == PATH:
+            await stream(scope, receive, send)
+        else:
+            await django_application(scope, receive, send)
+
+    return application
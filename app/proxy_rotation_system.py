@@ -2,20 +2,438 @@
 Sistema de Rotación de Proxies para APIMOVIL
 Integrado con DigiPhone existente
 
+El estado de salud de los proxies se comparte entre procesos vía Redis
+(ProxyHealthRegistry).
+
 Archivo: app/proxy_rotation_system.py
 """
 
 import time
+import random
 import requests
-from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# Script Lua: actualiza la latencia EWMA de forma atómica (lectura + escritura)
+_EWMA_SCRIPT = """
+local sample = tonumber(ARGV[1])
+local alpha = tonumber(ARGV[2])
+local ewma = redis.call('HGET', KEYS[1], 'ewma')
+if ewma then
+    ewma = alpha * sample + (1 - alpha) * tonumber(ewma)
+else
+    ewma = sample
+end
+redis.call('HSET', KEYS[1], 'ewma', tostring(ewma))
+return tostring(ewma)
+"""
+
+
+class ProxyHealthRegistry:
+    """
+    Registro de salud de proxies compartido por todos los procesos (Redis).
+
+    Todos los workers Celery y el proceso web ven los mismos contadores, por lo
+    que un proxy caído se descarta en toda la flota dentro de una ventana de
+    fallos en lugar de redescubrirse en cada tarea.
+
+    Claves por proxy_id:
+    - proxy_health:stats:<id>     → hash {ewma, successes, failures, attempts, last_error}
+    - proxy_health:errors:<id>    → hash {ssl, connection, total} (expira tras failure_window)
+    - proxy_health:cooldown:<id>  → motivo del bloqueo (expira tras cooldown)
+    - proxy_health:known          → set con todos los proxy_id vistos
+    """
+
+    KEY_PREFIX = "proxy_health"
+
+    def __init__(self, max_errors=5, failure_window=60, cooldown=300, ewma_alpha=0.3):
+        """
+        Args:
+            max_errors: Errores dentro de la ventana para deshabilitar el proxy (default: 5)
+            failure_window: Ventana de conteo de errores en segundos (default: 60s)
+            cooldown: Tiempo deshabilitado en segundos (default: 300s = 5min)
+            ewma_alpha: Peso de la última muestra en la latencia EWMA (default: 0.3)
+        """
+        self.max_errors = max_errors
+        self.failure_window = failure_window
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+        self._ewma_script = None
+
+    def _client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+
+    def _stats_key(self, proxy_id):
+        return f"{self.KEY_PREFIX}:stats:{proxy_id}"
+
+    def _errors_key(self, proxy_id):
+        return f"{self.KEY_PREFIX}:errors:{proxy_id}"
+
+    def _cooldown_key(self, proxy_id):
+        return f"{self.KEY_PREFIX}:cooldown:{proxy_id}"
+
+    def record_latency(self, proxy_id: str, latency: float) -> Optional[float]:
+        """Registra una muestra de latencia y retorna la nueva EWMA"""
+        try:
+            client = self._client()
+            if self._ewma_script is None:
+                self._ewma_script = client.register_script(_EWMA_SCRIPT)
+            ewma = self._ewma_script(keys=[self._stats_key(proxy_id)], args=[latency, self.ewma_alpha])
+            client.sadd(f"{self.KEY_PREFIX}:known", proxy_id)
+            return float(ewma)
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error registrando latencia de {proxy_id}: {e}")
+            return None
+
+    def record_success(self, proxy_id: str, latency: Optional[float] = None):
+        """Registra una respuesta válida: limpia la ventana de errores del proxy"""
+        if latency is not None:
+            self.record_latency(proxy_id, latency)
+        try:
+            pipe = self._client().pipeline()
+            pipe.hincrby(self._stats_key(proxy_id), "successes", 1)
+            pipe.delete(self._errors_key(proxy_id))
+            pipe.sadd(f"{self.KEY_PREFIX}:known", proxy_id)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error registrando éxito de {proxy_id}: {e}")
+
+    def record_failure(self, proxy_id: str, kind: str = "connection", reason: str = "") -> bool:
+        """
+        Registra un error (kind: 'ssl', 'connection', 'timeout', ...).
+        Si el proxy acumula max_errors dentro de la ventana, entra en cooldown.
+
+        Returns:
+            bool: True si el proxy quedó deshabilitado
+        """
+        try:
+            client = self._client()
+            errors_key = self._errors_key(proxy_id)
+            pipe = client.pipeline()
+            pipe.hincrby(errors_key, kind, 1)
+            pipe.hincrby(errors_key, "total", 1)
+            pipe.expire(errors_key, self.failure_window)
+            pipe.hincrby(self._stats_key(proxy_id), "failures", 1)
+            pipe.hset(self._stats_key(proxy_id), "last_error", f"{kind}: {reason[:100]}")
+            pipe.sadd(f"{self.KEY_PREFIX}:known", proxy_id)
+            total = pipe.execute()[1]
+
+            if total >= self.max_errors:
+                self.blacklist(proxy_id, reason=f"{total} errores ({kind})")
+                client.delete(errors_key)
+                return True
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error registrando fallo de {proxy_id}: {e}")
+        return False
+
+    def record_batch(self, latencies: Dict[str, List[float]], failures: Dict[str, List[Tuple[str, str]]]) -> set:
+        """
+        Aplica en un solo round trip lo acumulado por un cliente (AsyncDigiPhone):
+        muestras de latencia de respuestas válidas y errores (kind, reason) por proxy.
+        Mismo efecto que record_success/record_failure evento por evento, con
+        los éxitos del lote aplicados antes que los errores.
+
+        Returns:
+            set: proxy_id que quedaron deshabilitados
+        """
+        if not latencies and not failures:
+            return set()
+        try:
+            client = self._client()
+            if self._ewma_script is None:
+                self._ewma_script = client.register_script(_EWMA_SCRIPT)
+            pipe = client.pipeline(transaction=False)
+            for proxy_id, samples in latencies.items():
+                for latency in samples:
+                    self._ewma_script(keys=[self._stats_key(proxy_id)], args=[latency, self.ewma_alpha], client=pipe)
+                pipe.hincrby(self._stats_key(proxy_id), "successes", len(samples))
+                pipe.delete(self._errors_key(proxy_id))
+            totals = []
+            for proxy_id, errors in failures.items():
+                errors_key = self._errors_key(proxy_id)
+                for kind in {kind for kind, _ in errors}:
+                    pipe.hincrby(errors_key, kind, sum(1 for k, _ in errors if k == kind))
+                totals.append((proxy_id, len(pipe)))
+                pipe.hincrby(errors_key, "total", len(errors))
+                pipe.expire(errors_key, self.failure_window)
+                pipe.hincrby(self._stats_key(proxy_id), "failures", len(errors))
+                kind, reason = errors[-1]
+                pipe.hset(self._stats_key(proxy_id), "last_error", f"{kind}: {reason[:100]}")
+            pipe.sadd(f"{self.KEY_PREFIX}:known", *latencies, *failures)
+            values = pipe.execute()
+
+            disabled = set()
+            for proxy_id, index in totals:
+                if values[index] >= self.max_errors:
+                    self.blacklist(proxy_id, reason=f"{values[index]} errores ({failures[proxy_id][-1][0]})")
+                    client.delete(self._errors_key(proxy_id))
+                    disabled.add(proxy_id)
+            return disabled
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error registrando lote de {len(latencies) + len(failures)} proxies: {e}")
+            return set()
+
+    def increment_attempts(self, proxy_id: str):
+        try:
+            self._client().hincrby(self._stats_key(proxy_id), "attempts", 1)
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error incrementando intentos de {proxy_id}: {e}")
+
+    def blacklist(self, proxy_id: str, reason: str = "timeout", duration: Optional[int] = None):
+        """Deshabilita un proxy para todos los procesos durante el cooldown"""
+        duration = duration or self.cooldown
+        try:
+            client = self._client()
+            client.set(self._cooldown_key(proxy_id), reason, ex=duration)
+            client.sadd(f"{self.KEY_PREFIX}:known", proxy_id)
+            logger.warning(f"⚫ Proxy deshabilitado {duration}s: {proxy_id[:60]} - Razón: {reason}")
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error deshabilitando {proxy_id}: {e}")
+
+    def _inflight_key(self, proxy_id):
+        return f"{self.KEY_PREFIX}:inflight:{proxy_id}"
+
+    def acquire(self, proxy_id: str):
+        """Marca una petición en curso sobre el proxy (visible para todos los workers)"""
+        try:
+            pipe = self._client().pipeline()
+            pipe.incr(self._inflight_key(proxy_id))
+            # Si un worker muere sin liberar, el contador se limpia solo
+            pipe.expire(self._inflight_key(proxy_id), 120)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error marcando petición en curso de {proxy_id}: {e}")
+
+    def release(self, proxy_id: str):
+        """Libera una petición en curso sobre el proxy"""
+        try:
+            client = self._client()
+            if client.decr(self._inflight_key(proxy_id)) <= 0:
+                client.delete(self._inflight_key(proxy_id))
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error liberando petición en curso de {proxy_id}: {e}")
+
+    def candidates_state(self, proxy_ids: List[str]) -> List[Dict]:
+        """
+        Estado de unos pocos proxies en un solo round trip:
+        cooldown, latencia EWMA, éxitos/fallos y peticiones en curso.
+        """
+        try:
+            pipe = self._client().pipeline()
+            for proxy_id in proxy_ids:
+                pipe.exists(self._cooldown_key(proxy_id))
+                pipe.hmget(self._stats_key(proxy_id), "ewma", "successes", "failures")
+                pipe.get(self._inflight_key(proxy_id))
+            values = pipe.execute()
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error consultando candidatos: {e}")
+            return [{"id": pid, "in_cooldown": False, "ewma": 0.0, "successes": 0, "failures": 0, "inflight": 0}
+                    for pid in proxy_ids]
+
+        states = []
+        for i, proxy_id in enumerate(proxy_ids):
+            cooldown, (ewma, successes, failures), inflight = values[i * 3:i * 3 + 3]
+            states.append({
+                "id": proxy_id,
+                "in_cooldown": bool(cooldown),
+                "ewma": float(ewma) if ewma is not None else 0.0,
+                "successes": int(successes or 0),
+                "failures": int(failures or 0),
+                "inflight": max(0, int(inflight or 0)),
+            })
+        return states
+
+    def is_in_cooldown(self, proxy_id: str) -> bool:
+        return proxy_id in self.in_cooldown([proxy_id])
+
+    def in_cooldown(self, proxy_ids: List[str]) -> set:
+        """Subconjunto de proxy_ids deshabilitados (un solo round trip)"""
+        if not proxy_ids:
+            return set()
+        try:
+            pipe = self._client().pipeline()
+            for proxy_id in proxy_ids:
+                pipe.exists(self._cooldown_key(proxy_id))
+            flags = pipe.execute()
+            return {pid for pid, flag in zip(proxy_ids, flags) if flag}
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error consultando cooldowns: {e}")
+            return set()
+
+    def get_ewma(self, proxy_ids: List[str]) -> Dict[str, float]:
+        """Latencia EWMA por proxy (0.0 si aún no hay muestras)"""
+        if not proxy_ids:
+            return {}
+        try:
+            pipe = self._client().pipeline()
+            for proxy_id in proxy_ids:
+                pipe.hget(self._stats_key(proxy_id), "ewma")
+            values = pipe.execute()
+            return {pid: float(v) if v is not None else 0.0 for pid, v in zip(proxy_ids, values)}
+        except Exception as e:
+            logger.debug(f"[ProxyHealthRegistry] Error consultando latencias: {e}")
+            return {pid: 0.0 for pid in proxy_ids}
+
+    def reset(self, proxy_ids: Optional[List[str]] = None) -> int:
+        """
+        Rehabilita proxies (borra cooldown y ventana de errores).
+        Sin argumentos rehabilita todos los conocidos.
+
+        Returns:
+            int: cantidad de proxies que estaban deshabilitados
+        """
+        try:
+            client = self._client()
+            if proxy_ids is None:
+                proxy_ids = [p.decode() if isinstance(p, bytes) else p
+                             for p in client.smembers(f"{self.KEY_PREFIX}:known")]
+            if not proxy_ids:
+                return 0
+            cleared = len(self.in_cooldown(proxy_ids))
+            client.delete(*[self._cooldown_key(p) for p in proxy_ids],
+                          *[self._errors_key(p) for p in proxy_ids])
+            return cleared
+        except Exception as e:
+            logger.warning(f"[ProxyHealthRegistry] Error rehabilitando proxies: {e}")
+            return 0
+
+    def snapshot(self) -> List[Dict]:
+        """Métricas de todos los proxies conocidos"""
+        try:
+            client = self._client()
+            proxy_ids = [p.decode() if isinstance(p, bytes) else p
+                         for p in client.smembers(f"{self.KEY_PREFIX}:known")]
+            pipe = client.pipeline()
+            for proxy_id in proxy_ids:
+                pipe.hgetall(self._stats_key(proxy_id))
+            stats = pipe.execute()
+            cooling = self.in_cooldown(proxy_ids)
+        except Exception as e:
+            logger.warning(f"[ProxyHealthRegistry] Error leyendo métricas: {e}")
+            return []
+
+        result = []
+        for proxy_id, raw in zip(proxy_ids, stats):
+            raw = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                   for k, v in raw.items()}
+            result.append({
+                "id": proxy_id,
+                "ewma": float(raw.get("ewma", 0.0)),
+                "successes": int(raw.get("successes", 0)),
+                "failures": int(raw.get("failures", 0)),
+                "attempts": int(raw.get("attempts", 0)),
+                "last_error": raw.get("last_error"),
+                "in_cooldown": proxy_id in cooling,
+            })
+        return result
+
+
+# Instancia global del registro
+_global_registry = None
+
+
+def get_proxy_health_registry():
+    """Obtiene instancia global del registro de salud de proxies"""
+    global _global_registry
+    if _global_registry is None:
+        _global_registry = ProxyHealthRegistry(
+            max_errors=5,
+            failure_window=60,
+            cooldown=300
+        )
+    return _global_registry
+
+
+class ProxyScheduler:
+    """
+    Selección de proxy por "power of two choices" (P2C).
+
+    En lugar de ordenar todos los proxies en cada selección (O(n log n)) se
+    muestrean unos pocos al azar, se descartan los que están en cooldown y de
+    dos candidatos sanos se elige el de menor costo:
+
+        costo = latencia_ewma * (1 + peticiones_en_curso) / tasa_de_éxito
+
+    Las peticiones en curso son compartidas (Redis), así que workers
+    concurrentes reparten la carga en vez de amontonarse en el mismo "mejor"
+    proxy. Cada selección cuesta un round trip y O(1) en CPU.
+    """
+
+    def __init__(self, registry=None, choices=2, max_samples=6, default_latency=1.0):
+        """
+        Args:
+            registry: ProxyHealthRegistry (default: instancia global)
+            choices: Candidatos sanos a comparar (default: 2)
+            max_samples: Proxies muestreados por selección, por si algunos están en cooldown
+            default_latency: Latencia asumida para proxies sin muestras (favorece explorarlos)
+        """
+        self.registry = registry or get_proxy_health_registry()
+        self.choices = choices
+        self.max_samples = max_samples
+        self.default_latency = default_latency
+
+    def score(self, state: Dict) -> float:
+        """Costo estimado de enviar una petición más al proxy (menor es mejor)"""
+        latency = state["ewma"] or self.default_latency
+        # Tasa de éxito con suavizado de Laplace: proxies nuevos parten de 0.5
+        success_rate = (state["successes"] + 1) / (state["successes"] + state["failures"] + 2)
+        return latency * (1 + state["inflight"]) / success_rate
+
+    def pick(self, proxy_ids: List[str], exclude: Optional[int] = None) -> int:
+        """
+        Retorna el índice (en proxy_ids) del proxy elegido.
+
+        Args:
+            proxy_ids: Lista de proxy_id del usuario
+            exclude: Índice a evitar (p. ej. el proxy que acaba de fallar)
+        """
+        total = len(proxy_ids)
+        if total == 0:
+            return 0
+        if total == 1:
+            return 0
+
+        pool = [i for i in range(total) if i != exclude]
+        sampled = random.sample(pool, min(self.max_samples, len(pool)))
+        states = self.registry.candidates_state([proxy_ids[i] for i in sampled])
+
+        healthy = [(i, st) for i, st in zip(sampled, states) if not st["in_cooldown"]][:self.choices]
+        if healthy:
+            return min(healthy, key=lambda item: self.score(item[1]))[0]
+
+        # Todos los muestreados en cooldown: buscar en la lista completa (caso raro)
+        disabled = self.registry.in_cooldown(proxy_ids)
+        available = [i for i in pool if proxy_ids[i] not in disabled]
+        if available:
+            return random.choice(available)
+
+        logger.warning("⚠️ Todos los proxies en cooldown, usando uno al azar")
+        return random.choice(pool)
+
+
+# Instancia global del planificador
+_global_scheduler = None
+
+
+def get_proxy_scheduler():
+    """Obtiene instancia global del planificador de proxies"""
+    global _global_scheduler
+    if _global_scheduler is None:
+        _global_scheduler = ProxyScheduler()
+    return _global_scheduler
+
+
 class ProxyRotator:
-    """Gestor de rotación de proxies con blacklist y métricas"""
+    """
+    Gestor de rotación de proxies con blacklist y métricas.
+
+    El estado (blacklist, latencias, intentos) vive en ProxyHealthRegistry,
+    compartido entre procesos; esta clase mantiene la API original.
+    """
     
     def __init__(self, max_response_time=5.0, blacklist_duration=300):
         """
@@ -25,86 +443,58 @@ class ProxyRotator:
         """
         self.max_response_time = max_response_time
         self.blacklist_duration = blacklist_duration
-        
-        # Blacklist temporal: {proxy_id: timestamp_expiracion}
-        self.blacklist = {}
-        
-        # Métricas: {proxy_id: [tiempo1, tiempo2, ...]}
-        self.metrics = {}
-        
-        # Contador de intentos: {proxy_id: num_intentos}
-        self.attempt_counts = {}
+        self.registry = get_proxy_health_registry()
     
     def is_blacklisted(self, proxy_id: str) -> bool:
         """Verifica si un proxy está en blacklist"""
-        if proxy_id not in self.blacklist:
-            return False
-        
-        if datetime.now().timestamp() > self.blacklist[proxy_id]:
-            del self.blacklist[proxy_id]
-            return False
-        
-        return True
+        return self.registry.is_in_cooldown(proxy_id)
     
     def add_to_blacklist(self, proxy_id: str, reason: str = "timeout"):
         """Añade proxy a blacklist temporal"""
-        expiry_time = datetime.now() + timedelta(seconds=self.blacklist_duration)
-        self.blacklist[proxy_id] = expiry_time.timestamp()
-        logger.warning(f"⚫ Proxy blacklisted: {proxy_id[:60]}... - Razón: {reason}")
+        self.registry.blacklist(proxy_id, reason=reason, duration=self.blacklist_duration)
+    
+    def clear_blacklist(self) -> int:
+        """Libera todos los proxies en blacklist. Retorna cuántos estaban bloqueados"""
+        return self.registry.reset()
     
     def record_response_time(self, proxy_id: str, response_time: float):
         """Registra tiempo de respuesta"""
-        if proxy_id not in self.metrics:
-            self.metrics[proxy_id] = []
-        
-        self.metrics[proxy_id].append(response_time)
-        
-        # Mantener solo últimos 10
-        if len(self.metrics[proxy_id]) > 10:
-            self.metrics[proxy_id] = self.metrics[proxy_id][-10:]
+        self.registry.record_latency(proxy_id, response_time)
     
     def get_avg_response_time(self, proxy_id: str) -> float:
-        """Obtiene tiempo promedio de respuesta"""
-        if proxy_id not in self.metrics or not self.metrics[proxy_id]:
-            return 0.0
-        return sum(self.metrics[proxy_id]) / len(self.metrics[proxy_id])
+        """Obtiene tiempo promedio de respuesta (EWMA)"""
+        return self.registry.get_ewma([proxy_id]).get(proxy_id, 0.0)
     
     def increment_attempts(self, proxy_id: str):
         """Incrementa contador de intentos"""
-        self.attempt_counts[proxy_id] = self.attempt_counts.get(proxy_id, 0) + 1
+        self.registry.increment_attempts(proxy_id)
     
-    def get_best_proxy_index(self, total_proxies: int) -> int:
+    def get_best_proxy_index(self, proxy_ids: List[str]) -> int:
         """
-        Retorna el índice del mejor proxy disponible
-        Compatible con lista de proxies de DigiPhone
+        Retorna el índice (en proxy_ids) del mejor proxy disponible.
+
+        Args:
+            proxy_ids: proxy_id estables de los proxies del usuario
+                (ip:puerto:usuario, los de DigiPhone.proxies); el registro es
+                compartido por toda la flota, un índice no identifica al proxy
         """
-        # Filtrar proxies disponibles (no en blacklist)
-        available_indices = []
-        for idx in range(total_proxies):
-            proxy_id = f"proxy_{idx}"
-            if not self.is_blacklisted(proxy_id):
-                available_indices.append((idx, self.get_avg_response_time(proxy_id)))
-        
-        if not available_indices:
-            logger.warning("⚠️ Todos los proxies en blacklist. Limpiando...")
-            self.blacklist.clear()
-            return 0  # Retornar primer proxy
-        
-        # Ordenar por tiempo de respuesta (menor es mejor)
-        available_indices.sort(key=lambda x: x[1])
-        return available_indices[0][0]
+        return get_proxy_scheduler().pick(proxy_ids)
+    
+    def get_top_proxies(self, limit: int = 10) -> List[Dict]:
+        """Proxies con muestras ordenados por latencia EWMA"""
+        measured = [p for p in self.registry.snapshot() if p["ewma"] > 0]
+        measured.sort(key=lambda p: p["ewma"])
+        return measured[:limit]
     
     def get_stats(self) -> Dict:
         """Estadísticas del sistema"""
-        total_proxies = len(self.metrics)
-        blacklisted = len(self.blacklist)
-        avg_times = {pid: self.get_avg_response_time(pid) for pid in self.metrics.keys()}
-        fast_proxies = sum(1 for t in avg_times.values() if 0 < t < self.max_response_time)
-        slow_proxies = sum(1 for t in avg_times.values() if t >= self.max_response_time)
+        snapshot = self.registry.snapshot()
+        fast_proxies = sum(1 for p in snapshot if 0 < p["ewma"] < self.max_response_time)
+        slow_proxies = sum(1 for p in snapshot if p["ewma"] >= self.max_response_time)
         
         return {
-            "total_proxies_tested": total_proxies,
-            "blacklisted": blacklisted,
+            "total_proxies_tested": len(snapshot),
+            "blacklisted": sum(1 for p in snapshot if p["in_cooldown"]),
             "fast_proxies": fast_proxies,
             "slow_proxies": slow_proxies,
             "max_response_time": self.max_response_time,
@@ -126,7 +516,7 @@ def get_proxy_rotator():
     return _global_rotator
 
 
-def make_request_with_rotation(session, method: str, url: str, proxy_index: int, 
+def make_request_with_rotation(session, method: str, url: str, proxy_index: int, proxy_ids: List[str],
                                max_retries: int = 3, **kwargs) -> Tuple[Optional[requests.Response], int]:
     """
     Hace una petición HTTP con rotación automática de proxies
@@ -137,6 +527,7 @@ def make_request_with_rotation(session, method: str, url: str, proxy_index: int,
         method: 'GET', 'POST', etc.
         url: URL destino
         proxy_index: Índice del proxy actual
+        proxy_ids: proxy_id estables de los proxies (ip:puerto:usuario, ver DigiPhone.proxies)
         max_retries: Número máximo de reintentos
         **kwargs: Argumentos para requests
     
@@ -148,7 +539,7 @@ def make_request_with_rotation(session, method: str, url: str, proxy_index: int,
     current_proxy_index = proxy_index
     
     for attempt in range(max_retries):
-        proxy_id = f"proxy_{current_proxy_index}"
+        proxy_id = proxy_ids[current_proxy_index]
         rotator.increment_attempts(proxy_id)
         
         try:
@@ -167,7 +558,7 @@ def make_request_with_rotation(session, method: str, url: str, proxy_index: int,
             # Verificar si fue lento
             if elapsed > rotator.max_response_time:
                 logger.warning(
-                    f"⚠️ Proxy lento: {elapsed:.2f}s > {rotator.max_response_time}s - proxy_{current_proxy_index}"
+                    f"⚠️ Proxy lento: {elapsed:.2f}s > {rotator.max_response_time}s - {proxy_id}"
                 )
                 rotator.add_to_blacklist(proxy_id, reason=f"slow ({elapsed:.2f}s)")
                 
@@ -178,30 +569,30 @@ def make_request_with_rotation(session, method: str, url: str, proxy_index: int,
                     # Por ahora retornamos None para indicar que debe rotar
                     return (None, -1)
             else:
-                logger.info(f"✅ Respuesta OK en {elapsed:.2f}s con proxy_{current_proxy_index}")
+                logger.info(f"✅ Respuesta OK en {elapsed:.2f}s con {proxy_id}")
             
             return (response, current_proxy_index)
             
         except requests.exceptions.Timeout:
-            logger.warning(f"⏱️ Timeout con proxy_{current_proxy_index}")
+            logger.warning(f"⏱️ Timeout con {proxy_id}")
             rotator.add_to_blacklist(proxy_id, reason="timeout")
             if attempt < max_retries - 1:
                 return (None, -1)
                 
         except requests.exceptions.ProxyError:
-            logger.warning(f"🚫 ProxyError con proxy_{current_proxy_index}")
+            logger.warning(f"🚫 ProxyError con {proxy_id}")
             rotator.add_to_blacklist(proxy_id, reason="proxy_error")
             if attempt < max_retries - 1:
                 return (None, -1)
                 
         except requests.exceptions.ConnectionError:
-            logger.warning(f"🔌 ConnectionError con proxy_{current_proxy_index}")
+            logger.warning(f"🔌 ConnectionError con {proxy_id}")
             rotator.add_to_blacklist(proxy_id, reason="connection_error")
             if attempt < max_retries - 1:
                 return (None, -1)
                 
         except Exception as e:
-            logger.error(f"❌ Error con proxy_{current_proxy_index}: {type(e).__name__}")
+            logger.error(f"❌ Error con {proxy_id}: {type(e).__name__}")
             rotator.add_to_blacklist(proxy_id, reason="error")
             if attempt < max_retries - 1:
                 return (None, -1)
@@ -0,0 +1,163 @@
+"""
+Registro de colas por usuario (user_queue_<user_id>) creadas bajo demanda.
+
+Los workers arrancan consumiendo solo 'maintenance' y 'celery'. Cuando un
+usuario tiene un archivo activo su cola se registra y se avisa a todos los
+workers con add_consumer (broadcast de control); cuando ya no tiene archivos
+activos ni mensajes pendientes se deja de consumir con cancel_consumer.
+Así cada worker hace BRPOP solo sobre las colas con trabajo, sin límite de
+usuarios, y Redis sigue repartiendo en round-robin entre ellas.
+
+Claves (en el Redis del broker, junto a las colas, ver CELERY_BROKER_URL):
+- queues:users → set de user_id con cola registrada
+- queues:active:<user_id> → marca de actividad (TTL ACTIVE_TTL), se renueva
+  en cada ensure()
+
+release() verifica en un solo script Lua que la cola siga vacía y que nadie
+haya llamado a ensure() recientemente antes de hacer SREM, así una subida que
+llega mientras check_orphan decide liberar no se queda sin consumidores.
+
+Los workers que arrancan después se suscriben a las colas registradas en
+worker_ready (apimovil/celery.py); sync() repite cada 30s (check_orphan) el
+add_consumer de todas las colas con trabajo, así un aviso perdido o que llegó
+antes que un cancel_consumer anterior se corrige solo.
+
+Archivo: app/queue_registry.py
+"""
+import logging
+
+from celery import current_app
+
+logger = logging.getLogger(__name__)
+
+USERS_KEY = "queues:users"
+ACTIVE_PREFIX = "queues:active:"
+# Más que el intervalo de check_orphan (30s): un usuario activo nunca la pierde
+ACTIVE_TTL = 90
+
+# Libera solo si la cola sigue vacía y no hubo ensure() reciente
+_RELEASE_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 1 or redis.call('llen', KEYS[3]) > 0 then
+    return 0
+end
+return redis.call('srem', KEYS[1], ARGV[1])
+"""
+
+_client = None
+
+
+def _redis():
+    """Cliente del Redis del broker (donde viven las colas user_queue_*)."""
+    global _client
+    if _client is None:
+        import redis
+
+        _client = redis.Redis.from_url(current_app.conf.broker_url)
+    return _client
+
+
+def queue_name(user_id):
+    """Nombre de la cola de un usuario."""
+    return f'user_queue_{user_id}'
+
+
+def registered():
+    """user_id con cola registrada."""
+    try:
+        return {int(u) for u in _redis().smembers(USERS_KEY)}
+    except Exception as e:
+        logger.warning(f"[queue_registry] No se pudo leer el registro de colas: {e}")
+        return set()
+
+
+def ensure(user_id):
+    """
+    Registra la cola del usuario y renueva su marca de actividad; si la cola
+    es nueva pide a los workers que la consuman. Un solo round trip si ya
+    estaba registrada.
+    """
+    try:
+        added = _mark_active([user_id])[0]
+    except Exception as e:
+        logger.warning(f"[queue_registry] No se pudo registrar la cola de {user_id}: {e}")
+        added = 1
+    if added:
+        _add_consumer(user_id)
+        logger.info(f"[queue_registry] ➕ Workers consumiendo {queue_name(user_id)}")
+
+
+def _mark_active(user_ids):
+    """SADD + marca de actividad de cada usuario; devuelve el resultado de cada SADD."""
+    pipe = _redis().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.sadd(USERS_KEY, user_id)
+        pipe.set(f"{ACTIVE_PREFIX}{user_id}", 1, ex=ACTIVE_TTL)
+    return pipe.execute()[::2]
+
+
+def _add_consumer(user_id):
+    name = queue_name(user_id)
+    try:
+        current_app.control.add_consumer(name, reply=False)
+    except Exception as e:
+        logger.warning(f"[queue_registry] No se pudo avisar a los workers ({name}): {e}")
+
+
+def release(user_id):
+    """
+    Quita la cola del registro y pide a los workers que dejen de consumirla,
+    solo si sigue vacía y sin actividad reciente (comprobado de forma atómica).
+
+    Returns:
+        bool: True si se liberó
+    """
+    name = queue_name(user_id)
+    try:
+        removed = _redis().eval(
+            _RELEASE_SCRIPT, 3, USERS_KEY, f"{ACTIVE_PREFIX}{user_id}", name, user_id
+        )
+        if not removed:
+            return False
+        current_app.control.cancel_consumer(name, reply=False)
+        logger.info(f"[queue_registry] ➖ Workers dejan de consumir {name}")
+        return True
+    except Exception as e:
+        logger.warning(f"[queue_registry] No se pudo liberar {name}: {e}")
+        return False
+
+
+def queue_lengths(user_ids):
+    """{user_id: mensajes pendientes en su cola} en un solo round trip al broker."""
+    user_ids = sorted(user_ids)
+    if not user_ids:
+        return {}
+    pipe = _redis().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.llen(queue_name(user_id))
+    return dict(zip(user_ids, pipe.execute()))
+
+
+def sync(active_user_ids, lengths):
+    """
+    Ajusta el registro al estado real: registra a los usuarios con archivos
+    activos o mensajes pendientes, repite add_consumer para todos ellos
+    (idempotente en los workers) y libera al resto.
+
+    Args:
+        active_user_ids: user_id con algún Consecutive activo e incompleto
+        lengths: {user_id: mensajes en su cola} (queue_lengths)
+    """
+    wanted = sorted(set(active_user_ids) | {u for u, n in lengths.items() if n})
+    current = registered()
+    if wanted:
+        try:
+            _mark_active(wanted)
+        except Exception as e:
+            logger.warning(f"[queue_registry] No se pudo registrar colas activas: {e}")
+    for user_id in wanted:
+        _add_consumer(user_id)
+
+    # Usuarios registrados sin archivo activo: release() vuelve a mirar la
+    # cola y la marca de actividad justo antes de quitarlos
+    for user_id in sorted(current - set(wanted)):
+        release(user_id)
@@ -0,0 +1,121 @@
+"""
+Pool de sesiones DigiPhone por proceso (worker Celery / worker web).
+
+Construir un DigiPhone consulta la tabla Proxy, crea una requests.Session por
+línea de proxy y obliga a hacer login (GET página principal + POST
+/v2/login/online) antes de cada consulta. El pool mantiene las instancias
+vivas por usuario entre tareas, con sus cookies store_access_token, y entrega
+una instancia lista por tarea.
+
+Uso:
+    with get_digiphone_pool().session(user) as digi_phone:
+        if digi_phone.ensure_access():
+            digi_phone.get_phone_number(phone)
+
+Archivo: app/session_pool.py
+"""
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class DigiPhonePool:
+    """Pool de instancias DigiPhone autenticadas, agrupadas por usuario"""
+
+    def __init__(self, max_idle_per_user=4, proxy_check_interval=300):
+        """
+        Args:
+            max_idle_per_user: Instancias ociosas que se conservan por usuario
+            proxy_check_interval: Segundos entre verificaciones de cambios en los
+                                  proxies del usuario (default: 300s = 5min)
+        """
+        self.max_idle_per_user = max_idle_per_user
+        self.proxy_check_interval = proxy_check_interval
+
+        # Instancias ociosas: {user_id: [(digi_phone, firma_proxies, verificado_en), ...]}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _proxy_signature(user):
+        """Firma de la configuración de proxies del usuario (detecta cambios)"""
+        from .models import Proxy
+        rows = Proxy.objects.filter(user=user).order_by('id').values_list(
+            'id', 'ip', 'port_min', 'username', 'password'
+        )
+        return hashlib.sha1(repr(list(rows)).encode()).hexdigest()
+
+    def _acquire(self, user):
+        with self._lock:
+            idle = self._idle.get(user.id, [])
+            entry = idle.pop() if idle else None
+
+        if entry is not None:
+            digi_phone, signature, checked_at = entry
+            if time() - checked_at < self.proxy_check_interval:
+                return digi_phone, signature, checked_at
+
+            # Revalidar que los proxies del usuario no cambiaron
+            current_signature = self._proxy_signature(user)
+            if current_signature == signature:
+                return digi_phone, signature, time()
+            logger.info(f"[DigiPhonePool] Proxies del usuario {user.id} cambiaron, recreando sesión")
+
+        from .browser import DigiPhone
+        signature = self._proxy_signature(user)
+        digi_phone = DigiPhone(user=user, reprocess=False)
+        logger.info(f"[DigiPhonePool] Nueva instancia para usuario {user.id} ({digi_phone._len_proxy} proxies)")
+        return digi_phone, signature, time()
+
+    def _release(self, user, digi_phone, signature, checked_at):
+        with self._lock:
+            idle = self._idle.setdefault(user.id, [])
+            if len(idle) < self.max_idle_per_user:
+                idle.append((digi_phone, signature, checked_at))
+
+    @contextmanager
+    def session(self, user):
+        """
+        Entrega un DigiPhone del usuario para uso exclusivo durante el bloque.
+        Al salir vuelve al pool con sus cookies vigentes.
+        """
+        digi_phone, signature, checked_at = self._acquire(user)
+        try:
+            yield digi_phone
+        finally:
+            self._release(user, digi_phone, signature, checked_at)
+
+    def invalidate(self, user_id=None):
+        """Descarta las instancias de un usuario (o de todos si user_id es None)"""
+        with self._lock:
+            if user_id is None:
+                self._idle.clear()
+            else:
+                self._idle.pop(user_id, None)
+
+    def get_stats(self):
+        """Estadísticas del pool"""
+        with self._lock:
+            return {
+                "users": len(self._idle),
+                "idle_instances": sum(len(v) for v in self._idle.values()),
+            }
+
+
+# Instancia global del pool (una por proceso)
+_global_pool = None
+_global_pool_lock = threading.Lock()
+
+
+def get_digiphone_pool():
+    """Obtiene instancia global del pool de sesiones"""
+    global _global_pool
+    if _global_pool is None:
+        with _global_pool_lock:
+            if _global_pool is None:
+                _global_pool = DigiPhonePool()
+    return _global_pool
@@ -1,5 +1,6 @@
-from django.apps import AppConfig
 from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
 import logging
@@ -7,70 +8,144 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def load_phone_cache_on_startup():
+PHONE_CACHE_DAYS = 30
+PHONE_CACHE_TIMEOUT = 60*60*24*PHONE_CACHE_DAYS  # 30 días
+
+# Filas por lote al cargar el caché (acota la memoria, no el tamaño de la tabla)
+WARM_CHUNK_SIZE = 5000
+
+# Último número cargado: una carga interrumpida continúa desde aquí
+WARM_CURSOR_KEY = "warm_phone_cache:cursor"
+WARM_CURSOR_TTL = 60 * 60 * 24  # 1 día
+
+
+def warm_phone_cache(chunk_size=WARM_CHUNK_SIZE):
     """
-    Carga el caché de números de teléfono al iniciar Django.
-    Se ejecuta desde AppConfig.ready()
+    Carga en Redis el último operador conocido de cada número (30 días).
+
+    Recorre la BD por lotes de chunk_size números (DISTINCT ON (number) con
+    keyset number > último, sobre movil_number_fecha_op_idx) y escribe cada
+    lote en Redis (app/phone_cache.py), sin construir el caché completo en
+    memoria. No usa .iterator(): detrás de PgBouncer (DB_POOL_MODE=pgbouncer)
+    no hay cursores del lado del servidor y traería la tabla entera de una vez.
+    En formato 'keys' el TTL de cada clave es lo que le queda al registro
+    dentro de la ventana de 30 días.
+
+    Tras cada lote guarda el último número en WARM_CURSOR_KEY; si la carga se
+    interrumpe (soft time limit, reinicio) la siguiente continúa desde ahí.
+
+    Returns:
+        int: cantidad de números cargados
     """
+    from . import phone_cache
     from .models import Movil
-    
+
+    now = timezone.now()
+    cache_threshold = now - timedelta(days=PHONE_CACHE_DAYS)
+
+    logger.info(f"[CACHE WARM] Consultando base de datos desde {cache_threshold}...")
+
+    latest_per_number = Movil.objects.filter(
+        fecha_hora__gte=cache_threshold
+    ).exclude(
+        operator__in=['ERROR_SCRAPING', 'No existe', 'Desconocido']
+    ).order_by('number', '-fecha_hora').distinct('number').values_list(
+        'number', 'operator', 'fecha_hora'
+    )
+
+    cursor = cache.get(WARM_CURSOR_KEY) or {}
+    total = cursor.get("total", 0)
+    last_number = cursor.get("number")
+    if last_number is not None:
+        logger.info(f"[CACHE WARM] Continuando carga interrumpida desde {last_number} ({total:,} números ya cargados)")
+    while True:
+        rows = latest_per_number
+        if last_number is not None:
+            rows = rows.filter(number__gt=last_number)
+        chunk = list(rows[:chunk_size])
+        if not chunk:
+            break
+        phone_cache.store_rows(chunk, now, window=PHONE_CACHE_TIMEOUT)
+        total += len(chunk)
+        last_number = chunk[-1][0]
+        cache.set(WARM_CURSOR_KEY, {"number": last_number, "total": total}, timeout=WARM_CURSOR_TTL)
+        logger.debug(f"[CACHE WARM] {total:,} números cargados...")
+        if len(chunk) < chunk_size:
+            break
+
+    cache.delete(WARM_CURSOR_KEY)
+    # Formato anterior: un único blob con todo el caché (ya no se usa)
+    cache.delete('global_phone_cache')
+    cache.set('global_phone_cache_updated', timezone.now().isoformat(), timeout=None)
+    cache.set('global_phone_cache_count', total, timeout=None)
+    return total
+
+
+WARM_LOCK_KEY = "lock:warm_phone_cache"
+# Límites propios de warm_phone_cache_task (el global de 300s no alcanza para
+# recorrer 30 días de Movil); el lock dura lo mismo que la tarea, así que si el
+# worker la mata el lock caduca con ella
+WARM_TIME_LIMIT = 60 * 60  # 1 hora
+WARM_SOFT_TIME_LIMIT = WARM_TIME_LIMIT - 60
+WARM_LOCK_TIMEOUT = WARM_TIME_LIMIT
+
+
+def load_phone_cache(force=False, chunk_size=WARM_CHUNK_SIZE):
+    """
+    Carga el caché de números de teléfono una sola vez para todo el sistema.
+
+    Protegido con un lock de Redis: si otro proceso ya está cargando, retorna
+    sin hacer nada. Sin force, se salta la carga si el caché ya está marcado
+    como cargado. Se ejecuta desde la tarea warm_phone_cache_task y desde
+    `manage.py warm_phone_cache`. Si llega el soft time limit se libera el
+    lock y se relanza SoftTimeLimitExceeded (la tarea continúa desde el cursor).
+
+    Returns:
+        int | None: números cargados, o None si no se cargó
+    """
     try:
-        # Verificar si el caché ya está cargado
-        if cache.get('global_phone_cache') is not None:
+        if not force and cache.get('global_phone_cache_updated') is not None:
             count = cache.get('global_phone_cache_count', 0)
             logger.info(f"[CACHE INIT] Caché ya existe con {count:,} números. Saltando inicialización.")
-            return
+            return None
+        lock = cache.lock(WARM_LOCK_KEY, timeout=WARM_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            logger.info("[CACHE INIT] Otro proceso está cargando el caché. Saltando.")
+            return None
     except Exception as e:
-        logger.warning(f"[CACHE INIT] No se pudo verificar caché existente: {e}. Continuando con carga...")
+        logger.error(f"❌ [CACHE INIT] Redis no disponible, no se puede cargar el caché: {e}")
+        return None
 
     logger.info("=" * 80)
     logger.info("🔄 [CACHE INIT] Iniciando carga de caché de números (30 días)...")
     logger.info("=" * 80)
 
     try:
-        cache_threshold = timezone.now() - timedelta(days=30)
-
-        # Obtener números de los últimos 30 días usando fecha_hora
-        phone_cache = {}
-
-        logger.info(f"[CACHE INIT] Consultando base de datos desde {cache_threshold}...")
-
-        cached_numbers = Movil.objects.filter(
-            fecha_hora__gte=cache_threshold
-        ).exclude(
-            operator__in=['ERROR_SCRAPING', 'No existe', 'Desconocido']
-        ).values('number', 'operator', 'file', 'fecha_hora').order_by('number', '-fecha_hora')
-
-        total_records = cached_numbers.count()
-        logger.info(f"[CACHE INIT] Registros encontrados en BD: {total_records:,}")
-
-        # Construir diccionario (solo el más reciente por número)
-        for item in cached_numbers:
-            if item['number'] not in phone_cache:
-                phone_cache[item['number']] = {
-                    'operator': item['operator'],
-                    'source_file': item['file'],
-                    'fecha_hora': item['fecha_hora'].isoformat()
-                }
-
-        logger.info(f"[CACHE INIT] Números únicos procesados: {len(phone_cache):,}")
-
-        # Guardar en Redis (sin timeout, persistente)
-        cache.set('global_phone_cache', phone_cache, timeout=None)
-        cache.set('global_phone_cache_updated', timezone.now().isoformat(), timeout=None)
-        cache.set('global_phone_cache_count', len(phone_cache), timeout=None)
+        total = warm_phone_cache(chunk_size=chunk_size)
 
         logger.info("=" * 80)
-        logger.info(f"✅ [CACHE INIT] Caché global CARGADO en Redis: {len(phone_cache):,} números")
+        logger.info(f"✅ [CACHE INIT] Caché global CARGADO en Redis: {total:,} números")
         logger.info(f"✅ [CACHE INIT] Última actualización: {timezone.now()}")
         logger.info("=" * 80)
+        return total
 
     except Exception as e:
+        from celery.exceptions import SoftTimeLimitExceeded
+        if isinstance(e, SoftTimeLimitExceeded):
+            logger.warning("⏱ [CACHE INIT] Tiempo agotado: la carga continúa desde el último lote guardado")
+            raise
         logger.error("=" * 80)
         logger.error(f"❌ [CACHE INIT] Error cargando caché: {e}")
         logger.error("=" * 80)
         import traceback
         logger.error(traceback.format_exc())
+        return None
+
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass
 
 
 def refresh_phone_cache():
@@ -78,38 +153,9 @@ def refresh_phone_cache():
     Función para refrescar manualmente el caché.
     Puede ser llamada desde una tarea Celery programada.
     """
-    from .models import Movil
-
     logger.info("🔄 [CACHE REFRESH] Refrescando caché global de números...")
-
-    try:
-        cache_threshold = timezone.now() - timedelta(days=30)
-
-        phone_cache = {}
-        cached_numbers = Movil.objects.filter(
-            fecha_hora__gte=cache_threshold
-        ).exclude(
-            operator__in=['ERROR_SCRAPING', 'No existe', 'Desconocido']
-        ).values('number', 'operator', 'file', 'fecha_hora').order_by('number', '-fecha_hora')
-
-        for item in cached_numbers:
-            if item['number'] not in phone_cache:
-                phone_cache[item['number']] = {
-                    'operator': item['operator'],
-                    'source_file': item['file'],
-                    'fecha_hora': item['fecha_hora'].isoformat()
-                }
-
-        cache.set('global_phone_cache', phone_cache, timeout=None)
-        cache.set('global_phone_cache_updated', timezone.now().isoformat(), timeout=None)
-        cache.set('global_phone_cache_count', len(phone_cache), timeout=None)
-
-        logger.info(f"✅ [CACHE REFRESH] Caché refrescado: {len(phone_cache):,} números")
-        return len(phone_cache)
-
-    except Exception as e:
-        logger.error(f"❌ [CACHE REFRESH] Error refrescando caché: {e}")
-        return 0
+    total = load_phone_cache(force=True)
+    return total or 0
 
 
 def add_to_phone_cache(number, operator, file_name):
@@ -117,7 +163,47 @@ def add_to_phone_cache(number, operator, file_name):
     Agrega un número al caché después de scraping exitoso.
     """
     try:
-        cache.set(f"phone:{number}", operator, timeout=60*60*24*30)  # 30 días
+        from . import phone_cache
+        phone_cache.store(number, operator, timeout=PHONE_CACHE_TIMEOUT)
         logger.debug(f"[CACHE] Número agregado: {number} → {operator}")
     except Exception as e:
         logger.error(f"[CACHE] Error agregando al caché: {e}")
+
+
+def add_many_to_phone_cache(numbers_operators):
+    """
+    Agrega varios números al caché en un solo pipeline de Redis.
+
+    Args:
+        numbers_operators: dict {numero: operador}
+    """
+    if not numbers_operators:
+        return
+    try:
+        from . import phone_cache
+        phone_cache.store_many(numbers_operators, timeout=PHONE_CACHE_TIMEOUT)
+        logger.debug(f"[CACHE] {len(numbers_operators)} números agregados")
+    except Exception as e:
+        logger.error(f"[CACHE] Error agregando lote al caché: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Resumen de archivos por usuario (app/job_summary.py)
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender="app.Consecutive")
+def invalidate_summary_on_save(sender, instance, created, update_fields=None, **kwargs):
+    from . import job_summary
+    if created:
+        job_summary.invalidate(instance.user_id)
+        return
+    # Solo los campos guardados: progres lo escriben los workers con UPDATE y
+    # el de la instancia puede estar atrasado
+    fields = [f for f in job_summary.UPDATABLE_FIELDS if update_fields is None or f in update_fields]
+    job_summary.update(instance.user_id, [dict({f: getattr(instance, f) for f in fields}, id=instance.id)])
+
+
+@receiver(post_delete, sender="app.Consecutive")
+def invalidate_summary_on_delete(sender, instance, **kwargs):
+    from . import job_summary
+    job_summary.invalidate(instance.user_id)
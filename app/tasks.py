@@ -10,8 +10,8 @@ CARACTERÍSTICAS:
 Archivo: app/tasks.py (VERSIÓN OPTIMIZADA)
 """
 from celery import shared_task
-from django.db import transaction, connection
-from django.db.models import F
+from django.db import connection, transaction, close_old_connections
+from django.db.models import Count, F
 from .models import Movil, Consecutive
 from django.core.cache import cache
 import logging
@@ -19,41 +19,81 @@ from time import sleep
 
 # Importación del sistema de rotación de proxies
 from app.proxy_rotation_system import get_proxy_rotator
+from app import progress
+from app.signals import WARM_SOFT_TIME_LIMIT, WARM_TIME_LIMIT
 
 logger = logging.getLogger(__name__)
 
 
 def get_user_queue_name(user_id):
     """
-    Genera el nombre de cola para un usuario específico.
+    Genera el nombre de cola para un usuario específico y la registra para
+    que los workers la consuman (app/queue_registry.py).
     Cada usuario tiene su propia cola para garantizar procesamiento paralelo.
     """
-    return f'user_queue_{user_id}'
+    from app import queue_registry
+
+    queue_registry.ensure(user_id)
+    return queue_registry.queue_name(user_id)
 
 
 def update_progress_directly(consecutive_id, increment=1):
     """
-    Actualiza el progreso directamente en la BD sin usar cola de tareas.
-    Más rápido para actualizaciones en tiempo real.
+    Suma progreso a un Consecutive sin usar cola de tareas ni escribir en la BD.
+
+    El incremento va al contador Redis del archivo (app/progress.py) y la
+    tarea flush_progress lo aplica con un solo UPDATE progres = progres + n,
+    auto-completando el archivo una única vez.
     """
     try:
-        from django.utils import timezone
-        consecutive = Consecutive.objects.get(id=consecutive_id)
-        consecutive.progres += increment
-        
-        # Auto-completar si llegó al total
-        if consecutive.progres >= consecutive.total and consecutive.active:
-            consecutive.active = False
-            consecutive.finish = timezone.now()
-            logger.info(f"✅ ARCHIVO COMPLETADO: {consecutive.file} ({consecutive.progres}/{consecutive.total})")
-        
-        consecutive.save()
+        progress.increment(consecutive_id, increment)
         return True
     except Exception as e:
         logger.warning(f"[update_progress_directly] Error actualizando progreso {consecutive_id}: {e}")
         return False
 
 
+@shared_task
+def flush_progress():
+    """
+    Aplica en la BD el progreso acumulado en Redis (un UPDATE por archivo).
+    Ejecutar cada pocos segundos mediante beat scheduler.
+    """
+    flushed = progress.flush()
+    if flushed:
+        logger.debug(f"[flush_progress] {len(flushed)} archivos actualizados: {flushed}")
+    return {"status": "success", "flushed": len(flushed)}
+
+
+def bulk_save_moviles(rows, batch_size=500):
+    """
+    Inserta varias filas Movil con un solo INSERT por bloque.
+
+    Usa ON CONFLICT DO NOTHING sobre la clave única (user, file, number), por
+    lo que un duplicado concurrente no aborta el lote. Se arma el INSERT a mano
+    porque bulk_create(ignore_conflicts=True) no dice cuántas filas entraron.
+
+    Returns:
+        int: cantidad de filas realmente insertadas (sin las que ya existían)
+    """
+    if not rows:
+        return 0
+    fields = [f for f in Movil._meta.concrete_fields if not f.primary_key]
+    columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+    row_sql = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    inserted = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            chunk = rows[i:i + batch_size]
+            cursor.execute(
+                f"INSERT INTO {connection.ops.quote_name(Movil._meta.db_table)} ({columns}) "
+                f"VALUES {', '.join([row_sql] * len(chunk))} ON CONFLICT DO NOTHING",
+                [f.get_db_prep_save(f.pre_save(row, True), connection) for row in chunk for f in fields]
+            )
+            inserted += cursor.rowcount
+    return inserted
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=5)
 def process_save_task(self, phone, operator, user_id, file, ip):
     """
@@ -68,14 +108,10 @@ def process_save_task(self, phone, operator, user_id, file, ip):
         ip: Fuente de la información ('cache', 'database', 'scraping')
     """
     try:
-        with transaction.atomic():
-            movil = Movil.objects.create(
-                file=file,
-                number=phone,
-                operator=operator,
-                user_id=user_id,
-                ip=ip
-            )
+        # ON CONFLICT DO NOTHING: un reintento o duplicado no falla
+        bulk_save_moviles([
+            Movil(file=file, number=phone, operator=operator, user_id=user_id, ip=ip)
+        ])
 
         # Actualizar caché Redis con el nuevo número
         if operator and operator not in ['', 'No existe', 'Desconocido'] and ip != 'cache':
@@ -94,7 +130,8 @@ def process_save_task(self, phone, operator, user_id, file, ip):
         raise self.retry(exc=e, countdown=2 ** self.request.retries)
 
     finally:
-        connection.close()
+        # Devuelve la conexión solo si está rota o vencida (DB_POOL_MODE)
+        close_old_connections()
 
 
 @shared_task(bind=True, max_retries=3)
@@ -107,13 +144,11 @@ def update_consecutive_task(self, consecutive_id, increment_progress=True):
         increment_progress: Si True, incrementa el progreso en 1
     """
     try:
-        with transaction.atomic():
-            consecutive = Consecutive.objects.select_for_update().get(id=consecutive_id)
-
-            if increment_progress:
-                consecutive.progres += 1
+        if not Consecutive.objects.filter(id=consecutive_id).exists():
+            raise Consecutive.DoesNotExist
 
-            consecutive.save()
+        if increment_progress:
+            progress.increment(consecutive_id, 1)
 
         logger.debug(f"[update_consecutive_task] ✓ Consecutive {consecutive_id} actualizado")
         return {"status": "success", "consecutive_id": consecutive_id}
@@ -127,7 +162,8 @@ def update_consecutive_task(self, consecutive_id, increment_progress=True):
         raise self.retry(exc=e, countdown=2 ** self.request.retries)
 
     finally:
-        connection.close()
+        # Devuelve la conexión solo si está rota o vencida (DB_POOL_MODE)
+        close_old_connections()
 
 
 @shared_task
@@ -144,6 +180,28 @@ def cleanup_old_tasks(self):
     return {"status": "success", "cutoff_date": str(cutoff_date)}
 
 
+def count_moviles_by_file(consecutives):
+    """
+    Cuenta los registros Movil de varios archivos con un solo
+    GROUP BY file, user (índice único movil_user_file_number_uniq).
+
+    Returns:
+        dict: {(file, user_id): cantidad}
+    """
+    files = {c.file for c in consecutives}
+    user_ids = {c.user_id for c in consecutives}
+    if not files:
+        return {}
+    rows = (
+        Movil.objects
+        .filter(file__in=files, user_id__in=user_ids)
+        .values('file', 'user')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return {(row['file'], row['user']): row['count'] for row in rows}
+
+
 @shared_task
 def sync_progress_with_movil():
     """
@@ -155,22 +213,42 @@ def sync_progress_with_movil():
     
     synced = []
     completed = []
+    changed = {}
+
+    # Aplicar antes el progreso pendiente en Redis para no contarlo dos veces
+    progress.flush()
     
-    for c in Consecutive.objects.filter(active=True):
-        count = Movil.objects.filter(file=c.file).count()
+    active_files = list(
+        Consecutive.objects.filter(active=True).only('id', 'file', 'user', 'progres', 'total')
+    )
+    counts = count_moviles_by_file(active_files)
+
+    for c in active_files:
+        count = counts.get((c.file, c.user_id), 0)
         
         if count != c.progres:
             old_progres = c.progres
-            c.progres = count
+            Consecutive.objects.filter(id=c.id).update(progres=count)
+            progress.resync(c.id)
             
-            # Auto-completar si llegó al total
-            if c.progres >= c.total:
-                c.active = False
-                c.finish = timezone.now()
-                completed.append(f"{c.file}: {c.progres}/{c.total}")
+            row = {'id': c.id, 'progres': count}
+
+            # Auto-completar si llegó al total (UPDATE condicional: una sola vez)
+            finish = timezone.now()
+            if count >= c.total and Consecutive.objects.filter(id=c.id, active=True).update(
+                active=False, finish=finish
+            ):
+                completed.append(f"{c.file}: {count}/{c.total}")
+                row.update(active=False, finish=finish)
             
-            c.save()
-            synced.append(f"{c.file}: {old_progres} → {c.progres}/{c.total}")
+            synced.append(f"{c.file}: {old_progres} → {count}/{c.total}")
+            changed.setdefault(c.user_id, []).append(row)
+
+    # Solo cambian filas de archivos existentes: se actualizan en el resumen cacheado
+    if changed:
+        from app import job_summary
+        for user_id, rows in changed.items():
+            job_summary.update(user_id, rows)
     
     if synced:
         logger.info(f"[sync_progress] ✅ Sincronizados: {len(synced)} archivos")
@@ -199,21 +277,30 @@ def check_and_requeue_orphan_files():
     2. Archivos EN PROGRESO que se quedaron sin tareas en cola
     3. Archivos donde el progreso no avanza pero hay registros en Movil
     4. Archivos PAUSADOS que tienen tareas pendientes (se reactivan)
+
+    Al final ajusta las colas de usuario que consumen los workers
+    (queue_registry.sync): consumir las de usuarios con archivos activos y
+    cancelar las que quedaron vacías.
     """
-    import redis
     from django.utils import timezone
     from datetime import timedelta
-    
-    r = redis.Redis(host='127.0.0.1', port=6379, db=0)
+    from app import queue_registry
+
     requeued = []
     reactivated = []
     skipped = []
     
     # Buscar TODOS los archivos incompletos (activos Y pausados)
-    for c in Consecutive.objects.filter(progres__lt=F('total')):
-        user_queue = f'user_queue_{c.user.id}'
-        queue_count = r.llen(user_queue)
-        current_count = Movil.objects.filter(file=c.file).count()
+    incomplete = list(Consecutive.objects.filter(progres__lt=F('total')))
+    counts = count_moviles_by_file(incomplete)
+
+    # Largo de todas las colas de usuario en un solo round trip
+    queue_lengths = queue_registry.queue_lengths({c.user_id for c in incomplete})
+
+    for c in incomplete:
+        user_queue = queue_registry.queue_name(c.user_id)
+        queue_count = queue_lengths.get(c.user_id, 0)
+        current_count = counts.get((c.file, c.user_id), 0)
         
         should_requeue = False
         reason = ""
@@ -233,6 +320,7 @@ def check_and_requeue_orphan_files():
         elif queue_count == 0 and current_count > c.progres:
             c.progres = current_count
             c.save()
+            progress.resync(c.id)
             logger.info(f"[check_orphan] 📊 Sincronizado progreso: {c.file} → {c.progres}/{c.total}")
             
             if current_count < c.total and c.active:
@@ -250,7 +338,7 @@ def check_and_requeue_orphan_files():
         
         if should_requeue:
             logger.warning(f"[check_orphan] ⚠ Archivo huérfano: {c.file} (ID: {c.id}) - {reason}")
-            logger.info(f"[check_orphan]   Usuario: {c.user.id}, Progreso: {c.progres}/{c.total}, Movil: {current_count}, Cola: {queue_count}")
+            logger.info(f"[check_orphan]   Usuario: {c.user_id}, Progreso: {c.progres}/{c.total}, Movil: {current_count}, Cola: {queue_count}")
             
             # Asegurar que el archivo esté activo antes de re-encolar
             if not c.active:
@@ -258,10 +346,14 @@ def check_and_requeue_orphan_files():
                 c.save()
                 logger.info(f"[check_orphan] 🔄 Reactivado estado: {c.file}")
             
+            # Si la lista de trabajo ya se vació, volver a ingerir el archivo
+            # (recupera números cuyo procesamiento se perdió)
+            from app import worklist
             process_file_in_batches.apply_async(
                 kwargs={
                     'consecutive_id': c.id,
-                    'batch_size': 100
+                    'batch_size': 100,
+                    'rebuild': worklist.remaining(c.id) == 0
                 },
                 queue=user_queue
             )
@@ -272,6 +364,9 @@ def check_and_requeue_orphan_files():
             if queue_count > 0 and c.active:
                 skipped.append(f"{c.file}: {queue_count} tareas en cola")
     
+    # Colas bajo demanda: incluye las de los archivos reactivados/re-encolados arriba
+    queue_registry.sync({c.user_id for c in incomplete if c.active}, queue_lengths)
+
     if requeued:
         logger.info(f"[check_orphan] 🔄 Re-encolados {len(requeued)} archivos huérfanos")
     
@@ -308,6 +403,11 @@ def scrape_and_save_phone_task(self, phone_number, user_id, file_name, max_attem
         consecutive_id: ID del Consecutive para actualizar progreso
     """
     from django.contrib.auth.models import User
+    from app import phone_cache
+
+    claim_token, claimed = None, set()
+    # True en cuanto se sumó el progreso del número: desde ahí no se reintenta
+    counted = False
 
     try:
         # Obtener usuario
@@ -326,23 +426,17 @@ def scrape_and_save_phone_task(self, phone_number, user_id, file_name, max_attem
         if operator:
             logger.info(f"[scrape_and_save_phone_task] ✓ {phone_number} encontrado en {source} → {operator}")
 
-            # Verificar si ya existe en BD para este archivo
-            if not Movil.objects.filter(file=file_name, number=phone_number).exists():
-                with transaction.atomic():
-                    Movil.objects.create(
-                        file=file_name,
-                        number=phone_number,
-                        operator=operator,
-                        user=user,
-                        ip=source
-                    )
-                logger.info(f"[scrape_and_save_phone_task] ✅ Guardado desde {source}: {phone_number} | {operator}")
-            else:
-                logger.info(f"[scrape_and_save_phone_task] ⚠ Ya existe: {phone_number} en {file_name}")
+            # ON CONFLICT DO NOTHING sobre (user, file, number): si ya existe no se duplica
+            saved = bulk_save_moviles([
+                Movil(file=file_name, number=phone_number, operator=operator, user=user, ip=source)
+            ])
+            logger.info(f"[scrape_and_save_phone_task] ✅ Guardado desde {source}: {phone_number} | {operator}")
 
-            # Actualizar progreso del archivo directamente (sin tarea async)
-            if consecutive_id:
+            # Actualizar progreso del archivo directamente (sin tarea async);
+            # si ya existía, quien lo guardó ya sumó su progreso
+            if consecutive_id and saved:
                 update_progress_directly(consecutive_id, increment=1)
+                counted = True
                 logger.info(f"[scrape_and_save_phone_task] 📊 Progreso +1 directo (cache/BD) para consecutive_id={consecutive_id}")
 
             return {
@@ -357,58 +451,118 @@ def scrape_and_save_phone_task(self, phone_number, user_id, file_name, max_attem
         logger.info(f"[scrape_and_save_phone_task] 🔍 No encontrado, iniciando scraping para {phone_number}")
 
         # Verificar duplicado en DB (por si acaso)
-        if Movil.objects.filter(file=file_name, number=phone_number).exists():
+        if Movil.objects.filter(user=user, file=file_name, number=phone_number).exists():
+            # Quien lo guardó ya sumó su progreso: no se cuenta dos veces
             logger.info(f"[scrape_and_save_phone_task] ⚠ Ya existe: {phone_number}")
-            # Actualizar progreso aunque sea duplicado (directo)
-            if consecutive_id:
-                update_progress_directly(consecutive_id, increment=1)
-                logger.info(f"[scrape_and_save_phone_task] 📊 Progreso +1 directo (duplicado) para consecutive_id={consecutive_id}")
             return {"status": "skipped", "phone": phone_number, "reason": "duplicate"}
 
-        # Usar DigiPhone para scraping con reintentos
-        from .browser import DigiPhone
-        digi_phone = DigiPhone(user=user, reprocess=False)
+        # Singleflight: si otra tarea (otro archivo u otro usuario) ya está consultando
+        # este número, esperar su resultado en lugar de repetir la consulta
+        claim_token, claimed = phone_cache.claim([phone_number])
+        if not claimed:
+            logger.info(f"[scrape_and_save_phone_task] ⏳ {phone_number} ya se está consultando en otra tarea, esperando resultado...")
+            coalesced, _ = phone_cache.wait_for_results([phone_number])
+            if phone_number in coalesced:
+                operator = coalesced[phone_number]
+                saved = bulk_save_moviles([
+                    Movil(file=file_name, number=phone_number, operator=operator, user=user, ip="cache")
+                ])
+                if consecutive_id and saved:
+                    update_progress_directly(consecutive_id, increment=1)
+                    counted = True
+                logger.info(f"[scrape_and_save_phone_task] ✅ {phone_number} → {operator} (resultado de otra tarea)")
+                return {
+                    "status": "success",
+                    "phone": phone_number,
+                    "operator": operator,
+                    "source": "coalesced",
+                    "attempts": 0
+                }
+            if phone_cache.backed_off([phone_number]):
+                if consecutive_id:
+                    update_progress_directly(consecutive_id, increment=1)
+                    counted = True
+                return {
+                    "status": "failed",
+                    "phone": phone_number,
+                    "reason": "Falló en otra tarea (en pausa)"
+                }
+            # La otra tarea terminó sin resultado: tomar el relevo
+            claim_token, claimed = phone_cache.claim([phone_number])
+            if not claimed:
+                # Sigue en curso al vencer la espera: re-encolar en lugar de ocupar el worker
+                scrape_and_save_phone_task.apply_async(
+                    kwargs={
+                        'phone_number': phone_number,
+                        'user_id': user_id,
+                        'file_name': file_name,
+                        'max_attempts': max_attempts,
+                        'consecutive_id': consecutive_id
+                    },
+                    queue=get_user_queue_name(user_id)
+                )
+                logger.info(f"[scrape_and_save_phone_task] 🔁 {phone_number} sigue en consulta en otra tarea, re-encolado")
+                return {"status": "requeued", "phone": phone_number}
+
+        # Usar DigiPhone del pool del worker (sesiones ya autenticadas) con reintentos
+        from .session_pool import get_digiphone_pool
 
         operator = None
         attempts_made = 0
+        # True si DIGI respondió sobre el número (200/404); los errores de proxy,
+        # login o transporte no dicen nada del número
+        answered = False
         
-        # Intentar con múltiples proxies
-        for attempt in range(max_attempts):
-            attempts_made = attempt + 1
-            
-            try:
-                # Obtener acceso (modo simple: solo cookies)
-                if not digi_phone.get_access(get_cart=False):
-                    logger.warning(f"[scrape_and_save_phone_task] Intento {attempts_made}/{max_attempts}: No se pudo obtener acceso para {phone_number}, cambiando proxy...")
-                    digi_phone.change_position()
-                    continue
-
-                # Consultar operador
-                result = digi_phone.get_phone_number(phone=phone_number)
-
-                if result[0] == 200:
-                    operator = result[1].get('name', 'Desconocido')
-                    logger.info(f"[scrape_and_save_phone_task] ✓ {phone_number} → {operator} (intento {attempts_made})")
-                    break  # Éxito, salir del loop
-                elif result[0] == 404:
-                    operator = "DIGI SPAIN TELECOM, S.L."
-                    logger.info(f"[scrape_and_save_phone_task] ✓ {phone_number} → {operator} (404 - intento {attempts_made})")
-                    break  # Éxito, salir del loop
-                else:
-                    logger.warning(f"[scrape_and_save_phone_task] Intento {attempts_made}/{max_attempts}: Status {result[0]} para {phone_number}, cambiando proxy...")
+        with get_digiphone_pool().session(user) as digi_phone:
+            # Intentar con múltiples proxies
+            for attempt in range(max_attempts):
+                attempts_made = attempt + 1
+                
+                try:
+                    # Obtener acceso solo si el token del proxy actual no está vigente
+                    if not digi_phone.ensure_access(get_cart=False):
+                        logger.warning(f"[scrape_and_save_phone_task] Intento {attempts_made}/{max_attempts}: No se pudo obtener acceso para {phone_number}, cambiando proxy...")
+                        digi_phone.change_position()
+                        continue
+
+                    # Consultar operador
+                    result = digi_phone.get_phone_number(phone=phone_number)
+
+                    if result[0] == 200:
+                        answered = True
+                        operator = result[1].get('name', 'Desconocido')
+                        logger.info(f"[scrape_and_save_phone_task] ✓ {phone_number} → {operator} (intento {attempts_made})")
+                        break  # Éxito, salir del loop
+                    elif result[0] == 404:
+                        answered = True
+                        operator = "DIGI SPAIN TELECOM, S.L."
+                        logger.info(f"[scrape_and_save_phone_task] ✓ {phone_number} → {operator} (404 - intento {attempts_made})")
+                        break  # Éxito, salir del loop
+                    elif result[0] in [401, 498]:
+                        # Token vencido/rechazado: forzar login en el siguiente intento
+                        logger.warning(f"[scrape_and_save_phone_task] Intento {attempts_made}/{max_attempts}: Status {result[0]} para {phone_number}, renovando cookies...")
+                        digi_phone.invalidate_access()
+                    else:
+                        logger.warning(f"[scrape_and_save_phone_task] Intento {attempts_made}/{max_attempts}: Status {result[0]} para {phone_number}, cambiando proxy...")
+                        digi_phone.change_position()
+                        
+                except Exception as e:
+                    logger.warning(f"[scrape_and_save_phone_task] Intento {attempts_made}/{max_attempts}: Error para {phone_number}: {str(e)[:100]}, cambiando proxy...")
                     digi_phone.change_position()
-                    
-            except Exception as e:
-                logger.warning(f"[scrape_and_save_phone_task] Intento {attempts_made}/{max_attempts}: Error para {phone_number}: {str(e)[:100]}, cambiando proxy...")
-                digi_phone.change_position()
         
         # Si después de todos los intentos no se obtuvo operador válido
         if not operator or operator in ['', 'No existe', 'Desconocido', 'ERROR_SCRAPING']:
             logger.error(f"[scrape_and_save_phone_task] ✗ Falló después de {max_attempts} intentos para {phone_number} - NO se guarda en BD")
+
+            # Caché negativo (global, para todos los usuarios): solo si DIGI respondió
+            # sin operador válido; un fallo de proxy/login de este usuario no pausa el número
+            if answered:
+                phone_cache.record_failures([phone_number])
             
             # SÍ actualizar progreso porque se intentó procesar (directo)
             if consecutive_id:
                 update_progress_directly(consecutive_id, increment=1)
+                counted = True
                 logger.info(f"[scrape_and_save_phone_task] 📊 Progreso +1 directo (fallido) para consecutive_id={consecutive_id}")
             
             return {
@@ -418,14 +572,9 @@ def scrape_and_save_phone_task(self, phone_number, user_id, file_name, max_attem
             }
 
         # Paso 3: Guardar en base de datos SOLO si hay operador válido
-        with transaction.atomic():
-            Movil.objects.create(
-                file=file_name,
-                number=phone_number,
-                operator=operator,
-                user=user,
-                ip="scraping"
-            )
+        saved = bulk_save_moviles([
+            Movil(file=file_name, number=phone_number, operator=operator, user=user, ip="scraping")
+        ])
 
         # Actualizar caché si fue exitoso
         try:
@@ -437,11 +586,12 @@ def scrape_and_save_phone_task(self, phone_number, user_id, file_name, max_attem
 
         logger.info(f"[scrape_and_save_phone_task] ✅ {phone_number} → {operator} | Archivo: {file_name} | Usuario: {user_id}")
 
-        # Actualizar progreso del archivo (directo)
-        if consecutive_id:
+        # Actualizar progreso del archivo (directo); un duplicado concurrente no suma
+        if consecutive_id and saved:
             update_progress_directly(consecutive_id, increment=1)
+            counted = True
             logger.info(f"[scrape_and_save_phone_task] 📊 Progreso +1 directo (éxito) para consecutive_id={consecutive_id}")
-        else:
+        elif not consecutive_id:
             logger.warning(f"[scrape_and_save_phone_task] ⚠ No hay consecutive_id, progreso NO actualizado para {phone_number}")
 
         return {
@@ -452,57 +602,388 @@ def scrape_and_save_phone_task(self, phone_number, user_id, file_name, max_attem
 
     except Exception as e:
         logger.error(f"[scrape_and_save_phone_task] ✗ Error crítico para {phone_number}: {e}")
-        # Actualizar progreso incluso en error para que el archivo no se quede atorado (directo)
+        if counted:
+            # El progreso ya se sumó: reintentar lo contaría dos veces
+            return {"status": "error", "phone": phone_number, "reason": str(e)}
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        # Último intento: cuenta como procesado para que el archivo no se quede atorado (directo)
         if consecutive_id:
             update_progress_directly(consecutive_id, increment=1)
             logger.info(f"[scrape_and_save_phone_task] 📊 Progreso +1 directo (error) para consecutive_id={consecutive_id}")
+        raise
+
+    finally:
+        if claimed:
+            phone_cache.release(claim_token, list(claimed))
+        # Devuelve la conexión solo si está rota o vencida (DB_POOL_MODE)
+        close_old_connections()
+
+
+def _lookup_with_singleflight(lookup, numbers, max_attempts):
+    """
+    Consulta con lookup(numeros, max_attempts, keepalive) → {numero: operador | None}
+    los números cuya marca de consulta en curso se pudo tomar, deja el
+    resultado en caché y libera las marcas. None significa que DIGI no
+    respondió (proxy, login o transporte); solo las respuestas sin operador
+    válido van al caché negativo. keepalive() renueva el lease de las marcas
+    mientras la consulta sigue; los números que lookup no devuelve quedaron
+    sin consultar (se acabó el tiempo del bloque).
+
+    Returns:
+        tuple: (dict {numero: operador} válidos, lista de números que consulta
+        otra tarea, lista de números sin consultar)
+    """
+    from app import phone_cache
+
+    token, claimed = phone_cache.claim(numbers)
+    mine = [n for n in numbers if n in claimed]
+    try:
+        results = lookup(mine, max_attempts, lambda: phone_cache.extend(token, mine)) if mine else {}
+        found = {
+            phone: operator for phone, operator in results.items()
+            if operator and operator not in ['', 'No existe', 'Desconocido', 'ERROR_SCRAPING']
+        }
+
+        # Publicar el resultado antes de liberar las marcas (lo leen las tareas en espera)
+        try:
+            from .signals import add_many_to_phone_cache
+            add_many_to_phone_cache(found)
+        except Exception as e:
+            logger.warning(f"[scrape_batch] Error actualizando caché: {e}")
+
+        # Caché negativo: pausar solo los que DIGI respondió sin operador válido
+        phone_cache.record_failures([
+            phone for phone, operator in results.items()
+            if operator is not None and phone not in found
+        ])
+    finally:
+        phone_cache.release(token, mine)
+
+    return found, [n for n in numbers if n not in claimed], [n for n in mine if n not in results]
+
+
+def _scrape_batch(consecutive, numbers, lookup, max_attempts, task_name):
+    """
+    Cuerpo común de scrape_batch_task y scrape_batch_async_task: descarta los
+    ya guardados, consulta el resto con lookup (singleflight), guarda con un
+    solo bulk_create y suma el progreso del bloque con un único incremento.
+    Los números que no se alcanzaron a consultar no cuentan como procesados y
+    se devuelven en "unfinished" para re-encolarlos.
+    """
+    # Descartar números ya guardados para este archivo (reintentos / duplicados)
+    already_saved = set(
+        Movil.objects.filter(
+            file=consecutive.file,
+            user=consecutive.user,
+            number__in=numbers
+        ).values_list('number', flat=True)
+    )
+    pending = [n for n in numbers if n not in already_saved]
+
+    # Resueltos por otra tarea desde que se encoló el bloque (p. ej. un bloque
+    # re-encolado mientras otro los consultaba): un solo MGET
+    from app import phone_cache
+    coalesced = phone_cache.lookup_many(pending)
+
+    # Consultar solo los números que ninguna otra tarea está consultando
+    found, others, unfinished = _lookup_with_singleflight(
+        lookup, [n for n in pending if n not in coalesced], max_attempts
+    )
+
+    # Los demás: esperar (poco) el resultado de la tarea que los consulta
+    if others:
+        waited, unresolved = phone_cache.wait_for_results(others)
+        coalesced.update(waited)
+        paused = phone_cache.backed_off(unresolved)
+        takeover = [n for n in unresolved if n not in paused]
+        if takeover:
+            # La otra tarea terminó sin resultado (murió o se agotó el lease): tomar el
+            # relevo; los que siguen en curso se re-encolan en lugar de seguir esperando
+            more, busy, not_done = _lookup_with_singleflight(lookup, takeover, max_attempts)
+            found.update(more)
+            unfinished += not_done + busy
+
+    saved = bulk_save_moviles([
+        Movil(
+            file=consecutive.file,
+            number=phone,
+            operator=operator,
+            user=consecutive.user,
+            ip=source
+        )
+        for source, resolved in (("scraping", found), ("cache", coalesced))
+        for phone, operator in resolved.items()
+    ])
+
+    # Progreso: filas realmente insertadas (un duplicado concurrente ya lo sumó
+    # quien lo guardó) más los consultados que fallaron, que cuentan como
+    # procesados igual que en scrape_and_save_phone_task; los no consultados se re-encolan
+    failed = len(pending) - len(found) - len(coalesced) - len(unfinished)
+    update_progress_directly(consecutive.id, increment=saved + failed)
+    logger.info(
+        f"[{task_name}] ✅ {consecutive.file}: {len(found)}/{len(pending)} resueltos, "
+        f"{len(coalesced)} de otras tareas, {failed} fallidos, {len(already_saved)} ya existían, "
+        f"{len(unfinished)} sin consultar"
+    )
+    return {
+        "status": "success",
+        "consecutive_id": consecutive.id,
+        "resolved": len(found),
+        "coalesced": len(coalesced),
+        "failed": failed,
+        "skipped": len(already_saved),
+        "unfinished": unfinished
+    }
+
+
+class _BatchBudget:
+    """Tiempo disponible de un scrape_batch_task (SCRAPE_BATCH_BUDGET o soft time limit)"""
+
+    def __init__(self, seconds):
+        from time import monotonic
+
+        self.deadline = monotonic() + seconds
+        self.soft_limit = False
+
+    @property
+    def exhausted(self):
+        from time import monotonic
+
+        return self.soft_limit or monotonic() >= self.deadline
+
+
+def _scrape_numbers(digi_phone, numbers, max_attempts, keepalive=None, budget=None):
+    """
+    Consulta números en serie con un DigiPhone del pool. Cada número lleva su
+    propio contador de intentos; si falla vuelve al final de la cola, así el
+    reintento sale por otro proxy después del resto del bloque.
+
+    Renueva las marcas singleflight con keepalive() cada tercio del lease y
+    se detiene al agotarse budget (o al llegar el soft time limit), dejando
+    fuera del resultado los números que no alcanzó a consultar.
+
+    Returns:
+        dict: {numero: operador} con los que DIGI respondió (el operador puede
+        no ser válido); los que agotaron los intentos sin respuesta quedan en None
+    """
+    from collections import deque
+    from time import monotonic
+    from celery.exceptions import SoftTimeLimitExceeded
+    from django.conf import settings
+
+    refresh_every = getattr(settings, 'SINGLEFLIGHT_LEASE', 120) / 3
+    refreshed_at = monotonic()
+    queue = deque((phone, 0) for phone in numbers)
+    results = {}
+    while queue:
+        if budget is not None and budget.exhausted:
+            break
+        if keepalive is not None and monotonic() - refreshed_at >= refresh_every:
+            keepalive()
+            refreshed_at = monotonic()
+
+        phone, attempts = queue.popleft()
+        attempts += 1
+        answered, operator = False, None
+        try:
+            # Obtener acceso solo si el token del proxy actual no está vigente
+            if not digi_phone.ensure_access(get_cart=False):
+                logger.warning(f"[scrape_batch_task] Intento {attempts}/{max_attempts}: Sin acceso para {phone}, cambiando proxy...")
+                digi_phone.change_position()
+            else:
+                result = digi_phone.get_phone_number(phone=phone)
+                if result[0] == 200:
+                    answered, operator = True, result[1].get('name', 'Desconocido')
+                elif result[0] == 404:
+                    answered, operator = True, "DIGI SPAIN TELECOM, S.L."
+                elif result[0] in [401, 498]:
+                    # Token vencido/rechazado: forzar login en el siguiente intento
+                    digi_phone.invalidate_access()
+                else:
+                    logger.warning(f"[scrape_batch_task] Intento {attempts}/{max_attempts}: Status {result[0]} para {phone}, cambiando proxy...")
+                    digi_phone.change_position()
+        except SoftTimeLimitExceeded:
+            # Quedan pocos segundos: cortar aquí para guardar lo consultado
+            logger.warning(f"[scrape_batch_task] ⏱ Soft time limit con {len(queue) + 1} números sin consultar")
+            if budget is not None:
+                budget.soft_limit = True
+            break
+        except Exception as e:
+            logger.warning(f"[scrape_batch_task] Intento {attempts}/{max_attempts}: Error para {phone}: {str(e)[:100]}, cambiando proxy...")
+            digi_phone.change_position()
+
+        if answered:
+            results[phone] = operator
+        elif attempts < max_attempts:
+            queue.append((phone, attempts))
+        else:
+            results[phone] = None
+    return results
+
+
+def _requeue_batch(consecutive, numbers, max_attempts, task=None):
+    """
+    Envía en un nuevo bloque (scrape_batch_task por defecto) los números que
+    el bloque no alcanzó a consultar o que otra tarea sigue consultando.
+    """
+    if not numbers:
+        return
+    task = task or scrape_batch_task
+    task.apply_async(
+        kwargs={
+            'consecutive_id': consecutive.id,
+            'numbers': numbers,
+            'max_attempts': max_attempts
+        },
+        queue=get_user_queue_name(consecutive.user_id)
+    )
+    logger.info(f"[{task.__name__}] 🔁 {len(numbers)} números de {consecutive.file} re-encolados")
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=10)
+def scrape_batch_task(self, consecutive_id, numbers, max_attempts=3):
+    """
+    Consulta un bloque de números (SCRAPE_BATCH_SIZE, 50-500) en un solo
+    mensaje con el motor síncrono: una búsqueda del Consecutive y del usuario,
+    un DigiPhone del pool para todo el bloque, reintentos por número dentro
+    del bloque, un bulk_create y un único incremento de progreso.
+
+    El bloque dura como máximo SCRAPE_BATCH_BUDGET segundos: lo consultado se
+    guarda y el resto se re-encola. Si llega el soft time limit se guarda lo
+    consultado y se re-encola el resto antes de relanzar la excepción.
+
+    Args:
+        consecutive_id: ID del Consecutive
+        numbers: Lista de números a consultar
+        max_attempts: Intentos por número (cambiando de proxy)
+    """
+    from celery.exceptions import SoftTimeLimitExceeded
+    from django.conf import settings
+    from .session_pool import get_digiphone_pool
+
+    try:
+        consecutive = Consecutive.objects.select_related('user').get(id=consecutive_id)
+    except Consecutive.DoesNotExist:
+        logger.error(f"[scrape_batch_task] Consecutive {consecutive_id} no existe")
+        return {"status": "error", "message": "Consecutive not found"}
+
+    budget = _BatchBudget(getattr(settings, 'SCRAPE_BATCH_BUDGET', 180))
+    # _scrape_batch suma el progreso del bloque al final: si devolvió resultado,
+    # el bloque ya se contó y no se vuelve a ejecutar entero
+    result = None
+    try:
+        with get_digiphone_pool().session(consecutive.user) as digi_phone:
+            result = _scrape_batch(
+                consecutive, numbers,
+                lambda phones, attempts, keepalive: _scrape_numbers(digi_phone, phones, attempts, keepalive, budget),
+                max_attempts, "scrape_batch_task"
+            )
+        _requeue_batch(consecutive, result["unfinished"], max_attempts)
+        if budget.soft_limit:
+            raise SoftTimeLimitExceeded()
+        return result
+
+    except SoftTimeLimitExceeded:
+        if result is None:
+            # Llegó antes de sumar el progreso (guardado, espera de otras tareas):
+            # se re-encola el bloque entero (los ya guardados se descartan)
+            _requeue_batch(consecutive, numbers, max_attempts)
+        raise
+
+    except Exception as e:
+        logger.error(f"[scrape_batch_task] ✗ Error en bloque de {consecutive.file}: {e}")
+        if result is not None:
+            # Progreso ya aplicado: reintentar lo contaría dos veces. Lo no
+            # re-encolado lo recupera check_and_requeue_orphan_files
+            return result
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+    finally:
+        # Devuelve la conexión solo si está rota o vencida (DB_POOL_MODE)
+        close_old_connections()
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=10)
+def scrape_batch_async_task(self, consecutive_id, numbers, max_attempts=3):
+    """
+    Consulta un bloque de números con el motor asíncrono (AsyncDigiPhone):
+    cientos de consultas concurrentes sobre los proxies SOCKS5 del usuario
+    desde un solo proceso, con límite de concurrencia por proxy.
+
+    Guarda los resultados con un solo bulk_create, actualiza el caché en un
+    pipeline y suma el progreso del bloque con un único incremento.
+
+    Args:
+        consecutive_id: ID del Consecutive
+        numbers: Lista de números a consultar
+        max_attempts: Reintentos por número (cambiando de proxy)
+    """
+    import asyncio
+    from django.conf import settings
+    from .async_browser import AsyncDigiPhone
+
+    try:
+        consecutive = Consecutive.objects.select_related('user').get(id=consecutive_id)
+    except Consecutive.DoesNotExist:
+        logger.error(f"[scrape_batch_async_task] Consecutive {consecutive_id} no existe")
+        return {"status": "error", "message": "Consecutive not found"}
+
+    result = None
+    try:
+        engine = AsyncDigiPhone.from_user(
+            consecutive.user,
+            per_proxy_concurrency=getattr(settings, 'ASYNC_SCRAPE_PER_PROXY_CONCURRENCY', 4),
+            max_concurrency=getattr(settings, 'ASYNC_SCRAPE_MAX_CONCURRENCY', 200),
+        )
+        if engine._len_proxy == 0:
+            # Sin proxies no hay consulta: cuentan como fallidos del archivo, sin caché negativo
+            logger.warning(f"[scrape_batch_async_task] Usuario {consecutive.user.id} sin proxies asignados, bloque sin consultar")
+            update_progress_directly(consecutive.id, increment=len(numbers))
+            return {"status": "error", "message": "User has no proxies", "consecutive_id": consecutive.id}
+
+        # El ORM no se usa dentro del event loop: proxies cargados antes, guardado después
+        result = _scrape_batch(
+            consecutive, numbers,
+            lambda phones, attempts, keepalive: asyncio.run(engine.run_lookups(phones, max_attempts=attempts)),
+            max_attempts, "scrape_batch_async_task"
+        )
+        _requeue_batch(consecutive, result["unfinished"], max_attempts, task=scrape_batch_async_task)
+        return result
+
+    except Exception as e:
+        logger.error(f"[scrape_batch_async_task] ✗ Error en bloque de {consecutive.file}: {e}")
+        if result is not None:
+            # Progreso ya aplicado (ver scrape_batch_task): no se reintenta el bloque
+            return result
         raise self.retry(exc=e, countdown=2 ** self.request.retries)
 
     finally:
-        connection.close()
+        # Devuelve la conexión solo si está rota o vencida (DB_POOL_MODE)
+        close_old_connections()
 
 
 @shared_task(bind=True)
 def update_consecutive_progress_task(self, consecutive_id, increment=1):
     """
-    Actualiza el progreso de un Consecutive de forma atómica.
-    Auto-finaliza cuando progres >= total.
-    
+    Suma progreso a un Consecutive. Se conserva por compatibilidad con
+    mensajes ya encolados: el incremento va al contador Redis del archivo
+    y flush_progress lo aplica (y auto-finaliza) en la BD.
+
     Args:
         consecutive_id: ID del registro Consecutive
         increment: Cantidad a incrementar el progreso (default: 1)
     """
     try:
-        from django.utils import timezone
-
-        with transaction.atomic():
-            consecutive = Consecutive.objects.select_for_update().get(id=consecutive_id)
-            consecutive.progres += increment
-
-            # Auto-finalizar si completó el total
-            if consecutive.progres >= consecutive.total and consecutive.active:
-                consecutive.active = False
-                consecutive.finish = timezone.now()
-                logger.info(
-                    f"✅ [update_consecutive_progress] ARCHIVO COMPLETADO: "
-                    f"{consecutive.file} ({consecutive.progres}/{consecutive.total})"
-                )
+        if not Consecutive.objects.filter(id=consecutive_id).exists():
+            raise Consecutive.DoesNotExist
 
-            consecutive.save()
-
-        progress_pct = (consecutive.progres / consecutive.total * 100) if consecutive.total > 0 else 0
-        logger.debug(
-            f"[update_consecutive_progress_task] Progreso: "
-            f"{consecutive.file} ({consecutive.progres}/{consecutive.total}) - {progress_pct:.1f}%"
-        )
+        progress.increment(consecutive_id, increment)
 
         return {
             "status": "success",
             "consecutive_id": consecutive_id,
-            "progres": consecutive.progres,
-            "total": consecutive.total,
-            "progress_percentage": round(progress_pct, 2),
-            "completed": consecutive.progres >= consecutive.total
+            "increment": increment
         }
 
     except Consecutive.DoesNotExist:
@@ -514,15 +995,18 @@ def update_consecutive_progress_task(self, consecutive_id, increment=1):
         raise self.retry(exc=e, countdown=5, max_retries=3)
 
     finally:
-        connection.close()
+        # Devuelve la conexión solo si está rota o vencida (DB_POOL_MODE)
+        close_old_connections()
 
 
 @shared_task(bind=True)
-def process_file_in_batches(self, consecutive_id, batch_size=200):
+def process_file_in_batches(self, consecutive_id, batch_size=200, rebuild=False):
     """
     Procesa un archivo en lotes usando caché Redis para evitar scraping redundante.
     
     Ventajas del sistema:
+    - El archivo se parsea una sola vez (lista de trabajo en Redis, ver app/worklist.py)
+    - Cada lote extrae sus números de la lista en O(lote)
     - Consulta en caché Redis (< 1ms por número)
     - Solo hace scraping de números nuevos
     - Procesamiento distribuido via Celery
@@ -530,7 +1014,11 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
     Args:
         consecutive_id: ID del registro Consecutive
         batch_size: Cantidad de números a procesar por lote (default: 200)
+        rebuild: Si True, vuelve a ingerir el archivo aunque ya exista la lista
     """
+    from app import worklist
+
+    current_batch = []
     try:
         consecutive = Consecutive.objects.get(id=consecutive_id)
 
@@ -539,41 +1027,21 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
             logger.info(f"[process_file_in_batches] Archivo {consecutive.file} ya no está activo")
             return {"status": "cancelled", "consecutive_id": consecutive_id}
 
-        # Obtener números ya procesados (evita query N+1)
-        already_processed_numbers = set(
-            Movil.objects.filter(
-                file=consecutive.file,
-                user=consecutive.user
-            ).values_list('number', flat=True)
-        )
-
-        # Cargar todos los números del archivo
-        import pandas as pd
-        file_path = f"/opt/masterfilter/media/subido/{consecutive.file}"
-
-        # Determinar formato y leer archivo
-        if consecutive.file.endswith('.xlsx'):
-            df = pd.read_excel(file_path)
-        elif consecutive.file.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            logger.error(f"[process_file_in_batches] Formato no soportado: {consecutive.file}")
-            return {"status": "error", "message": "Unsupported format"}
-
-        # Obtener columna de números (primera columna)
-        phone_column = df.columns[0]
-        all_phones = df[phone_column].astype(str).str.strip().tolist()
-
-        # Filtrar números ya procesados
-        pending_phones = [p for p in all_phones if p not in already_processed_numbers]
+        # Ingesta única: parsear archivo y construir la lista de pendientes
+        if rebuild or not worklist.exists(consecutive_id):
+            try:
+                worklist.ingest(consecutive)
+            except ValueError as e:
+                logger.error(f"[process_file_in_batches] {e}")
+                return {"status": "error", "message": "Unsupported format"}
 
-        # Procesar solo un lote
-        current_batch = pending_phones[:batch_size]
+        # Procesar solo un lote (extraído de la cabeza de la lista)
+        current_batch, remaining = worklist.pop_batch(consecutive_id, batch_size)
 
         logger.info(
             f"[process_file_in_batches] 📁 {consecutive.file} | "
             f"Lote: {len(current_batch)} números | "
-            f"Pendientes: {len(pending_phones)}"
+            f"Pendientes: {remaining + len(current_batch)}"
         )
 
         # Métricas del lote
@@ -582,17 +1050,53 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
         scraping_needed = 0
         errors = 0
 
+        # Verificar en caché + BD todo el lote (un MGET + una consulta)
+        from app.views import check_many_in_cache_and_db
+        hits = check_many_in_cache_and_db(current_batch)
+
+        # Números del lote que ya existen en ESTE archivo (una sola consulta)
+        already_saved = set(
+            Movil.objects.filter(
+                file=consecutive.file,
+                user=consecutive.user,
+                number__in=current_batch
+            ).values_list('number', flat=True)
+        )
+
+        # Números que fallaron hace poco: no se vuelven a consultar hasta que
+        # termine su pausa (caché negativo con backoff exponencial)
+        from app import phone_cache
+        unresolved = [
+            n for n in current_batch
+            if n not in already_saved and n not in hits['cache'] and n not in hits['database']
+        ]
+        paused = phone_cache.backed_off(unresolved)
+        skipped_failures = 0
+
+        # Filas resueltas desde caché/BD, se guardan juntas al final del lote
+        resolved_rows = []
+        user_queue = get_user_queue_name(consecutive.user.id)
+
+        # Motor de scraping: 'batch' y 'async' agrupan los números del lote en
+        # mensajes de SCRAPE_BATCH_SIZE; 'sync' encola un mensaje por número
+        from django.conf import settings
+        engine = getattr(settings, 'SCRAPE_ENGINE', 'sync')
+        grouped_engine = engine in ('batch', 'async')
+        to_scrape = []
+
         # Encolar tareas para este lote
         for phone in current_batch:
             try:
-                # Verificar si ya existe en BD para ESTE archivo específico
-                if Movil.objects.filter(file=consecutive.file, number=phone).exists():
+                if phone in already_saved:
                     # Ya procesado en este archivo, saltar
                     continue
                 
-                # Verificar en caché + BD con una sola llamada
-                from app.views import check_scraping_in_cache_and_db
-                operator, source = check_scraping_in_cache_and_db(phone)
+                if phone in hits['cache']:
+                    operator, source = hits['cache'][phone], 'cache'
+                elif phone in hits['database']:
+                    operator, source = hits['database'][phone], 'database'
+                else:
+                    operator, source = None, None
 
                 if operator:
                     # Encontrado en caché o BD - guardar directamente (sin usar tarea)
@@ -601,23 +1105,26 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
                     elif source == 'database':
                         db_hits += 1
 
-                    # Guardar directamente en BD (más rápido que encolar tarea)
-                    try:
-                        with transaction.atomic():
-                            Movil.objects.create(
-                                file=consecutive.file,
-                                number=phone,
-                                operator=operator,
-                                user=consecutive.user,
-                                ip=source
-                            )
-                    except Exception as save_error:
-                        logger.warning(f"[process_file_in_batches] Error guardando {phone}: {save_error}")
+                    resolved_rows.append(Movil(
+                        file=consecutive.file,
+                        number=phone,
+                        operator=operator,
+                        user=consecutive.user,
+                        ip=source
+                    ))
+
+                elif phone in paused:
+                    # Falló hace poco: cuenta como procesado, igual que un scraping fallido
+                    skipped_failures += 1
+
+                elif grouped_engine:
+                    # Requiere scraping - se envía en bloque (scrape_batch_task / scrape_batch_async_task)
+                    scraping_needed += 1
+                    to_scrape.append(phone)
 
                 else:
                     # Requiere scraping - enviar a cola del usuario
                     scraping_needed += 1
-                    user_queue = get_user_queue_name(consecutive.user.id)
                     scrape_and_save_phone_task.apply_async(
                         kwargs={
                             'phone_number': phone,
@@ -633,6 +1140,32 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
                 errors += 1
                 logger.error(f"[process_file_in_batches] Error procesando {phone}: {e}")
 
+        if to_scrape:
+            batch_task = scrape_batch_async_task if engine == 'async' else scrape_batch_task
+            chunk_size = getattr(settings, 'SCRAPE_BATCH_SIZE', 100)
+            for i in range(0, len(to_scrape), chunk_size):
+                batch_task.apply_async(
+                    kwargs={
+                        'consecutive_id': consecutive.id,
+                        'numbers': to_scrape[i:i + chunk_size],
+                        'max_attempts': 3
+                    },
+                    queue=user_queue
+                )
+
+        # Guardar todos los aciertos de caché/BD en un solo INSERT (más rápido que encolar tareas)
+        # y sumar su progreso con un único incremento atómico
+        if resolved_rows:
+            try:
+                saved = bulk_save_moviles(resolved_rows)
+                update_progress_directly(consecutive.id, increment=saved)
+            except Exception as save_error:
+                errors += len(resolved_rows)
+                logger.warning(f"[process_file_in_batches] Error guardando {len(resolved_rows)} números: {save_error}")
+
+        if skipped_failures:
+            update_progress_directly(consecutive.id, increment=skipped_failures)
+
         # Log de estadísticas del lote
         total_batch = len(current_batch)
         cache_hit_rate = (cache_hits / total_batch * 100) if total_batch > 0 else 0
@@ -643,11 +1176,14 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
             f"   └─ Caché Redis: {cache_hits} ({cache_hit_rate:.1f}%)\n"
             f"   └─ Base de datos: {db_hits} ({db_hits/total_batch*100 if total_batch > 0 else 0:.1f}%)\n"
             f"   └─ Requiere scraping: {scraping_needed} ({scraping_needed/total_batch*100 if total_batch > 0 else 0:.1f}%)\n"
+            f"   └─ En pausa por fallos recientes: {skipped_failures}\n"
             f"   └─ Errores: {errors}"
         )
 
+        # Lote entregado: ya no se devuelve a la lista si algo falla después
+        current_batch = []
+
         # Programar siguiente lote si hay más números pendientes
-        remaining = len(pending_phones) - batch_size
         if remaining > 0:
             logger.info(f"[process_file_in_batches] Quedan {remaining} números. Programando siguiente lote en 1s...")
 
@@ -660,15 +1196,18 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
             )
         else:
             logger.info(f"[process_file_in_batches] ✅ Archivo {consecutive.file} completamente encolado")
+            # Aplicar ya el progreso de los últimos lotes (completa el archivo si llegó al total)
+            progress.flush([consecutive_id])
 
         return {
             "status": "success",
             "consecutive_id": consecutive_id,
-            "batch_processed": len(current_batch),
-            "remaining": max(0, remaining),
+            "batch_processed": total_batch,
+            "remaining": remaining,
             "cache_hits": cache_hits,
             "db_hits": db_hits,
             "scraping_needed": scraping_needed,
+            "skipped_failures": skipped_failures,
             "errors": errors,
             "cache_hit_rate": round(cache_hit_rate, 2)
         }
@@ -679,17 +1218,23 @@ def process_file_in_batches(self, consecutive_id, batch_size=200):
 
     except Exception as e:
         logger.error(f"[process_file_in_batches] Error: {e}")
+        # Devolver el lote a la lista para que el reintento no pierda números
+        try:
+            worklist.push_back(consecutive_id, current_batch)
+        except Exception as push_error:
+            logger.warning(f"[process_file_in_batches] No se pudo devolver el lote a la lista: {push_error}")
         raise self.retry(exc=e, countdown=30, max_retries=3)
 
     finally:
-        connection.close()
+        # Devuelve la conexión solo si está rota o vencida (DB_POOL_MODE)
+        close_old_connections()
 
 
 # ============================================================================
 # Tareas de Gestión de Proxies
 # ============================================================================
 
-@shared_task
+@shared_task(bind=True)
 def report_proxy_rotation_stats(self):
     """
     Reporta estadísticas de rotación de proxies.
@@ -699,18 +1244,15 @@ def report_proxy_rotation_stats(self):
     rotator = get_proxy_rotator()
     stats = rotator.get_stats()
 
-    # Calcular top proxies por rendimiento
-    top_proxies = []
-    for proxy_id, times in rotator.metrics.items():
-        if times:
-            avg_time = sum(times) / len(times)
-            top_proxies.append({
-                'id': proxy_id,
-                'avg_time': round(avg_time, 2),
-                'attempts': rotator.attempt_counts.get(proxy_id, 0)
-            })
-
-    top_proxies.sort(key=lambda x: x['avg_time'])
+    # Calcular top proxies por rendimiento (métricas compartidas en Redis)
+    top_proxies = [
+        {
+            'id': p['id'],
+            'avg_time': round(p['ewma'], 2),
+            'attempts': p['attempts']
+        }
+        for p in rotator.get_top_proxies(limit=10)
+    ]
 
     # Log del reporte
     logger.info("="*80)
@@ -735,21 +1277,46 @@ def report_proxy_rotation_stats(self):
     }
 
 
-@shared_task
+@shared_task(bind=True)
 def clear_proxy_blacklist(self):
     """
     Limpia la blacklist de proxies.
     
     Útil para liberar todos los proxies blacklisted manualmente
     después de resolver problemas de conectividad.
+    El registro es compartido: libera los proxies en todos los workers.
     """
     rotator = get_proxy_rotator()
-    before = len(rotator.blacklist)
-    rotator.blacklist.clear()
+    before = rotator.clear_blacklist()
     logger.info(f"🧹 Blacklist limpiada: {before} proxies liberados")
     return {"status": "success", "cleared": before}
 
 
+@shared_task(bind=True, time_limit=WARM_TIME_LIMIT, soft_time_limit=WARM_SOFT_TIME_LIMIT)
+def warm_phone_cache_task(self, force=False):
+    """
+    Carga el caché de números (phone:{numero}) desde la BD.
+
+    Se encola al arrancar cada worker Celery; el lock de Redis y la marca
+    global_phone_cache_updated garantizan que solo un proceso haga la carga.
+    Tiene límites de tiempo propios (WARM_TIME_LIMIT); si aun así se agotan,
+    se re-encola y continúa desde el último lote cargado.
+
+    Args:
+        force: Recargar aunque el caché ya esté marcado como cargado
+    """
+    from celery.exceptions import SoftTimeLimitExceeded
+    from .signals import load_phone_cache
+
+    try:
+        total = load_phone_cache(force=force)
+    except SoftTimeLimitExceeded:
+        warm_phone_cache_task.apply_async(kwargs={'force': force}, queue='maintenance')
+        logger.info("[warm_phone_cache_task] 🔁 Carga re-encolada, continúa desde el cursor guardado")
+        return {"status": "resumed", "loaded": 0}
+    return {"status": "success" if total is not None else "skipped", "loaded": total or 0}
+
+
 @shared_task(bind=True)
 def check_and_resume_stuck_processes(self):
     """
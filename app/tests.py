@@ -1,3 +1,643 @@
-from django.test import TestCase
-
-# Create your tests here.
+"""
+Micro-benchmarks de las rutas calientes de consulta y escritura.
+
+Cada prueba fija un máximo de consultas SQL (CaptureQueriesContext) y de
+comandos Redis (RedisCommandCounter) por llamada, para que un patrón N+1
+no vuelva a colarse sin que nadie lo note. También mide el tiempo medio
+por llamada y lo deja en el log (no se compara, depende de la máquina).
+
+Requiere Postgres (base de pruebas de Django) y Redis. Las pruebas usan una
+base Redis aparte (TEST_REDIS_URL, por defecto la 15) que se vacía antes de
+cada prueba; si Redis no responde se omiten.
+
+Uso:
+    python manage.py test app
+    TEST_REDIS_URL=redis://127.0.0.1:6379/14 python manage.py test app
+
+Archivo: app/tests.py
+"""
+import logging
+import os
+from time import perf_counter
+
+import redis
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import phone_cache, progress
+from .models import BlockIp, Consecutive, Movil, Proxy
+
+logger = logging.getLogger(__name__)
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://127.0.0.1:6379/15")
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': TEST_REDIS_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'PICKLE_VERSION': -1,
+        },
+        'KEY_PREFIX': 'apimovil_test',
+        'TIMEOUT': None,
+    }
+}
+
+# Rondas por micro-benchmark
+ROUNDS = int(os.environ.get("BENCHMARK_ROUNDS", "50"))
+
+
+def _redis_available():
+    try:
+        return redis.Redis.from_url(TEST_REDIS_URL, socket_connect_timeout=1).ping()
+    except Exception:
+        return False
+
+
+REDIS_AVAILABLE = _redis_available()
+
+
+class RedisCommandCounter:
+    """
+    Cuenta los comandos enviados a Redis desde cualquier cliente del proceso.
+
+    Los comandos sueltos pasan por Redis.execute_command; los de un pipeline
+    se cuentan uno por uno al ejecutarlo (sin MULTI/EXEC).
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def __enter__(self):
+        counter = self
+        self._execute_command = redis.Redis.execute_command
+        self._pipeline_execute = redis.client.Pipeline.execute
+
+        def execute_command(client, *args, **options):
+            counter.commands.append(args[0])
+            return counter._execute_command(client, *args, **options)
+
+        def pipeline_execute(pipe, *args, **kwargs):
+            counter.commands.extend(command[0] for command, _ in pipe.command_stack)
+            return counter._pipeline_execute(pipe, *args, **kwargs)
+
+        redis.Redis.execute_command = execute_command
+        redis.client.Pipeline.execute = pipeline_execute
+        return self
+
+    def __exit__(self, *exc):
+        redis.Redis.execute_command = self._execute_command
+        redis.client.Pipeline.execute = self._pipeline_execute
+
+    def __len__(self):
+        return len(self.commands)
+
+
+@override_settings(CACHES=TEST_CACHES, PHONE_CACHE_LAYOUT="keys")
+class HotPathBenchmarkTestCase(TransactionTestCase):
+    """Base: Redis de pruebas vacío, L1 vacío y helpers de medición."""
+
+    def setUp(self):
+        if not REDIS_AVAILABLE:
+            self.skipTest(f"Redis no disponible en {TEST_REDIS_URL}")
+        redis.Redis.from_url(TEST_REDIS_URL).flushdb()
+        phone_cache._layout = None
+        local = phone_cache.get_local_cache()
+        if local is not None:
+            local.clear()
+        self.user = User.objects.create(username="bench")
+
+    def assertCost(self, func, max_queries, max_redis_commands):
+        """Ejecuta func una vez y verifica las consultas SQL y comandos Redis usados."""
+        with CaptureQueriesContext(connection) as queries, RedisCommandCounter() as commands:
+            result = func()
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f"{len(queries)} consultas SQL (máximo {max_queries}):\n"
+            + "\n".join(q["sql"] for q in queries.captured_queries)
+        )
+        self.assertLessEqual(
+            len(commands), max_redis_commands,
+            f"{len(commands)} comandos Redis (máximo {max_redis_commands}): {commands.commands}"
+        )
+        return result
+
+    def benchmark(self, name, func, rounds=ROUNDS):
+        """Tiempo medio por llamada de func(i) para i en range(rounds)."""
+        start = perf_counter()
+        for i in range(rounds):
+            func(i)
+        elapsed = (perf_counter() - start) / rounds
+        logger.info(f"[benchmark] {name}: {elapsed * 1e6:.0f} µs/llamada ({rounds} rondas)")
+        return elapsed
+
+
+class CheckScrapingInCacheAndDbTests(HotPathBenchmarkTestCase):
+
+    def test_cache_hit_uses_no_sql(self):
+        from .views import check_scraping_in_cache_and_db
+
+        phone_cache.store("600000001", "Vodafone")
+        phone_cache.get_local_cache() and phone_cache.get_local_cache().clear()
+
+        # L1 vacío: un MGET a Redis
+        result = self.assertCost(lambda: check_scraping_in_cache_and_db("600000001"), 0, 1)
+        self.assertEqual(result, ("Vodafone", "cache"))
+
+        # L1 caliente: ni Redis ni BD
+        if phone_cache.get_local_cache() is not None:
+            self.assertCost(lambda: check_scraping_in_cache_and_db("600000001"), 0, 0)
+
+        self.benchmark("check_scraping_in_cache_and_db (cache)",
+                       lambda i: check_scraping_in_cache_and_db("600000001"))
+
+    def test_database_hit_is_one_query_and_backfills_cache(self):
+        from .views import check_scraping_in_cache_and_db
+
+        Movil.objects.create(file="a.xlsx", number="600000002", operator="Orange", user=self.user, ip="scraping")
+
+        # MGET + SELECT + store (SET, DEL de fallos, PUBLISH)
+        result = self.assertCost(lambda: check_scraping_in_cache_and_db("600000002"), 1, 4)
+        self.assertEqual(result, ("Orange", "database"))
+        self.assertEqual(phone_cache.lookup("600000002"), "Orange")
+
+    def test_miss_is_one_query(self):
+        from .views import check_scraping_in_cache_and_db
+
+        result = self.assertCost(lambda: check_scraping_in_cache_and_db("600000003"), 1, 1)
+        self.assertEqual(result, (None, None))
+
+        self.benchmark("check_scraping_in_cache_and_db (miss)",
+                       lambda i: check_scraping_in_cache_and_db(f"61{i:07d}"))
+
+
+class AddToPhoneCacheTests(HotPathBenchmarkTestCase):
+
+    def test_single_number_is_constant_redis_cost(self):
+        from .signals import add_to_phone_cache
+
+        # SET + DEL de fallos + PUBLISH de invalidación
+        self.assertCost(lambda: add_to_phone_cache("600000010", "Movistar", "a.xlsx"), 0, 3)
+        self.assertEqual(phone_cache.lookup("600000010"), "Movistar")
+
+        self.benchmark("add_to_phone_cache",
+                       lambda i: add_to_phone_cache(f"62{i:07d}", "Movistar", "a.xlsx"))
+
+    def test_many_numbers_do_not_scale_round_trips(self):
+        from .signals import add_many_to_phone_cache
+
+        numbers = {f"63{i:07d}": "Orange" for i in range(200)}
+        with RedisCommandCounter() as commands:
+            add_many_to_phone_cache(numbers)
+        # Un SET por número dentro de un solo pipeline, más DEL y PUBLISH
+        self.assertLessEqual(len(commands), len(numbers) + 2)
+        self.assertEqual(len(phone_cache.lookup_many(list(numbers))), len(numbers))
+
+
+@override_settings(PHONE_CACHE_LAYOUT="buckets")
+class BucketLayoutTests(HotPathBenchmarkTestCase):
+
+    def test_operator_mapping_is_written_atomically(self):
+        phone_cache.store("630000001", "Digi")
+        r = redis.Redis.from_url(TEST_REDIS_URL)
+        operator_id = r.hget(phone_cache.OPERATORS_KEY, "Digi")
+        self.assertEqual(r.hget(phone_cache.OPERATOR_NAMES_KEY, operator_id), b"Digi")
+        self.assertEqual(phone_cache.BucketLayout().get_many(["630000001"]), {"630000001": "Digi"})
+
+    def test_id_without_name_is_a_miss(self):
+        r = redis.Redis.from_url(TEST_REDIS_URL)
+        r.hset(f"{phone_cache.BUCKET_PREFIX}6300000", "02", f"99:{phone_cache.BucketLayout._today()}")
+        self.assertEqual(phone_cache.BucketLayout().get_many(["630000002"]), {})
+
+
+class ProcessSaveTaskTests(HotPathBenchmarkTestCase):
+
+    def test_save_is_single_insert(self):
+        from .tasks import process_save_task
+
+        # INSERT (dentro de un atomic, más SAVEPOINT/RELEASE si aplica); sin SELECT previo
+        self.assertCost(
+            lambda: process_save_task("600000020", "Vodafone", self.user.id, "a.xlsx", "scraping"), 3, 3
+        )
+        self.assertEqual(Movil.objects.filter(number="600000020").count(), 1)
+
+    def test_duplicate_save_is_ignored(self):
+        from .tasks import process_save_task
+
+        process_save_task("600000021", "Vodafone", self.user.id, "a.xlsx", "cache")
+        process_save_task("600000021", "Vodafone", self.user.id, "a.xlsx", "cache")
+        self.assertEqual(Movil.objects.filter(number="600000021").count(), 1)
+
+    def test_bulk_save_counts_only_inserted_rows(self):
+        from .tasks import bulk_save_moviles
+
+        rows = lambda *numbers: [
+            Movil(file="a.xlsx", number=n, operator="Orange", user=self.user, ip="cache") for n in numbers
+        ]
+        self.assertEqual(bulk_save_moviles(rows("600000023", "600000024")), 2)
+        # Un duplicado (user, file, number) no se inserta ni se cuenta
+        self.assertEqual(bulk_save_moviles(rows("600000024", "600000025")), 1)
+        self.assertEqual(Movil.objects.filter(file="a.xlsx").count(), 3)
+
+    def test_cache_source_does_not_touch_redis(self):
+        from .tasks import process_save_task
+
+        self.assertCost(
+            lambda: process_save_task("600000022", "Orange", self.user.id, "a.xlsx", "cache"), 3, 0
+        )
+        self.benchmark("process_save_task",
+                       lambda i: process_save_task(f"64{i:07d}", "Orange", self.user.id, "a.xlsx", "cache"))
+
+
+class WorklistTests(HotPathBenchmarkTestCase):
+
+    def test_count_numbers_skips_duplicates_and_blanks(self):
+        from . import worklist
+
+        self.assertEqual(worklist.count_numbers(["612345678", "612345678.0", " ", "nan", None, "699000000"]), 2)
+
+    def test_ingest_sets_total_to_distinct_numbers(self):
+        from unittest import mock
+        from . import worklist
+
+        conse = Consecutive.objects.create(file="a.xlsx", total=5, user=self.user, active=True)
+        with mock.patch.object(worklist, "read_file_numbers", return_value=["612345678", "699000000"]):
+            self.assertEqual(worklist.ingest(conse), 2)
+        conse.refresh_from_db()
+        self.assertEqual(conse.total, 2)
+        worklist.delete(conse.id)
+
+    def test_push_back_restores_the_ttl(self):
+        from . import worklist
+
+        worklist.push_back(4242, ["612345678", "699000000"])
+        self.assertEqual(worklist.pop_batch(4242, 1), (["612345678"], 1))
+        ttl = redis.Redis.from_url(TEST_REDIS_URL).ttl(worklist._key(4242))
+        self.assertGreater(ttl, 0)
+        self.assertLessEqual(ttl, worklist.WORKLIST_TTL)
+
+
+class WarmPhoneCacheTests(HotPathBenchmarkTestCase):
+
+    def test_soft_time_limit_releases_the_lock(self):
+        from unittest import mock
+        from celery.exceptions import SoftTimeLimitExceeded
+        from django.core.cache import cache
+        from . import signals
+
+        with mock.patch.object(signals, "warm_phone_cache", side_effect=SoftTimeLimitExceeded()):
+            with self.assertRaises(SoftTimeLimitExceeded):
+                signals.load_phone_cache(force=True)
+        # La tarea re-encolada puede tomar el lock de inmediato
+        lock = cache.lock(signals.WARM_LOCK_KEY, timeout=5)
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
+
+
+class UpdateProgressDirectlyTests(HotPathBenchmarkTestCase):
+
+    def test_increment_is_redis_only(self):
+        from .tasks import update_progress_directly
+
+        conse = Consecutive.objects.create(file="a.xlsx", total=ROUNDS + 1, user=self.user, active=True)
+
+        # Un EVAL (INCRBY + SADD + publicación limitada), ninguna escritura en la BD
+        self.assertCost(lambda: update_progress_directly(conse.id), 0, 1)
+        self.benchmark("update_progress_directly", lambda i: update_progress_directly(conse.id))
+        self.assertEqual(progress.pending(conse.id), ROUNDS + 1)
+
+    def test_flush_is_one_update_per_file(self):
+        from .tasks import update_progress_directly
+
+        conse = Consecutive.objects.create(file="a.xlsx", total=10, user=self.user, active=True)
+        for _ in range(10):
+            update_progress_directly(conse.id)
+
+        # UPDATE progres + SELECT estado + UPDATE de completado (solo al terminar);
+        # Redis: drenaje, invalidación del resumen y publicación del estado
+        flushed = self.assertCost(lambda: progress.flush([conse.id]), 3, 6)
+        self.assertEqual(flushed, {conse.id: 10})
+
+        conse.refresh_from_db()
+        self.assertEqual(conse.progres, 10)
+        self.assertFalse(conse.active)
+
+
+class RegisterBlockTests(HotPathBenchmarkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.proxy = Proxy.objects.create(
+            ip="127.0.0.1", port_min="1080", port_max="1080", username="u", password="p", user=self.user
+        )
+
+    def test_new_and_repeated_block_are_two_queries(self):
+        from .views import register_block
+
+        # SELECT + INSERT
+        self.assertCost(lambda: register_block("10.0.0.1", self.user, self.proxy), 2, 0)
+        # SELECT + UPDATE
+        self.assertCost(lambda: register_block("10.0.0.1", self.user, self.proxy), 2, 0)
+        self.assertEqual(BlockIp.objects.get(ip_block="10.0.0.1").reintent, 2)
+
+        self.benchmark("register_block", lambda i: register_block("10.0.0.1", self.user, self.proxy))
+
+
+class ConsultPaginationTests(HotPathBenchmarkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conse = Consecutive.objects.create(file="a.xlsx", total=25, progres=25, user=self.user)
+        Movil.objects.bulk_create([
+            Movil(file="a.xlsx", number=f"65{i:07d}", operator="Orange", user=self.user, ip="scraping")
+            for i in range(25)
+        ])
+
+    def post(self, url, payload):
+        from rest_framework.test import APIClient
+        return APIClient().post(url, payload, format="json")
+
+    def test_pages_cover_every_row_with_constant_queries(self):
+        numbers = []
+        cursor = None
+        while True:
+            payload = {"user": "bench", "id": self.conse.id, "limit": 10}
+            if cursor:
+                payload["cursor"] = cursor
+            # usuario + consecutive + página (+ total en la primera)
+            response = self.assertCost(lambda: self.post("/consult/", payload), 4, 0)
+            page = response.data["data"]
+            numbers.extend(row["number"] for row in page["list"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(numbers, [f"65{i:07d}" for i in range(25)])
+
+    def test_stream_ndjson_and_csv(self):
+        import json
+
+        response = self.post("/consult/stream/", {"user": "bench", "id": self.conse.id})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[0]), {"number": "650000000", "operator": "Orange"})
+
+        response = self.post("/consult/stream/", {"user": "bench", "id": self.conse.id, "format": "csv"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "number,operator")
+        self.assertEqual(len(lines), 26)
+
+    def test_same_file_name_from_another_user_is_not_mixed_in(self):
+        other = User.objects.create(username="other")
+        Movil.objects.create(file="a.xlsx", number="699999999", operator="Vodafone", user=other, ip="scraping")
+
+        response = self.post("/consult/", {"user": "bench", "id": self.conse.id})
+        numbers = [row["number"] for row in response.data["data"]["list"]]
+        self.assertEqual(numbers, [f"65{i:07d}" for i in range(25)])
+
+    def test_stream_only_serves_the_owner(self):
+        User.objects.create(username="other")
+        response = self.post("/consult/stream/", {"user": "other", "id": self.conse.id})
+        self.assertEqual(response.data["message"], "No encontrado")
+
+        response = self.post("/consult/stream/", {"id": self.conse.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_reads_in_keyset_chunks(self):
+        from app.views import _consult_chunks
+
+        # 25 filas en lotes de 10: tres consultas acotadas, sin cursor del servidor
+        with self.assertNumQueries(3):
+            rows = list(_consult_chunks(self.conse, chunk_size=10))
+        self.assertEqual([number for _, number, _ in rows], [f"65{i:07d}" for i in range(25)])
+
+
+class FilterDataSummaryTests(HotPathBenchmarkTestCase):
+
+    def post(self, payload, etag=None):
+        from rest_framework.test import APIClient
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return APIClient().post("/filter_data/", payload, format="json", **headers)
+
+    def test_unchanged_poll_is_304_without_sql(self):
+        conse = Consecutive.objects.create(file="a.xlsx", total=10, user=self.user, active=True)
+
+        response = self.post({"user": "bench"})
+        self.assertEqual(response.data["data"][0]["status"], "processing")
+        etag = response["ETag"]
+
+        # HGET usuario + GET versión
+        response = self.assertCost(lambda: self.post({"user": "bench"}, etag), 0, 2)
+        self.assertEqual(response.status_code, 304)
+
+        # El flush de progreso actualiza la fila en Redis y cambia la versión:
+        # el siguiente poll sale de Redis sin reconstruir (solo la consulta del usuario)
+        progress.increment(conse.id, 4)
+        progress.flush([conse.id])
+        response = self.assertCost(lambda: self.post({"user": "bench"}, etag), 1, 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["data"][0]["progress_percentage"], 40.0)
+        etag = response["ETag"]
+
+        progress.increment(conse.id, 6)
+        progress.flush([conse.id])
+        response = self.assertCost(lambda: self.post({"user": "bench"}, etag), 1, 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["data"][0]["status"], "completed")
+        self.assertEqual(response.data["data"][0]["progress_percentage"], 100.0)
+
+    def test_rebuild_is_constant_queries(self):
+        for i in range(20):
+            Consecutive.objects.create(file=f"{i}.xlsx", total=10, progres=i % 11, user=self.user, active=False)
+
+        # usuario + Consecutive del usuario
+        response = self.assertCost(lambda: self.post({"user": "bench"}), 2, 8)
+        self.assertEqual(len(response.data["data"]), 20)
+
+        # Segundo poll sin ETag: resumen desde Redis, solo la consulta del usuario
+        self.assertCost(lambda: self.post({"user": "bench"}), 1, 3)
+
+
+class ProgressStreamAccessTests(HotPathBenchmarkTestCase):
+
+    def resolve(self, query, headers=()):
+        from urllib.parse import parse_qs
+        from .progress_stream import _caller, _resolve_ids
+
+        scope = {"type": "http", "method": "GET", "path": "/progress/stream/",
+                 "query_string": query.encode(), "headers": list(headers)}
+        params = parse_qs(query)
+        user, rejected = _caller(scope, params)
+        return rejected or _resolve_ids(params, user)
+
+    def test_only_the_callers_files_are_streamed(self):
+        mine = Consecutive.objects.create(file="a.xlsx", total=10, user=self.user, active=True)
+        other = User.objects.create(username="other")
+        theirs = Consecutive.objects.create(file="b.xlsx", total=10, user=other, active=True)
+
+        # Sin identidad no hay stream
+        self.assertEqual(self.resolve(f"id={mine.id}"), 401)
+        # Los id ajenos se ignoran
+        self.assertEqual(self.resolve(f"user=bench&ids={mine.id},{theirs.id}"), [mine.id])
+        self.assertEqual(self.resolve("user=bench"), [mine.id])
+
+    def test_authenticated_caller_cannot_name_another_user(self):
+        import base64
+
+        self.user.set_password("secret")
+        self.user.save()
+        User.objects.create(username="other")
+        auth = [(b"authorization", b"Basic " + base64.b64encode(b"bench:secret"))]
+        self.assertEqual(self.resolve("user=other", auth), 403)
+        self.assertEqual(self.resolve("", [(b"authorization", b"Basic " + base64.b64encode(b"bench:wrong"))]), 401)
+
+
+class _FlakyDigiPhone:
+    """DigiPhone de prueba: cada número responde 500 las primeras `fails` veces."""
+
+    def __init__(self, fails):
+        self.fails = fails
+        self.calls = {}
+        self.proxy_changes = 0
+
+    def ensure_access(self, get_cart=False):
+        return True
+
+    def invalidate_access(self):
+        pass
+
+    def change_position(self):
+        self.proxy_changes += 1
+
+    def get_phone_number(self, phone):
+        self.calls[phone] = self.calls.get(phone, 0) + 1
+        if self.calls[phone] <= self.fails:
+            return 500, {}
+        return 200, {"name": "Orange"}
+
+
+class _SlowDigiPhone(_FlakyDigiPhone):
+    """DigiPhone de prueba: llega el soft time limit en la consulta número `limit_at`."""
+
+    def __init__(self, limit_at):
+        super().__init__(fails=0)
+        self.limit_at = limit_at
+
+    def get_phone_number(self, phone):
+        from celery.exceptions import SoftTimeLimitExceeded
+
+        if sum(self.calls.values()) + 1 >= self.limit_at:
+            raise SoftTimeLimitExceeded()
+        return super().get_phone_number(phone)
+
+
+class ScrapeBatchTests(HotPathBenchmarkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conse = Consecutive.objects.create(file="a.xlsx", total=200, user=self.user, active=True)
+
+    def test_block_is_constant_queries(self):
+        from .tasks import _scrape_batch
+
+        for size in (50, 200):
+            Movil.objects.all().delete()
+            numbers = [f"66{i:07d}" for i in range(size)]
+            lookup = lambda phones, attempts, keepalive: {phone: "Orange" for phone in phones}
+            # SQL: ya guardados + INSERT (atomic), igual con 50 que con 200 números.
+            # Redis: MGET del caché, dos pipelines (claim y caché) con un SET por
+            # número, más DEL/PUBLISH, release y un único incremento de progreso
+            self.assertCost(lambda: _scrape_batch(self.conse, numbers, lookup, 3, "test"), 6, 2 * size + 5)
+            self.assertEqual(Movil.objects.filter(file="a.xlsx").count(), size)
+        self.assertEqual(progress.pending(self.conse.id), 250)
+
+    def test_retries_stay_inside_the_block(self):
+        from .tasks import _scrape_numbers
+
+        digi_phone = _FlakyDigiPhone(fails=2)
+        numbers = [f"67{i:07d}" for i in range(5)]
+        self.assertEqual(_scrape_numbers(digi_phone, numbers, 3), {n: "Orange" for n in numbers})
+        self.assertEqual(digi_phone.proxy_changes, 10)
+
+        # Sin intentos suficientes el número queda sin respuesta
+        self.assertEqual(_scrape_numbers(_FlakyDigiPhone(fails=3), numbers, 3), {n: None for n in numbers})
+
+    def test_only_definitive_answers_are_negative_cached(self):
+        from .tasks import _lookup_with_singleflight
+
+        answers = {"680000001": None, "680000002": "Desconocido", "680000003": "Orange"}
+        found, others, unfinished = _lookup_with_singleflight(lambda phones, attempts, keepalive: answers, list(answers), 3)
+        self.assertEqual((found, others, unfinished), ({"680000003": "Orange"}, [], []))
+        # Fallo de proxy/login (None): no se pausa el número para los demás usuarios
+        self.assertEqual(phone_cache.backed_off(list(answers)), {"680000002"})
+
+    def test_follower_wakes_on_published_result(self):
+        import threading
+
+        phone_cache.claim(["681000001"])
+        threading.Timer(0.2, lambda: phone_cache.store_many({"681000001": "Orange"})).start()
+        start = perf_counter()
+        found, waiting = phone_cache.wait_for_results(["681000001"], timeout=5)
+        self.assertEqual((found, waiting), ({"681000001": "Orange"}, []))
+        self.assertLess(perf_counter() - start, 1)
+
+    @override_settings(SINGLEFLIGHT_WAIT=1)
+    def test_numbers_still_in_flight_are_requeued_not_waited(self):
+        from .tasks import _scrape_batch
+
+        # Otra tarea tiene tomado 681000002 y no termina dentro de la espera
+        phone_cache.claim(["681000002"])
+        lookup = lambda phones, attempts, keepalive: {phone: "Orange" for phone in phones}
+        start = perf_counter()
+        result = _scrape_batch(self.conse, ["681000002", "681000003"], lookup, 3, "test")
+        self.assertLess(perf_counter() - start, 3)
+        self.assertEqual(result["unfinished"], ["681000002"])
+        self.assertEqual(list(Movil.objects.values_list("number", flat=True)), ["681000003"])
+        self.assertEqual(progress.pending(self.conse.id), 1)
+
+    def test_error_after_progress_does_not_retry_the_block(self):
+        from contextlib import contextmanager
+        from unittest import mock
+        from .tasks import scrape_batch_task
+
+        class _Pool:
+            @contextmanager
+            def session(self, user):
+                yield _FlakyDigiPhone(fails=0)
+
+        numbers = [f"682{i:06d}" for i in range(5)]
+        with mock.patch("app.session_pool.get_digiphone_pool", return_value=_Pool()), \
+                mock.patch("app.tasks._requeue_batch", side_effect=ConnectionError("broker caído")):
+            result = scrape_batch_task.apply(kwargs={"consecutive_id": self.conse.id, "numbers": numbers})
+        # El bloque se contó una vez y no se reintentó
+        self.assertEqual(result.result["resolved"], 5)
+        self.assertEqual(progress.pending(self.conse.id), 5)
+
+    def test_soft_time_limit_keeps_partial_results(self):
+        from .tasks import _BatchBudget, _scrape_batch, _scrape_numbers
+
+        digi_phone = _SlowDigiPhone(limit_at=4)
+        budget = _BatchBudget(180)
+        numbers = [f"69{i:07d}" for i in range(10)]
+        result = _scrape_batch(
+            self.conse, numbers,
+            lambda phones, attempts, keepalive: _scrape_numbers(digi_phone, phones, attempts, keepalive, budget),
+            3, "test"
+        )
+        self.assertTrue(budget.soft_limit)
+        # Lo consultado se guarda; el resto no cuenta como procesado y se devuelve
+        self.assertEqual(Movil.objects.filter(file="a.xlsx").count(), 3)
+        self.assertEqual(result["unfinished"], numbers[3:])
+        self.assertEqual(progress.pending(self.conse.id), 3)
+        # Las marcas se liberan: otra tarea puede tomar los números re-encolados
+        token, claimed = phone_cache.claim(numbers[3:])
+        self.assertEqual(claimed, set(numbers[3:]))
+
+    def test_exhausted_budget_scrapes_nothing(self):
+        from .tasks import _BatchBudget, _scrape_numbers
+
+        self.assertEqual(_scrape_numbers(_FlakyDigiPhone(fails=0), ["690000100"], 3, budget=_BatchBudget(0)), {})
@@ -11,6 +11,7 @@ urlpatterns = [
     #path('apimovil/remove/', remove, name="remove"),
     path('process/', process, name="process"),
     path('consult/', consult, name="consult"),
+    path('consult/stream/', consult_stream, name="consult_stream"),
     path('filter_data/', filter_data, name="filter_data"),
     path('pause/', pause, name="pause"),
     path('remove/', remove, name="remove"),
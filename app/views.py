@@ -14,7 +14,6 @@ import queue
 from django.db.models.signals import post_migrate
 from django.dispatch import receiver
 from django.apps import apps
-from django.core.cache import cache
 #*new worker*#
 import pandas as pd
 import concurrent.futures
@@ -36,8 +35,8 @@ from .tasks import (
     process_save_task,
     update_consecutive_task,
     scrape_and_save_phone_task,
-    update_consecutive_progress_task
 )
+from . import progress
 
 logger = logging.getLogger(__name__)
 
@@ -128,11 +127,12 @@ def check_scraping_in_cache_and_db(number):
         ('Vodafone', 'database')  - Encontrado en BD PostgreSQL
         (None, None)              - No encontrado, requiere scraping
     """
-    # 1. BUSCAR EN CACHÉ REDIS (super rápido: ~1ms) ⚡
+    # 1. BUSCAR EN CACHÉ (memoria del proceso: ~µs, luego Redis: ~1ms) ⚡
     try:
-        operator = cache.get(f"phone:{number}")
+        from . import phone_cache
+        operator = phone_cache.lookup(str(number))
         if operator is not None:
-            logger.info(f"[CACHE HIT] ✓ {number} → {operator} (Redis)")
+            logger.info(f"[CACHE HIT] ✓ {number} → {operator}")
             return (operator, 'cache')
     except Exception as e:
         logger.warning(f"[CACHE ERROR] Error accediendo caché para {number}: {e}")
@@ -183,6 +183,66 @@ def check_scraping_in_cache_and_db(number):
     return (None, None)
 
 
+def check_many_in_cache_and_db(numbers):
+    """
+    🚀 Versión por lotes de check_scraping_in_cache_and_db().
+
+    Resuelve un lote completo con el caché en memoria y un solo MGET en Redis
+    (app/phone_cache.py) y, para los que no están en caché, una sola consulta
+    number__in a la BD.
+
+    Returns:
+        dict: {'cache': {numero: operador}, 'database': {numero: operador}}
+              Los números ausentes en ambos requieren scraping.
+    """
+    hits = {'cache': {}, 'database': {}}
+    numbers = list(dict.fromkeys(str(n) for n in numbers))
+    if not numbers:
+        return hits
+
+    # 1. BUSCAR EN CACHÉ (memoria del proceso + un solo round trip a Redis) ⚡
+    try:
+        from . import phone_cache
+        hits['cache'] = phone_cache.lookup_many(numbers)
+    except Exception as e:
+        logger.warning(f"[CACHE ERROR] Error accediendo caché para lote de {len(numbers)}: {e}")
+
+    misses = [n for n in numbers if n not in hits['cache']]
+    if not misses:
+        logger.info(f"[CACHE HIT] ✓ Lote de {len(numbers)}: {len(hits['cache'])} en Redis")
+        return hits
+
+    # 2. BUSCAR EN BASE DE DATOS (una sola consulta para los faltantes) 🗄️
+    thirty_days_ago = timezone.now() - timedelta(days=30)
+    try:
+        close_old_connections()
+        rows = Movil.objects.filter(
+            number__in=misses,
+            fecha_hora__gte=thirty_days_ago
+        ).exclude(
+            operator__in=['ERROR_SCRAPING', 'No existe', 'Desconocido']
+        ).order_by('number', '-fecha_hora').values_list('number', 'operator')
+
+        # Ordenado por número y fecha descendente: el primero es el más reciente
+        for number, operator in rows:
+            if number not in hits['database']:
+                hits['database'][number] = operator
+    except Exception as e:
+        logger.warning(f"[check_many_in_cache_and_db] ✗ Error DB para lote de {len(misses)}: {str(e)}")
+
+    # IMPORTANTE: Agregar al caché para próxima vez (un solo pipeline)
+    if hits['database']:
+        from .signals import add_many_to_phone_cache
+        add_many_to_phone_cache(hits['database'])
+
+    logger.info(
+        f"[check_many_in_cache_and_db] Lote de {len(numbers)}: "
+        f"{len(hits['cache'])} en Redis | {len(hits['database'])} en BD | "
+        f"{len(misses) - len(hits['database'])} sin resultado"
+    )
+    return hits
+
+
 # Mantener función original para compatibilidad con código existente
 def check_scraping_in_db(number):
     """
@@ -349,8 +409,7 @@ def worker(q, events, _thread, user, reprocess):
                    ip=ip
                 )
 
-                task["conse"].progres += 1
-                _save_consecutive_with_retry(task["conse"], _thread, max_retries=3)
+                progress.increment(task["conse"].id)
 
                 digiPhone.change_position()
             else:
@@ -425,33 +484,6 @@ class Segment:
                 result = True
         return result
 
-def _save_consecutive_with_retry(conse, thread_id, max_retries=3):
-    """
-    Guarda el objeto Consecutive con retry para manejar errores de DB bloqueada.
-    """
-    base_delay = 0.05
-
-    for attempt in range(max_retries):
-        try:
-            close_old_connections()
-            conse.save()
-            return
-        except OperationalError as e:
-            error_str = str(e)
-            if "database is locked" in error_str.lower() or "locked" in error_str.lower():
-                delay = base_delay * (2 ** attempt)
-                logger.warning(f"[worker] Thread {thread_id} - ⚠ DB locked al guardar progreso (intento {attempt + 1}/{max_retries}) - Esperando {delay:.2f}s")
-                sleep(delay)
-            else:
-                logger.error(f"[worker] Thread {thread_id} - ✗ OperationalError al guardar progreso: {error_str}")
-                break
-        except Exception as e:
-            logger.error(f"[worker] Thread {thread_id} - ✗ Error al guardar progreso: {str(e)}")
-            break
-
-    logger.warning(f"[worker] Thread {thread_id} - ⚠ No se pudo guardar progreso después de {max_retries} intentos")
-
-
 def register_block(ip, user, proxy):
     """
     Registra un bloqueo de IP con manejo de errores de DB bloqueada.
@@ -507,30 +539,39 @@ def active_process(data):
     if old_processes.exists():
         count = old_processes.count()
         logger.warning(f"Limpiando {count} procesos colgados para usuario {user.username}")
+        stale_ids = []
         for old in old_processes:
             logger.warning(f"  - Proceso colgado: {old.file} (ID: {old.id}, creado: {old.created})")
+            stale_ids.append(old.id)
         old_processes.update(active=False)
+        # update() no emite post_save: reflejarlo en el resumen cacheado
+        from app import job_summary
+        job_summary.update(user.id, [{"id": i, "active": False} for i in stale_ids])
 
     conse = Consecutive.objects.filter(
         file=data["file"],
         user=user
     ).order_by('-id').first()
 
+    # Números distintos: la lista de trabajo descarta duplicados (app/worklist.py)
+    from app import worklist
+    total_numbers = worklist.count_numbers(data["number"])
+
     if conse and conse.progres < conse.total:
         logger.info(f"Reanudando proceso existente: {conse.file} (ID: {conse.id}) - Progreso: {conse.progres}/{conse.total}")
         conse.active = True
         conse.finish = None
-        conse.save()
+        conse.save(update_fields=['active', 'finish'])
 
-        if len(data["number"]) != conse.total:
-            logger.warning(f"El archivo cambió de tamaño: {conse.total} → {len(data['number'])}")
-            conse.total = len(data["number"])
-            conse.save()
+        if total_numbers != conse.total:
+            logger.warning(f"El archivo cambió de tamaño: {conse.total} → {total_numbers}")
+            conse.total = total_numbers
+            conse.save(update_fields=['total'])
     else:
-        logger.info(f"Creando nuevo proceso: {data['file']} - Total: {len(data['number'])} números")
+        logger.info(f"Creando nuevo proceso: {data['file']} - Total: {total_numbers} números")
         conse = Consecutive.objects.create(
             file=data["file"],
-            total=len(data["number"]),
+            total=total_numbers,
             user=user,
             active=True,
             finish=None
@@ -577,7 +618,8 @@ def active_process(data):
             process_file_in_batches.apply_async(
                 kwargs={
                     'consecutive_id': conse.id,
-                    'batch_size': 100
+                    'batch_size': 100,
+                    'rebuild': True  # Archivo (re)subido: volver a ingerir la lista de trabajo
                 },
                 queue=user_queue
             )
@@ -600,7 +642,10 @@ def active_process(data):
         else:
             logger.info(f"⏳ Procesamiento en curso: {data['file']} ({conse.progres}/{conse.total})")
 
-        conse.save()
+        # Sin 'progres': lo actualizan los workers (app/progress.py) y no debe pisarse
+        conse.save(update_fields=['active', 'finish'])
+        # Corre en un hilo propio: su conexión no la reutiliza nadie (DB_POOL_MODE persistent)
+        connection.close()
 
 
 def process_block(seg, phones, user, data, conse):
@@ -633,13 +678,11 @@ def process_block(seg, phones, user, data, conse):
                 file=data["file"],
                 ip=source  # 'cache' o 'database'
             )
-            conse.progres += 1
-            _save_consecutive_with_retry(conse, "process_block", max_retries=3)
+            progress.increment(conse.id)
 
         elif already_processed:
             logger.info(f"Número {phone} ya procesado en {data['file']}, saltando...")
-            conse.progres += 1
-            _save_consecutive_with_retry(conse, "process_block", max_retries=3)
+            progress.increment(conse.id)
 
         else:
             logger.info(f"[SCRAPING] → Número {phone} NO en caché ni BD, enviando a Celery...")
@@ -653,10 +696,7 @@ def process_block(seg, phones, user, data, conse):
                     max_attempts=3
                 )
 
-                update_consecutive_progress_task.delay(
-                    consecutive_id=conse.id,
-                    increment=1
-                )
+                progress.increment(conse.id)
 
                 logger.info(f"[CELERY] Tarea enviada: {phone}")
             else:
@@ -811,12 +851,60 @@ def remove(request):
         result["status"] = "OK"
         result["message"] = "Base eliminada correctamente"
         logger.info("Base eliminada: "+str(c.file))
+        try:
+            from app import worklist
+            worklist.delete(c.id)
+            progress.discard(c.id)
+        except Exception as e:
+            logger.warning(f"[remove] No se pudo eliminar la lista de trabajo de {c.file}: {e}")
         c.delete()
 
     return Response(result)
 
+# Paginación de consult (cursor = último id entregado)
+CONSULT_PAGE_SIZE = 1000
+CONSULT_MAX_PAGE_SIZE = 10000
+# Filas por viaje a la BD en consult_stream
+CONSULT_STREAM_CHUNK_SIZE = 5000
+
+
+def _consult_rows(c, cursor=None):
+    """Filas (id, number, operator) del archivo en orden de id, desde el cursor."""
+    rows = Movil.objects.filter(user_id=c.user_id, file=c.file)
+    if cursor:
+        rows = rows.filter(id__gt=cursor)
+    return rows.order_by("id").values_list("id", "number", "operator")
+
+
+def _consult_chunks(c, chunk_size=None):
+    """
+    Todas las filas del archivo, una consulta por cada chunk_size (keyset por
+    id). No usa .iterator(): con PgBouncer no hay cursores del lado del
+    servidor y traería el archivo completo en un solo fetch.
+    """
+    chunk_size = chunk_size or CONSULT_STREAM_CHUNK_SIZE
+    cursor = None
+    while True:
+        page = list(_consult_rows(c, cursor)[:chunk_size])
+        yield from page
+        if len(page) < chunk_size:
+            return
+        cursor = page[-1][0]
+
+
 @api_view(["POST"])
 def consult(request):
+    """
+    Resultados de un archivo.
+
+    Solo las filas del dueño del archivo (c.user_id): archivos homónimos de
+    otros usuarios no se mezclan.
+
+    Sin "limit" ni "cursor" devuelve la lista completa (compatibilidad).
+    Con "limit" y/o "cursor" pagina por id: cada respuesta trae "next_cursor"
+    (None en la última página) para pedir la siguiente sin OFFSET.
+    Para descargas grandes usar consult/stream/.
+    """
     data = request.data
     user = User.objects.filter(username=data["user"]).first()
     if user is None:
@@ -830,64 +918,114 @@ def consult(request):
         "data": {}
     }
     if c:
-        data = []
-        for i in Movil.objects.filter(file=c.file).all().order_by("id"):
-            data.append({
-                "number":i.number,
-                "operator":i.operator
-            })
-        total = Movil.objects.filter(user=user).count()
+        paginated = "limit" in data or "cursor" in data
+        cursor = int(data.get("cursor") or 0)
+        rows = _consult_rows(c, cursor)
+        next_cursor = None
+        if paginated:
+            limit = min(int(data.get("limit") or CONSULT_PAGE_SIZE), CONSULT_MAX_PAGE_SIZE)
+            page = list(rows[:limit + 1])
+            if len(page) > limit:
+                page = page[:limit]
+                next_cursor = page[-1][0]
+        else:
+            page = _consult_chunks(c)
+
         result["code"] = 200
         result["status"] = "OK"
         result["message"] = "Proceso pausado"
         result["nameFile"] = c.file
-        result["data"] = {"total": total, "proces": c.progres, "subido": c.total, "list":data}
+        result["data"] = {
+            "proces": c.progres,
+            "subido": c.total,
+            "list": [{"number": number, "operator": operator} for _, number, operator in page],
+        }
+        # El total del usuario solo en la primera página
+        if not cursor:
+            result["data"]["total"] = Movil.objects.filter(user=user).count()
+        if paginated:
+            result["data"]["next_cursor"] = next_cursor
     return Response(result)
 
 
+class _Echo:
+    """Buffer de csv.writer que devuelve la línea en lugar de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def _stream_consult(c, fmt):
+    rows = _consult_chunks(c)
+    if fmt == "csv":
+        import csv
+        writer = csv.writer(_Echo())
+        yield writer.writerow(["number", "operator"])
+        for _, number, operator in rows:
+            yield writer.writerow([number, operator])
+    else:
+        import json
+        for _, number, operator in rows:
+            yield json.dumps({"number": number, "operator": operator}, ensure_ascii=False) + "\n"
+
+
+@api_view(["GET", "POST"])
+def consult_stream(request):
+    """
+    Descarga los resultados de un archivo en streaming (memoria constante).
+
+    Parámetros (query string o body): user, id, format = "ndjson" (por
+    defecto) | "csv". Solo descarga archivos del propio usuario.
+    """
+    from django.http import StreamingHttpResponse
+
+    data = request.data if request.method == "POST" else request.query_params
+    if not data.get("user"):
+        return Response({"code": 400, "status": "Fail", "message": "Falta el parámetro user"}, status=400)
+    user = User.objects.filter(username=data["user"]).first()
+    c = Consecutive.objects.filter(id=data.get("id"), user=user).last() if user else None
+    if c is None:
+        return Response({"code": 400, "status": "Fail", "message": "No encontrado"})
+
+    fmt = "csv" if data.get("format") == "csv" else "ndjson"
+    response = StreamingHttpResponse(
+        _stream_consult(c, fmt),
+        content_type="text/csv" if fmt == "csv" else "application/x-ndjson",
+    )
+    name = os.path.splitext(c.file)[0]
+    response["Content-Disposition"] = f'attachment; filename="{name}.{"csv" if fmt == "csv" else "ndjson"}"'
+    return response
+
+
 @api_view(["POST"])
 def filter_data(request):
+    """
+    Resumen de los archivos del usuario (precalculado en Redis, app/job_summary.py).
+
+    La respuesta trae un ETag; si el cliente lo reenvía en If-None-Match y nada
+    cambió, se responde 304 sin consultar la BD.
+    """
+    from . import job_summary
+
     data = request.data
-    print(data)
-    print("SAM filter_data")
+    logger.debug(f"[filter_data] {data}")
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        version = job_summary.cached_version(data["user"])
+        if version is not None and if_none_match == job_summary.etag(data["user"], version):
+            response = Response(status=304)
+            response["ETag"] = if_none_match
+            return response
+
     user = User.objects.filter(username=data["user"]).first()
     if user is None:
         user = User.objects.create(username=data["user"])
 
-    c = Consecutive.objects.filter(user=user).order_by("-id")
-    response_data = []
-
-    for i in c:
-        if i.progres >= i.total:
-            status = 'completed'
-            status_display = 'Completado'
-        elif i.active:
-            status = 'processing'
-            status_display = 'Procesando'
-        elif i.progres > 0:
-            status = 'paused'
-            status_display = 'Pausado'
-        else:
-            status = 'pending'
-            status_display = 'Pendiente'
-
-        progress_percentage = round((i.progres / i.total * 100), 2) if i.total > 0 else 0
-
-        response_data.append({
-            "id": i.pk,
-            "file": i.file,
-            "total": i.total,
-            "progres": i.progres,
-            "conse": i.num,
-            "created": i.created,
-            "finish": i.finish,
-            "active": i.active,
-            "status": status,
-            "status_display": status_display,
-            "progress_percentage": progress_percentage
-        })
-
-    return Response({"data": response_data})
+    version, response_data = job_summary.get(user)
+    response = Response({"data": response_data})
+    if version is not None:
+        response["ETag"] = job_summary.etag(user.username, version)
+    return response
 
 
 @api_view(["POST"])
@@ -911,22 +1049,28 @@ def phone_consult(request):
         if user is None:
             user = User.objects.create(username=data["user"])
 
-        digiPhone = DigiPhone(user, None)
+        from .session_pool import get_digiphone_pool
 
-        if digiPhone._len_proxy == 0:
-            result["data"] = [400, "No hay proxies disponibles para este usuario"]
-            logger.warning(f"[phone_consult] No hay proxies para usuario: {data['user']}")
-            return Response(result, status=400)
+        with get_digiphone_pool().session(user) as digiPhone:
+            if digiPhone._len_proxy == 0:
+                result["data"] = [400, "No hay proxies disponibles para este usuario"]
+                logger.warning(f"[phone_consult] No hay proxies para usuario: {data['user']}")
+                return Response(result, status=400)
 
-        logger.info(f"[phone_consult] Consultando teléfono: {data['phone']} para usuario: {data['user']}")
+            logger.info(f"[phone_consult] Consultando teléfono: {data['phone']} para usuario: {data['user']}")
 
-        access_success = digiPhone.get_access("", get_cart=False)
-        if not access_success:
-            result["data"] = [500, "Error obteniendo acceso (cookies)"]
-            logger.error(f"[phone_consult] Error obteniendo acceso")
-            return Response(result, status=500)
+            access_success = digiPhone.ensure_access(get_cart=False)
+            if not access_success:
+                result["data"] = [500, "Error obteniendo acceso (cookies)"]
+                logger.error(f"[phone_consult] Error obteniendo acceso")
+                return Response(result, status=500)
 
-        data_phone = digiPhone.get_phone_number(phone=data["phone"])
+            data_phone = digiPhone.get_phone_number(phone=data["phone"])
+            if isinstance(data_phone, tuple) and data_phone[0] in [401, 498]:
+                # Token rechazado: renovar una vez y repetir la consulta
+                digiPhone.invalidate_access()
+                if digiPhone.ensure_access(get_cart=False):
+                    data_phone = digiPhone.get_phone_number(phone=data["phone"])
 
         if isinstance(data_phone, tuple):
             status, result_data = data_phone
@@ -0,0 +1,185 @@
+"""
+Lista de trabajo persistente por archivo (Consecutive).
+
+El archivo subido se parsea UNA sola vez: los números se normalizan, se
+descartan los ya procesados y el resto se guarda en una lista Redis que cada
+lote de process_file_in_batches consume desde la cabeza en O(lote).
+
+Claves (base de datos del caché, ver settings.CACHES):
+- worklist:<consecutive_id>       → lista de números pendientes
+- worklist:<consecutive_id>:meta  → hash con total ingerido y fecha de ingesta
+
+Archivo: app/worklist.py
+"""
+import logging
+import os
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "/opt/masterfilter/media/subido")
+
+# Números por RPUSH durante la ingesta (evita comandos gigantes en Redis)
+INGEST_CHUNK_SIZE = 5000
+
+# La lista caduca si el archivo queda abandonado (se reconstruye al reanudar)
+WORKLIST_TTL = 60 * 60 * 24 * 7  # 7 días
+
+
+def _key(consecutive_id):
+    return f"worklist:{consecutive_id}"
+
+
+def _meta_key(consecutive_id):
+    return f"worklist:{consecutive_id}:meta"
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def normalize_number(value):
+    """
+    Normaliza un número leído del archivo.
+
+    Excel entrega columnas numéricas como float cuando hay celdas vacías
+    ("612345678.0"); se elimina ese sufijo y se descartan vacíos/NaN.
+    Retorna None si el valor no es utilizable.
+    """
+    if value is None:
+        return None
+    number = str(value).strip()
+    if number.endswith(".0") and number[:-2].isdigit():
+        number = number[:-2]
+    if not number or number.lower() in ("nan", "none"):
+        return None
+    return number
+
+
+def count_numbers(values):
+    """Cantidad de números distintos y utilizables (la misma cuenta que ingest())."""
+    return len({normalize_number(value) for value in values} - {None})
+
+
+def read_file_numbers(file_name):
+    """
+    Lee el archivo subido y retorna la lista de números normalizados,
+    sin duplicados y en el orden original (primera columna).
+    """
+    import pandas as pd
+
+    file_path = f"{UPLOAD_DIR}/{file_name}"
+
+    if file_name.endswith('.xlsx'):
+        df = pd.read_excel(file_path, usecols=[0], dtype=str)
+    elif file_name.endswith('.csv'):
+        df = pd.read_csv(file_path, usecols=[0], dtype=str)
+    else:
+        raise ValueError(f"Formato no soportado: {file_name}")
+
+    numbers = []
+    seen = set()
+    for value in df.iloc[:, 0].tolist():
+        number = normalize_number(value)
+        if number is None or number in seen:
+            continue
+        seen.add(number)
+        numbers.append(number)
+    return numbers
+
+
+def exists(consecutive_id):
+    """True si el archivo ya fue ingerido (aunque la lista esté vacía)."""
+    return bool(_redis().exists(_meta_key(consecutive_id)))
+
+
+def remaining(consecutive_id):
+    """Cantidad de números pendientes en la lista (LLEN, O(1))."""
+    return _redis().llen(_key(consecutive_id))
+
+
+def ingest(consecutive):
+    """
+    Parsea el archivo del Consecutive una sola vez y guarda los números
+    pendientes en la lista Redis. Reemplaza cualquier lista anterior.
+
+    Consecutive.total pasa a ser la cantidad de números distintos del
+    archivo: los duplicados no se consultan y el progreso nunca los cuenta.
+
+    Returns:
+        int: cantidad de números pendientes encolados
+    """
+    from .models import Consecutive, Movil
+
+    numbers = read_file_numbers(consecutive.file)
+    if consecutive.total != len(numbers):
+        Consecutive.objects.filter(id=consecutive.id).update(total=len(numbers))
+        consecutive.total = len(numbers)
+
+    already_processed = set(
+        Movil.objects.filter(
+            file=consecutive.file,
+            user=consecutive.user
+        ).values_list('number', flat=True)
+    )
+    pending = [n for n in numbers if n not in already_processed]
+
+    r = _redis()
+    key = _key(consecutive.id)
+    pipe = r.pipeline(transaction=True)
+    pipe.delete(key)
+    for i in range(0, len(pending), INGEST_CHUNK_SIZE):
+        pipe.rpush(key, *pending[i:i + INGEST_CHUNK_SIZE])
+    pipe.hset(_meta_key(consecutive.id), mapping={
+        "file": consecutive.file,
+        "total": len(numbers),
+        "pending": len(pending),
+        "ingested_at": timezone.now().isoformat(),
+    })
+    pipe.expire(key, WORKLIST_TTL)
+    pipe.expire(_meta_key(consecutive.id), WORKLIST_TTL)
+    pipe.execute()
+
+    logger.info(
+        f"[worklist] 📥 Ingestado {consecutive.file} (ID: {consecutive.id}) | "
+        f"Total: {len(numbers)} | Ya procesados: {len(numbers) - len(pending)} | Pendientes: {len(pending)}"
+    )
+    return len(pending)
+
+
+def pop_batch(consecutive_id, batch_size):
+    """
+    Extrae atómicamente hasta batch_size números de la cabeza de la lista.
+
+    Returns:
+        tuple: (lista de números, cantidad que queda pendiente)
+    """
+    key = _key(consecutive_id)
+    pipe = _redis().pipeline(transaction=True)
+    pipe.lrange(key, 0, batch_size - 1)
+    pipe.ltrim(key, batch_size, -1)
+    pipe.llen(key)
+    batch, _, left = pipe.execute()
+    return [n.decode() if isinstance(n, bytes) else n for n in batch], left
+
+
+def push_back(consecutive_id, numbers):
+    """
+    Devuelve números a la cabeza de la lista (p. ej. si el lote falló).
+
+    Si la lista ya había caducado o se vació, LPUSH la recrea sin TTL; se
+    renueva en la misma transacción para no dejarla huérfana en Redis.
+    """
+    if numbers:
+        key = _key(consecutive_id)
+        pipe = _redis().pipeline(transaction=True)
+        pipe.lpush(key, *reversed(numbers))
+        pipe.expire(key, WORKLIST_TTL)
+        pipe.execute()
+
+
+def delete(consecutive_id):
+    """Elimina la lista y su metadata (archivo borrado o completado)."""
+    _redis().delete(_key(consecutive_id), _meta_key(consecutive_id))
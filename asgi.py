@@ -9,3 +9,8 @@ application = get_asgi_application()
 
 if settings.DEBUG:
     application = ASGIStaticFilesHandler(application)
+
+# /progress/stream/ (SSE) se atiende fuera de Django: ver app/progress_stream.py
+from app.progress_stream import route  # noqa: E402
+
+application = route(application)
@@ -165,13 +165,7 @@ class AutoRecuperacion:
             
             # Resetear circuit breaker
             logger.info("🔧 Reseteando circuit breaker...")
-            for proxy_id in phone._proxy_health.keys():
-                phone._proxy_health[proxy_id] = {
-                    "ssl_errors": 0,
-                    "connection_errors": 0,
-                    "last_error_time": None,
-                    "disabled_until": None
-                }
+            phone.reset_proxy_health()
             
             # Obtener acceso
             logger.info("🔑 Obteniendo acceso...")
@@ -0,0 +1,357 @@
+"""
+Benchmark de punta a punta del procesamiento de archivos.
+
+Recorre el mismo camino que producción:
+    POST /process/ → active_process → process_file_in_batches
+      → scrape_and_save_phone_task / scrape_batch_async_task → Movil → Consecutive.progres
+
+contra Postgres, Redis, Celery y el servidor web locales, con
+loadtest/fake_digi.py y loadtest/socks5_proxy.py como upstream.
+
+Mide:
+- números/segundo (de POST a Consecutive completo)
+- latencia hasta el resultado por número (percentiles), total y por origen (cache/database/scraping)
+- hitos: respuesta del POST, ingesta de la lista de trabajo, primera y última fila
+- consultas SQL y transacciones por número (pg_stat_statements si está, si no pg_stat_database)
+- comandos Redis por número (INFO commandstats, incluye broker y caché)
+- llamadas al upstream por número (login / lookups)
+
+Los resultados se guardan como JSON en loadtest/results/ para comparar entre versiones.
+
+Uso:
+    # Requisitos: web (8800), workers Celery y beat corriendo con
+    #   DIGI_HOME_URL / DIGI_STORE_BACKEND_URL → fake_digi y UPLOAD_DIR compartido
+    python loadtest/benchmark.py --numbers 10000 --cache-hit-ratio 0.5 --format xlsx
+    python loadtest/benchmark.py --numbers 100000 --db-hit-ratio 0.2 --baseline loadtest/results/anterior.json
+
+Archivo: loadtest/benchmark.py
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apimovil.settings')
+
+import django  # noqa: E402
+django.setup()
+
+import requests  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from django_redis import get_redis_connection  # noqa: E402
+
+from app import phone_cache, progress, worklist  # noqa: E402
+from app.models import Consecutive, Movil, Proxy  # noqa: E402
+
+OPERATORS = ["Telefonica Moviles Espana, S.A.U.", "Vodafone Espana, S.A.U.", "Orange Espagne, S.A.U."]
+
+# Métricas comparadas con --baseline (True = mayor es mejor)
+KEY_METRICS = {
+    "numbers_per_sec": True,
+    "latency.all.p50": False,
+    "latency.all.p95": False,
+    "latency.all.p99": False,
+    "db.statements_per_number": False,
+    "db.transactions_per_number": False,
+    "redis.commands_per_number": False,
+    "upstream.lookups_per_number": False,
+}
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))], 4)
+
+    return {
+        "count": len(values),
+        "p50": pick(50),
+        "p90": pick(90),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": round(values[-1], 4),
+    }
+
+
+def generate_numbers(count, seed):
+    rng = random.Random(seed)
+    numbers = set()
+    while len(numbers) < count:
+        numbers.add(f"{rng.choice('67')}{rng.randrange(10 ** 8):08d}")
+    return sorted(numbers, key=lambda _: rng.random())
+
+
+def write_upload(numbers, file_name):
+    import pandas as pd
+
+    path = os.path.join(worklist.UPLOAD_DIR, file_name)
+    os.makedirs(worklist.UPLOAD_DIR, exist_ok=True)
+    df = pd.DataFrame({"numero": numbers})
+    if file_name.endswith(".xlsx"):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def ensure_user_and_proxies(username, host, port, count):
+    user, _ = User.objects.get_or_create(username=username)
+    Proxy.objects.filter(user=user).delete()
+    Proxy.objects.bulk_create([
+        Proxy(ip=host, port_min=str(port + i), port_max=str(port + i),
+              username="bench", password="bench", user=user)
+        for i in range(count)
+    ])
+    return user
+
+
+def seed_hits(user, numbers, cache_ratio, db_ratio, seed):
+    """Precarga una fracción de los números en caché y otra en la BD (archivo semilla)."""
+    rng = random.Random(seed)
+    shuffled = list(numbers)
+    rng.shuffle(shuffled)
+    n_cache = int(len(shuffled) * cache_ratio)
+    n_db = int(len(shuffled) * db_ratio)
+    cached = shuffled[:n_cache]
+    in_db = shuffled[n_cache:n_cache + n_db]
+
+    for i in range(0, len(cached), 5000):
+        phone_cache.store_many({n: rng.choice(OPERATORS) for n in cached[i:i + 5000]})
+    Movil.objects.bulk_create([
+        Movil(file=f"bench_seed_{seed}.csv", number=n, operator=rng.choice(OPERATORS),
+              user=user, ip="seed", fecha_hora=timezone.now() - timedelta(days=1))
+        for n in in_db
+    ], batch_size=5000, ignore_conflicts=True)
+    return len(cached), len(in_db)
+
+
+def redis_commandstats(r):
+    stats = r.info("commandstats")
+    return {name.replace("cmdstat_", ""): value["calls"] for name, value in stats.items()}
+
+
+def db_counters():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT xact_commit + xact_rollback, tup_inserted, tup_updated "
+            "FROM pg_stat_database WHERE datname = current_database()"
+        )
+        transactions, inserted, updated = cursor.fetchone()
+        statements = None
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+        if cursor.fetchone():
+            cursor.execute("SELECT sum(calls) FROM pg_stat_statements")
+            statements = int(cursor.fetchone()[0] or 0)
+    return {"transactions": transactions, "inserted": inserted, "updated": updated, "statements": statements}
+
+
+def upstream_stats(url):
+    try:
+        return requests.get(f"{url}/_stats", timeout=5).json()
+    except Exception:
+        return {}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def compare(result, baseline_path):
+    with open(baseline_path) as f:
+        baseline = flatten(json.load(f)["metrics"])
+    current = flatten(result["metrics"])
+    print(f"\n📊 Comparación con {baseline_path}:")
+    for metric, higher_is_better in KEY_METRICS.items():
+        old, new = baseline.get(metric), current.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        print(f"   {'✅' if better else '⚠️ '} {metric}: {old} → {new} ({change:+.1f}%)")
+
+
+def run(args):
+    r = get_redis_connection("default")
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    file_name = f"bench_{run_id}_{args.numbers}.{args.format}"
+    numbers = generate_numbers(args.numbers, args.seed)
+
+    user = ensure_user_and_proxies(args.user, args.proxy_host, args.proxy_port, args.proxies)
+    seeded_cache, seeded_db = seed_hits(user, numbers, args.cache_hit_ratio, args.db_hit_ratio, args.seed)
+    write_upload(numbers, file_name)
+    print(f"🧪 {file_name}: {len(numbers):,} números | caché: {seeded_cache:,} | BD: {seeded_db:,}")
+
+    requests.post(f"{args.upstream}/_reset", timeout=5)
+    redis_before = redis_commandstats(r)
+    db_before = db_counters()
+
+    started = time.time()
+    response = requests.post(args.api, json={
+        "user": args.user,
+        "file": file_name,
+        "number": numbers,
+        "reprocess": False,
+    }, timeout=300)
+    posted = time.time()
+    response.raise_for_status()
+
+    consecutive = None
+    timeline = []
+    ingested_at = None
+    while time.time() - started < args.timeout:
+        time.sleep(args.poll)
+        consecutive = consecutive or Consecutive.objects.filter(user=user, file=file_name).order_by('-id').first()
+        if consecutive is None:
+            continue
+        consecutive.refresh_from_db()
+        done = consecutive.progres + progress.pending(consecutive.id)
+        timeline.append((round(time.time() - started, 2), done))
+        if ingested_at is None and worklist.exists(consecutive.id):
+            ingested_at = time.time()
+        if not consecutive.active and consecutive.progres >= consecutive.total:
+            break
+    finished = time.time()
+    time.sleep(1)  # pg_stat_database se actualiza con retraso
+
+    redis_after = redis_commandstats(r)
+    db_after = db_counters()
+    upstream = upstream_stats(args.upstream)
+
+    rows = list(Movil.objects.filter(user=user, file=file_name).values_list('ip', 'fecha_hora'))
+    t0 = datetime.fromtimestamp(started, tz=dt_timezone.utc)
+    latencies = {}
+    for source, fecha_hora in rows:
+        latencies.setdefault(source or "unknown", []).append((fecha_hora - t0).total_seconds())
+    all_latencies = [v for values in latencies.values() for v in values]
+
+    processed = consecutive.progres if consecutive else 0
+    elapsed = finished - started
+    n = max(len(numbers), 1)
+    redis_delta = {cmd: redis_after.get(cmd, 0) - redis_before.get(cmd, 0) for cmd in redis_after}
+    redis_total = sum(redis_delta.values())
+    statements = (
+        db_after["statements"] - db_before["statements"]
+        if db_after["statements"] is not None and db_before["statements"] is not None else None
+    )
+
+    result = {
+        "run_id": run_id,
+        "git": git_revision(),
+        "args": vars(args),
+        "settings": {
+            "SCRAPE_ENGINE": getattr(settings, "SCRAPE_ENGINE", None),
+            "PHONE_CACHE_LAYOUT": getattr(settings, "PHONE_CACHE_LAYOUT", None),
+            "PHONE_CACHE_L1_SIZE": getattr(settings, "PHONE_CACHE_L1_SIZE", None),
+        },
+        "metrics": {
+            "numbers": len(numbers),
+            "processed": processed,
+            "rows": len(rows),
+            "completed": bool(consecutive and not consecutive.active),
+            "elapsed_sec": round(elapsed, 3),
+            "numbers_per_sec": round(processed / elapsed, 2) if elapsed else 0,
+            "stages": {
+                "post_sec": round(posted - started, 3),
+                "ingest_sec": round(ingested_at - started, 3) if ingested_at else None,
+                "first_row_sec": round(min(all_latencies), 3) if all_latencies else None,
+                "last_row_sec": round(max(all_latencies), 3) if all_latencies else None,
+            },
+            "latency": {
+                "all": percentiles(all_latencies),
+                **{source: percentiles(values) for source, values in latencies.items()},
+            },
+            "db": {
+                "statements": statements,
+                "statements_per_number": round(statements / n, 3) if statements is not None else None,
+                "transactions": db_after["transactions"] - db_before["transactions"],
+                "transactions_per_number": round((db_after["transactions"] - db_before["transactions"]) / n, 3),
+                "rows_inserted": db_after["inserted"] - db_before["inserted"],
+                "rows_updated": db_after["updated"] - db_before["updated"],
+            },
+            "redis": {
+                "commands": redis_total,
+                "commands_per_number": round(redis_total / n, 3),
+                "top_commands": dict(sorted(redis_delta.items(), key=lambda kv: -kv[1])[:10]),
+            },
+            "upstream": {
+                "lookups": upstream.get("lookups", 0),
+                "logins": upstream.get("login", 0),
+                "lookups_per_number": round(upstream.get("lookups", 0) / n, 3),
+            },
+        },
+        "timeline": timeline,
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output = os.path.join(args.output_dir, f"{run_id}_{args.numbers}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2, default=str)
+
+    m = result["metrics"]
+    print(f"✅ {m['processed']:,}/{m['numbers']:,} en {m['elapsed_sec']}s → {m['numbers_per_sec']} números/s")
+    print(f"   Latencia p50/p95/p99: {m['latency']['all'].get('p50')}/{m['latency']['all'].get('p95')}/{m['latency']['all'].get('p99')} s")
+    print(f"   SQL/número: {m['db']['statements_per_number']} | Tx/número: {m['db']['transactions_per_number']} | "
+          f"Redis/número: {m['redis']['commands_per_number']} | Upstream/número: {m['upstream']['lookups_per_number']}")
+    print(f"   Resultado: {output}")
+
+    if args.baseline:
+        compare(result, args.baseline)
+
+    if not args.keep and consecutive:
+        worklist.delete(consecutive.id)
+        progress.discard(consecutive.id)
+        Movil.objects.filter(user=user, file=file_name).delete()
+        consecutive.delete()
+        os.remove(os.path.join(worklist.UPLOAD_DIR, file_name))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de punta a punta del procesamiento de archivos")
+    parser.add_argument("--numbers", type=int, default=10000)
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="csv")
+    parser.add_argument("--cache-hit-ratio", type=float, default=0.0, help="Fracción precargada en caché Redis")
+    parser.add_argument("--db-hit-ratio", type=float, default=0.0, help="Fracción precargada en la BD (30 días)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--user", default="bench_user")
+    parser.add_argument("--api", default="http://127.0.0.1:8800/process/")
+    parser.add_argument("--upstream", default="http://127.0.0.1:8900", help="URL de loadtest/fake_digi.py")
+    parser.add_argument("--proxy-host", default="127.0.0.1")
+    parser.add_argument("--proxy-port", type=int, default=1080, help="Primer puerto de loadtest/socks5_proxy.py")
+    parser.add_argument("--proxies", type=int, default=20, help="Líneas de proxy del usuario de prueba")
+    parser.add_argument("--timeout", type=int, default=3600)
+    parser.add_argument("--poll", type=float, default=1.0)
+    parser.add_argument("--output-dir", default=os.path.join(ROOT, "loadtest", "results"))
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--keep", action="store_true", help="No borrar el archivo ni las filas al terminar")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Costo de conexión a Postgres por tarea según DB_POOL_MODE.
+
+Ejecuta la misma tarea (process_save_task, un INSERT) N veces de dos formas:
+- "direct":  conexión nueva en cada tarea (CONN_MAX_AGE=0, como antes)
+- "pooled":  la conexión se reutiliza (CONN_MAX_AGE=DB_CONN_MAX_AGE); con
+             DB_POOL_MODE=pgbouncer la conexión es a PgBouncer
+
+y reporta latencia por tarea (p50/p95), conexiones abiertas y el tiempo de
+conexión (TCP + autenticación) medido aparte.
+
+Uso:
+    python loadtest/db_connections.py --iterations 500
+    DB_POOL_MODE=pgbouncer python loadtest/db_connections.py --iterations 500
+
+Archivo: loadtest/db_connections.py
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apimovil.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import close_old_connections, connection  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+
+from app.models import Movil  # noqa: E402
+from app.tasks import process_save_task  # noqa: E402
+
+FILE_NAME = "bench_db_connections.csv"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def measure_connect(iterations):
+    """Tiempo de abrir una conexión y hacer SELECT 1, sin tarea alrededor."""
+    timings = []
+    for _ in range(iterations):
+        connection.close()
+        start = perf_counter()
+        connection.ensure_connection()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        timings.append(perf_counter() - start)
+    connection.close()
+    return timings
+
+
+def run_tasks(label, conn_max_age, user, iterations, offset):
+    connection.close()
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    opened = []
+
+    def on_connect(sender, connection, **kwargs):
+        opened.append(connection.alias)
+
+    connection_created.connect(on_connect)
+    timings = []
+    try:
+        for i in range(iterations):
+            start = perf_counter()
+            # Lo que hace la fixup de Celery antes y después de cada tarea
+            close_old_connections()
+            process_save_task(f"69{offset + i:07d}", "Bench", user.id, FILE_NAME, "cache")
+            close_old_connections()
+            timings.append(perf_counter() - start)
+    finally:
+        connection_created.disconnect(on_connect)
+
+    return {
+        "mode": label,
+        "conn_max_age": conn_max_age,
+        "tasks": iterations,
+        "connections": len(opened),
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo de conexión a Postgres por tarea")
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--user", default="bench_user")
+    args = parser.parse_args()
+
+    db = settings.DATABASES['default']
+    print(f"🔌 DB_POOL_MODE={settings.DB_POOL_MODE} → {db['HOST']}:{db['PORT']}/{db['NAME']}")
+
+    user, _ = User.objects.get_or_create(username=args.user)
+    Movil.objects.filter(user=user, file=FILE_NAME).delete()
+
+    connect = measure_connect(min(args.iterations, 100))
+    print(f"   Conexión nueva (TCP + auth + SELECT 1): p50 {percentile(connect, 50) * 1000:.3f} ms | "
+          f"p95 {percentile(connect, 95) * 1000:.3f} ms")
+
+    results = [
+        run_tasks("direct", 0, user, args.iterations, 0),
+        run_tasks("pooled", settings.DB_CONN_MAX_AGE, user, args.iterations, args.iterations),
+    ]
+    for r in results:
+        print(f"   {r['mode']:>7}: {r['tasks']} tareas, {r['connections']} conexiones | "
+              f"p50 {r['p50_ms']} ms | p95 {r['p95_ms']} ms | media {r['mean_ms']} ms")
+
+    saved = results[0]["mean_ms"] - results[1]["mean_ms"]
+    print(f"✅ Ahorro por tarea reutilizando la conexión: {saved:.3f} ms "
+          f"({saved / results[0]['mean_ms'] * 100:.1f}%)")
+
+    Movil.objects.filter(user=user, file=FILE_NAME).delete()
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
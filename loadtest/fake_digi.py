@@ -0,0 +1,200 @@
+"""
+Servidor falso de DIGI (www + store-backend) para pruebas de carga sin internet.
+
+Implementa lo que usan DigiPhone (app/browser.py) y AsyncDigiPhone
+(app/async_browser.py):
+
+- GET  /                                   → HTML + cookie de sesión previa
+- POST /v2/login/online                    → cookie store_access_token (con expiración)
+- GET  /v2/operators/by-line-code/<numero> → {"name": operador} | 404 | 401 | 498 | 5xx
+
+con latencia y tasas de error configurables, y cortes de conexión.
+
+Uso:
+    python loadtest/fake_digi.py --port 8900 --latency-ms 80 --jitter-ms 40 \\
+        --rate-401 0.01 --rate-498 0.01 --rate-5xx 0.02 --rate-reset 0.005
+
+    # Apuntar la aplicación al servidor falso
+    export DIGI_HOME_URL=http://127.0.0.1:8900/
+    export DIGI_STORE_BACKEND_URL=http://127.0.0.1:8900
+
+    # Contadores para benchmarks
+    curl http://127.0.0.1:8900/_stats
+    curl -X POST http://127.0.0.1:8900/_reset
+
+Archivo: loadtest/fake_digi.py
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import secrets
+import time
+from collections import Counter
+
+from aiohttp import web
+
+OPERATORS = [
+    "Telefonica Moviles Espana, S.A.U.",
+    "Vodafone Espana, S.A.U.",
+    "Orange Espagne, S.A.U.",
+    "Xfera Moviles, S.A.U.",
+    "DIGI SPAIN TELECOM, S.L.",
+]
+
+
+class FakeDigi:
+    """Estado y comportamiento del servidor falso"""
+
+    def __init__(self, latency_ms=50, jitter_ms=20, token_ttl=900, rate_401=0.0, rate_498=0.0,
+                 rate_404=0.05, rate_5xx=0.0, rate_reset=0.0, seed=None):
+        """
+        Args:
+            latency_ms: Latencia media de cada respuesta
+            jitter_ms: Variación uniforme ± sobre la latencia
+            token_ttl: Vida de store_access_token (segundos); vencido → 498
+            rate_401 / rate_498 / rate_404 / rate_5xx: Probabilidad de cada respuesta
+                en /v2/operators/by-line-code (404 = "Operator not found", es decir DIGI)
+            rate_reset: Probabilidad de cortar la conexión sin responder
+            seed: Semilla para que una corrida sea repetible
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ttl = token_ttl
+        self.rate_401 = rate_401
+        self.rate_498 = rate_498
+        self.rate_404 = rate_404
+        self.rate_5xx = rate_5xx
+        self.rate_reset = rate_reset
+        self.random = random.Random(seed)
+        # {token: expira_en}
+        self.tokens = {}
+        self.stats = Counter()
+        self.started_at = time.time()
+
+    async def _delay(self):
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    @staticmethod
+    def operator_for(number):
+        """Operador determinista por número (las corridas son comparables)"""
+        digest = hashlib.md5(number.encode()).digest()
+        return OPERATORS[digest[0] % (len(OPERATORS) - 1)]
+
+    def _reset_connection(self, request):
+        self.stats["resets"] += 1
+        if request.transport is not None:
+            request.transport.close()
+        raise ConnectionResetError("fake reset")
+
+    async def home(self, request):
+        self.stats["home"] += 1
+        await self._delay()
+        response = web.Response(text="<html><body>DIGI (fake)</body></html>", content_type="text/html")
+        response.set_cookie("digi_session", secrets.token_hex(8), path="/")
+        return response
+
+    async def login(self, request):
+        self.stats["login"] += 1
+        await self._delay()
+        if self.random.random() < self.rate_reset:
+            self._reset_connection(request)
+        token = secrets.token_urlsafe(32)
+        self.tokens[token] = time.time() + self.token_ttl
+        response = web.json_response({"status": "ok"})
+        response.set_cookie("store_access_token", token, max_age=self.token_ttl, path="/")
+        return response
+
+    async def operator(self, request):
+        self.stats["lookups"] += 1
+        number = request.match_info["number"]
+        await self._delay()
+
+        roll = self.random.random()
+        if roll < self.rate_reset:
+            self._reset_connection(request)
+
+        token = request.cookies.get("store_access_token")
+        expires = self.tokens.get(token)
+        if expires is None:
+            self.stats["401"] += 1
+            return web.json_response({"message": "Unauthorized"}, status=401)
+        if expires < time.time():
+            self.stats["498"] += 1
+            return web.json_response({"message": "Token expired"}, status=498)
+
+        # Errores inyectados (en orden acumulado sobre una sola tirada)
+        roll = self.random.random()
+        for status, rate in ((401, self.rate_401), (498, self.rate_498), (500, self.rate_5xx)):
+            if roll < rate:
+                self.stats[str(status)] += 1
+                if status in (401, 498):
+                    self.tokens.pop(token, None)
+                return web.json_response({"message": "Injected error"}, status=status)
+            roll -= rate
+
+        if roll < self.rate_404:
+            self.stats["404"] += 1
+            return web.json_response({"message": "Operator not found"}, status=404)
+
+        self.stats["200"] += 1
+        return web.json_response({"name": self.operator_for(number), "lineCode": number})
+
+    async def get_stats(self, request):
+        elapsed = time.time() - self.started_at
+        return web.json_response({
+            **self.stats,
+            "elapsed": round(elapsed, 3),
+            "lookups_per_sec": round(self.stats["lookups"] / elapsed, 2) if elapsed else 0,
+            "active_tokens": len(self.tokens),
+        })
+
+    async def reset_stats(self, request):
+        self.stats.clear()
+        self.started_at = time.time()
+        return web.json_response({"status": "ok"})
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/", self.home)
+        app.router.add_post("/v2/login/online", self.login)
+        app.router.add_get("/v2/operators/by-line-code/{number}", self.operator)
+        app.router.add_get("/_stats", self.get_stats)
+        app.router.add_post("/_reset", self.reset_stats)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor falso de DIGI para pruebas de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--token-ttl", type=int, default=900)
+    parser.add_argument("--rate-401", type=float, default=0.0)
+    parser.add_argument("--rate-498", type=float, default=0.0)
+    parser.add_argument("--rate-404", type=float, default=0.05)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-reset", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    fake = FakeDigi(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_ttl=args.token_ttl,
+        rate_401=args.rate_401,
+        rate_498=args.rate_498,
+        rate_404=args.rate_404,
+        rate_5xx=args.rate_5xx,
+        rate_reset=args.rate_reset,
+        seed=args.seed,
+    )
+    print(f"🧪 DIGI falso escuchando en http://{args.host}:{args.port}")
+    web.run_app(fake.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
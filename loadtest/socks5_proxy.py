@@ -0,0 +1,180 @@
+"""
+Proxy SOCKS5 local (RFC 1928 / RFC 1929) que reemplaza a los proxies reales
+en pruebas de carga.
+
+Acepta usuario/contraseña (cualquiera, o los indicados con --username/--password),
+soporta CONNECT con IPv4, IPv6 y dominio (socks5h://, el proxy resuelve DNS) y
+puede escuchar en varios puertos seguidos para simular muchas líneas de proxy.
+
+Uso:
+    # 20 "líneas" en 127.0.0.1:1080..1099, 2% de fallos de conexión
+    python loadtest/socks5_proxy.py --port 1080 --count 20 --latency-ms 10 --rate-fail 0.02
+
+    # Filas Proxy que apuntan a las líneas locales (ip=127.0.0.1, port_min=1080..1099)
+    # y la app con DIGI_STORE_BACKEND_URL/DIGI_HOME_URL hacia loadtest/fake_digi.py
+
+Archivo: loadtest/socks5_proxy.py
+"""
+import argparse
+import asyncio
+import ipaddress
+import random
+import struct
+
+SOCKS_VERSION = 5
+
+REPLY_SUCCEEDED = 0x00
+REPLY_GENERAL_FAILURE = 0x01
+REPLY_CONNECTION_REFUSED = 0x05
+REPLY_COMMAND_NOT_SUPPORTED = 0x07
+
+
+class Socks5Proxy:
+    """Servidor SOCKS5 mínimo con latencia y fallos inyectables"""
+
+    def __init__(self, username=None, password=None, latency_ms=0, rate_fail=0.0, rate_reset=0.0):
+        """
+        Args:
+            username / password: Credenciales exigidas (None = acepta cualquiera)
+            latency_ms: Retardo añadido al establecer cada conexión
+            rate_fail: Probabilidad de responder "connection refused" al CONNECT
+            rate_reset: Probabilidad de cortar la conexión tras el handshake
+        """
+        self.username = username
+        self.password = password
+        self.latency_ms = latency_ms
+        self.rate_fail = rate_fail
+        self.rate_reset = rate_reset
+        self.connections = 0
+
+    @staticmethod
+    def _reply(writer, code):
+        writer.write(struct.pack("!BBBB", SOCKS_VERSION, code, 0, 1) + b"\x00\x00\x00\x00\x00\x00")
+
+    async def _authenticate(self, reader, writer):
+        version, nmethods = await reader.readexactly(2)
+        methods = await reader.readexactly(nmethods)
+        if version != SOCKS_VERSION:
+            return False
+
+        if 0x02 in methods:
+            writer.write(bytes([SOCKS_VERSION, 0x02]))
+            await writer.drain()
+            # RFC 1929: VER | ULEN | UNAME | PLEN | PASSWD
+            await reader.readexactly(1)
+            username = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+            password = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+            ok = self.username is None or (username == self.username and password == self.password)
+            writer.write(bytes([0x01, 0x00 if ok else 0x01]))
+            await writer.drain()
+            return ok
+
+        if 0x00 in methods and self.username is None:
+            writer.write(bytes([SOCKS_VERSION, 0x00]))
+            await writer.drain()
+            return True
+
+        writer.write(bytes([SOCKS_VERSION, 0xFF]))
+        await writer.drain()
+        return False
+
+    @staticmethod
+    async def _read_target(reader):
+        version, command, _, address_type = await reader.readexactly(4)
+        if address_type == 0x01:
+            host = str(ipaddress.IPv4Address(await reader.readexactly(4)))
+        elif address_type == 0x03:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+        elif address_type == 0x04:
+            host = str(ipaddress.IPv6Address(await reader.readexactly(16)))
+        else:
+            raise ValueError(f"ATYP no soportado: {address_type}")
+        port = struct.unpack("!H", await reader.readexactly(2))[0]
+        return command, host, port
+
+    @staticmethod
+    async def _pipe(reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if not await self._authenticate(reader, writer):
+                return
+            command, host, port = await self._read_target(reader)
+            if command != 0x01:
+                self._reply(writer, REPLY_COMMAND_NOT_SUPPORTED)
+                return
+
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000)
+            if random.random() < self.rate_fail:
+                self._reply(writer, REPLY_CONNECTION_REFUSED)
+                return
+
+            try:
+                remote_reader, remote_writer = await asyncio.open_connection(host, port)
+            except OSError:
+                self._reply(writer, REPLY_GENERAL_FAILURE)
+                return
+
+            self._reply(writer, REPLY_SUCCEEDED)
+            await writer.drain()
+
+            if random.random() < self.rate_reset:
+                remote_writer.close()
+                return
+
+            await asyncio.gather(
+                self._pipe(reader, remote_writer),
+                self._pipe(remote_reader, writer),
+            )
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(proxy, host, port, count):
+    servers = [await asyncio.start_server(proxy.handle, host, port + i) for i in range(count)]
+    print(f"🧦 SOCKS5 local escuchando en {host}:{port}..{port + count - 1}")
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy SOCKS5 local para pruebas de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1080)
+    parser.add_argument("--count", type=int, default=1, help="Puertos consecutivos (líneas de proxy)")
+    parser.add_argument("--username", default=None)
+    parser.add_argument("--password", default=None)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-fail", type=float, default=0.0)
+    parser.add_argument("--rate-reset", type=float, default=0.0)
+    args = parser.parse_args()
+
+    proxy = Socks5Proxy(
+        username=args.username,
+        password=args.password,
+        latency_ms=args.latency_ms,
+        rate_fail=args.rate_fail,
+        rate_reset=args.rate_reset,
+    )
+    try:
+        asyncio.run(serve(proxy, args.host, args.port, args.count))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
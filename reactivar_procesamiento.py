@@ -113,13 +113,7 @@ def reiniciar_worker_manualmente(consecutive_id):
         
         # Resetear manualmente los health checks de proxies
         print("🔧 Reseteando circuit breaker de proxies...")
-        for proxy_id in phone._proxy_health.keys():
-            phone._proxy_health[proxy_id] = {
-                "ssl_errors": 0,
-                "connection_errors": 0,
-                "last_error_time": None,
-                "disabled_until": None
-            }
+        phone.reset_proxy_health()
         print("✓ Circuit breaker reseteado")
         
         # Obtener acceso